@@ -0,0 +1,75 @@
+"""
+Speed and accuracy of the cal mode gain solver (StefCal).
+
+Simulates visibilities of a point source sky model through random antenna
+gains with added noise, then times solve_gains() on one averaged frame and
+on a batch of frames solved together, and reports the iterations and the
+error of the recovered gains.
+
+    cd tart_api && python ../benchmarks/cal_solver.py [--antennas 24] [--noise 0.05]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_cal_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from services.cal_solver import (  # noqa: E402
+    point_source_model,
+    solve_gains,
+    source_directions,
+)
+from services.geometry import baseline_uvw, positions_key  # noqa: E402
+from services.synthesis import SPEED_OF_LIGHT  # noqa: E402
+
+FREQUENCY = 1575.42e6
+SOURCES = [{"el": 60, "az": 30, "flux": 1.0}, {"el": 35, "az": 210, "flux": 0.5}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--antennas", type=int, default=24)
+    parser.add_argument("--noise", type=float, default=0.05, help="noise rms relative to flux")
+    parser.add_argument("--batch", type=int, default=64, help="frames solved together")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    num_ant = args.antennas
+    positions = np.c_[rng.uniform(-1.5, 1.5, (num_ant, 2)), np.zeros(num_ant)]
+    uvw = baseline_uvw(positions_key(positions), SPEED_OF_LIGHT / FREQUENCY)
+    model = point_source_model(uvw, source_directions(SOURCES), [s["flux"] for s in SOURCES])
+    gains = rng.uniform(0.5, 2.0, num_ant) * np.exp(1j * rng.uniform(-np.pi, np.pi, num_ant))
+    weights = 1.0 - np.eye(num_ant)
+
+    def observe(n):
+        noise = rng.normal(size=(n, num_ant, num_ant)) + 1j * rng.normal(size=(n, num_ant, num_ant))
+        noise = args.noise * (noise + np.conj(np.swapaxes(noise, -1, -2))) / 2
+        return gains[:, np.newaxis] * model * np.conj(gains) + noise
+
+    reference = gains * np.abs(gains[0]) / gains[0]
+    print(f"{num_ant} antennas, {len(SOURCES)} sources, noise {args.noise}")
+    print(f"{'case':18s} {'iterations':>10s} {'ms':>8s} {'ms/frame':>9s} {'gain error':>11s}")
+    for name, data in (("averaged frame", observe(1)[0]), ("batch", observe(args.batch))):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            solved, iterations, converged, residual = solve_gains(data, model, weights)
+            times.append(time.perf_counter() - t0)
+        ms = np.median(times) * 1e3
+        frames = 1 if data.ndim == 2 else len(data)
+        error = np.max(np.abs(solved - reference) / np.abs(reference))
+        print(f"{name:18s} {iterations:10d} {ms:8.2f} {ms / frames:9.3f} {error:11.4f}")
+
+
+if __name__ == "__main__":
+    main()
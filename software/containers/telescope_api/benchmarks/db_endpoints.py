@@ -0,0 +1,135 @@
+"""
+Load benchmark for the database backed endpoints of the TART API.
+
+Runs a number of concurrent clients against a running API, each issuing a
+mix of reads (channels, gains, file catalogs, status) while one client
+keeps writing (channel toggles and calibration inserts), and reports the
+throughput and latency percentiles per endpoint.
+
+    python benchmarks/db_endpoints.py --clients 32 --seconds 20
+
+The API to test is taken from API_BASE_URL (default http://localhost:8000),
+and the login password from LOGIN_PW.
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+READS = [
+    "/channel",
+    "/calibration/gain",
+    "/raw/data",
+    "/vis/data",
+    "/status/channel",
+    "/status/channel/0",
+]
+
+
+def authenticate(base_url, password):
+    response = requests.post(f"{base_url}/auth", json={"username": "admin", "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def reader(base_url, deadline, results, lock):
+    session = requests.Session()
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    while time.monotonic() < deadline:
+        path = random.choice(READS)
+        t0 = time.perf_counter()
+        response = session.get(f"{base_url}{path}")
+        timings[path].append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            errors[path] += 1
+    with lock:
+        for path, t in timings.items():
+            results["timings"][path].extend(t)
+        for path, n in errors.items():
+            results["errors"][path] += n
+
+
+def writer(base_url, headers, deadline, results, lock, num_ant=24):
+    session = requests.Session()
+    session.headers.update(headers)
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    channels = session.get(f"{base_url}/channel").json()
+    while time.monotonic() < deadline:
+        if random.random() < 0.5:
+            path = "PUT /channel"
+            ch = random.choice(channels)
+            t0 = time.perf_counter()
+            # Toggle twice so the benchmark leaves the channels as it found them
+            for enable in (1 - int(ch["enabled"]), int(ch["enabled"])):
+                response = session.put(f"{base_url}/channel/{ch['channel_id']}/{enable}")
+        else:
+            path = "POST /calibration/gain"
+            gains = session.get(f"{base_url}/calibration/gain").json()
+            t0 = time.perf_counter()
+            response = session.post(
+                f"{base_url}/calibration/gain",
+                json={"gain": gains["gain"], "phase_offset": gains["phase_offset"]},
+            )
+        timings[path].append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            errors[path] += 1
+        time.sleep(0.05)
+    with lock:
+        for path, t in timings.items():
+            results["timings"][path].extend(t)
+        for path, n in errors.items():
+            results["errors"][path] += n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=16, help="concurrent reading clients")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of the run")
+    parser.add_argument("--no-writes", action="store_true", help="skip the writing client")
+    args = parser.parse_args()
+
+    base_url = os.getenv("API_BASE_URL", "http://localhost:8000")
+    results = {"timings": defaultdict(list), "errors": defaultdict(int)}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+
+    threads = [
+        threading.Thread(target=reader, args=(base_url, deadline, results, lock))
+        for _ in range(args.clients)
+    ]
+    if not args.no_writes:
+        headers = authenticate(base_url, os.getenv("LOGIN_PW", "password"))
+        threads.append(
+            threading.Thread(target=writer, args=(base_url, headers, deadline, results, lock))
+        )
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"{args.clients} clients, {args.seconds:.0f} s")
+    print(
+        f"{'endpoint':28s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'errors':>7s}"
+    )
+    total = 0
+    for path, t in sorted(results["timings"].items()):
+        t = np.array(t) * 1e3
+        total += len(t)
+        p50, p95, p99 = np.percentile(t, [50, 95, 99])
+        print(
+            f"{path:28s} {len(t) / args.seconds:8.1f} {p50:8.2f} {p95:8.2f} {p99:8.2f} "
+            f"{results['errors'][path]:7d}"
+        )
+    print(f"{'total':28s} {total / args.seconds:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
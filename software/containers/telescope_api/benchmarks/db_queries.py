@@ -0,0 +1,167 @@
+"""
+Benchmark of the hot database queries on a year of seeded history.
+
+Creates a scratch database at the schema version before integer timestamps,
+fills it with a year of sample delays, calibrations and file catalog entries
+stored the old way (text timestamps, one calibration row per antenna), times
+the old queries, then times the migrations (ts_ns backfill and indexes,
+packed and compacted calibration sets) and the queries that replace them.
+
+    cd tart_api && python ../benchmarks/db_queries.py [--days 365]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_db_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from database import migrations  # noqa: E402
+from database import operations as db  # noqa: E402
+
+QUERIES = {
+    "latest sample delay": (
+        "SELECT * FROM sample_delay ORDER BY datetime(utc_timestamp) DESC LIMIT 1",
+        "SELECT utc_timestamp, delay FROM sample_delay ORDER BY ts_ns DESC LIMIT 1",
+    ),
+    "latest gain set": (
+        "SELECT utc_timestamp, antenna, g_abs, g_phase from calibration WHERE utc_timestamp = (SELECT MAX(utc_timestamp) FROM calibration) ORDER BY antenna",
+        "SELECT utc_timestamp, gains, phases FROM calibration_sets ORDER BY ts_ns DESC LIMIT 1",
+    ),
+    "gain set at a time": (
+        "SELECT utc_timestamp, antenna, g_abs, g_phase from calibration WHERE utc_timestamp = (SELECT MAX(utc_timestamp) FROM calibration WHERE utc_timestamp <= '{at}') ORDER BY antenna",
+        "SELECT utc_timestamp, gains, phases FROM calibration_sets WHERE ts_ns <= {at_ns} ORDER BY ts_ns DESC LIMIT 1",
+    ),
+    "raw catalog, newest 10": (
+        "SELECT Id, utc_timestamp, filename, checksum FROM raw_data ORDER BY utc_timestamp DESC LIMIT 10",
+        "SELECT Id, utc_timestamp, filename, checksum FROM raw_data ORDER BY ts_ns DESC LIMIT 10",
+    ),
+    "vis catalog, newest 10": (
+        "SELECT Id, utc_timestamp, filename, checksum FROM vis_data ORDER BY utc_timestamp DESC LIMIT 10",
+        "SELECT Id, utc_timestamp, filename, checksum FROM vis_data ORDER BY ts_ns DESC LIMIT 10",
+    ),
+}
+
+
+# The first schema version with integer timestamps
+TS_NS_VERSION = 3
+
+
+def every(start, step, n):
+    return [(start + k * step).isoformat() for k in range(n)]
+
+
+def seed(con, start, days, num_ant):
+    # A diagnostic every 10 minutes, a calibration every hour (half of them
+    # repeating the one before), a raw file every minute and a vis file
+    # every 10 minutes
+    n_diag = days * 24 * 6
+    n_cal = days * 24
+    n_raw = days * 24 * 60
+    n_vis = days * 24 * 6
+    con.execute("BEGIN")
+    con.executemany(
+        "INSERT INTO sample_delay(utc_timestamp, delay) VALUES (?, ?)",
+        [(t, 0.5) for t in every(start, timedelta(minutes=10), n_diag)],
+    )
+    con.executemany(
+        "INSERT INTO calibration(utc_timestamp, antenna, g_abs, g_phase) VALUES (?,?,?,?)",
+        [
+            (t, ant, 1.0 + (k // 2) * 1e-6, 0.0)
+            for k, t in enumerate(every(start, timedelta(hours=1), n_cal))
+            for ant in range(num_ant)
+        ],
+    )
+    con.executemany(
+        "INSERT INTO raw_data(utc_timestamp, filename, checksum) VALUES (?,?,?)",
+        [
+            (t, f"raw_{k}.hdf", "0" * 64)
+            for k, t in enumerate(every(start, timedelta(minutes=1), n_raw))
+        ],
+    )
+    con.executemany(
+        "INSERT INTO vis_data(utc_timestamp, filename, checksum) VALUES (?,?,?)",
+        [
+            (t, f"vis_{k}.hdf", "0" * 64)
+            for k, t in enumerate(every(start, timedelta(minutes=10), n_vis))
+        ],
+    )
+    con.commit()
+    return {
+        "sample_delay": n_diag,
+        "calibration": n_cal * num_ant,
+        "raw_data": n_raw,
+        "vis_data": n_vis,
+    }
+
+
+def result(rows):
+    """What a query answers, for checking that the old and new queries agree."""
+    if len(rows[0]) == 4:
+        return rows[0][2]  # gain of antenna 0, one row per antenna
+    if isinstance(rows[0][1], bytes):
+        return np.frombuffer(rows[0][1], dtype="<f8")[0]  # packed calibration set
+    return rows[0][0]
+
+
+def timeit(con, sql, repeat):
+    con.execute(sql).fetchall()  # warm the page cache
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        rows = con.execute(sql).fetchall()
+    return (time.perf_counter() - t0) / repeat, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, default=365, help="days of history to seed")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per query")
+    args = parser.parse_args()
+
+    con = db.connections().writer()
+    text_schema = [m for m in migrations.MIGRATIONS if m[0] < TS_NS_VERSION]
+    for version, migration in text_schema:
+        migration(con.cursor())
+        con.execute(f"PRAGMA user_version = {version}")
+
+    t0 = time.perf_counter()
+    start = datetime.now(UTC) - timedelta(days=args.days)
+    counts = seed(con, start, args.days, num_ant=24)
+    print(f"Seeded {args.days} days in {time.perf_counter() - t0:.1f} s: {counts}")
+
+    # Look up the calibration half way through the history
+    at = start + timedelta(days=args.days / 2, minutes=30)
+    queries = {
+        name: (old.format(at=at.isoformat()), new.format(at_ns=migrations.to_ns(at)))
+        for name, (old, new) in QUERIES.items()
+    }
+    before = {name: timeit(con, old, args.repeat) for name, (old, new) in queries.items()}
+
+    t0 = time.perf_counter()
+    migrations.migrate(con)
+    print(f"Migrations (backfill, index, calibration sets): {time.perf_counter() - t0:.1f} s\n")
+
+    print(f"{'query':24s} {'before ms':>10s} {'after ms':>10s} {'speedup':>9s}  plan")
+    for name, (_, new) in queries.items():
+        t_old, rows_old = before[name]
+        t_new, rows_new = timeit(con, new, args.repeat)
+        assert result(rows_old) == result(rows_new), name
+        plan = "; ".join(row[3] for row in con.execute(f"EXPLAIN QUERY PLAN {new}"))
+        print(f"{name:24s} {t_old * 1e3:10.3f} {t_new * 1e3:10.3f} {t_old / t_new:8.0f}x  {plan}")
+
+    db.close_connections()
+    shutil.rmtree(DATA_ROOT)
+
+
+if __name__ == "__main__":
+    main()
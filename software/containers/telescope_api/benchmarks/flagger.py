@@ -0,0 +1,62 @@
+"""
+Per-frame cost of the streaming RFI flagger (frame["flags"]).
+
+Feeds simulated frames with occasional interference through a Flagger and
+reports the time per frame, the frame rate it could keep up with, and the
+fraction of the injected outliers that were flagged.
+
+    cd tart_api && python ../benchmarks/flagger.py [--window 32]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_flag_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from services.flagger import Flagger, unpack_flags  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--window", type=int, default=32)
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--antennas", type=int, default=24)
+    parser.add_argument("--threshold", type=float, default=6.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    num_ant = args.antennas
+    baselines = np.array(
+        [(i, j) for i in range(num_ant) for j in range(i + 1, num_ant)], dtype=np.uint8
+    )
+    shape = (args.frames, len(baselines))
+    vis = 1.0 + 0.1 * (rng.normal(size=shape) + 1j * rng.normal(size=shape))
+    # Interference on 0.1 % of the visibilities
+    outliers = rng.random(shape) < 1e-3
+    vis[outliers] *= 5.0
+    frames = [{"baselines": baselines, "vis": v} for v in vis]
+
+    settings = {"enabled": 1, "window": args.window, "min_frames": 16}
+    flagger = Flagger({**settings, "threshold": args.threshold})
+    t0 = time.perf_counter()
+    flags = np.array([unpack_flags(flagger.add(f), len(baselines)) for f in frames])
+    us = (time.perf_counter() - t0) / args.frames * 1e6
+    checked = np.arange(args.frames) >= settings["min_frames"]
+    found = flags[checked][outliers[checked]].mean()
+    false = flags[checked][~outliers[checked]].mean()
+    print(f"{len(baselines)} baselines, window {args.window} frames")
+    print(f"flagging: {us:.0f} us per frame, up to {1e6 / us:.0f} frames/s")
+    print(f"outliers flagged: {found:.1%}, clean visibilities flagged: {false:.3%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Per-frame cost of the multi-cadence integrator (/imaging/vis?integration=).
+
+Feeds simulated one second frames through an Integrator with the given
+cadences and reports the time per frame, which should not depend on the
+length of the averages, and the time to archive an average.
+
+    cd tart_api && python ../benchmarks/integrator.py [--cadences 10,60,600]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_int_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from services.integrator import IntegratedArchive, Integrator  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cadences", default="10,60,600", help="comma separated seconds")
+    parser.add_argument("--frames", type=int, default=3600, help="one second frames")
+    parser.add_argument("--antennas", type=int, default=24)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    num_ant = args.antennas
+    baselines = np.array(
+        [(i, j) for i in range(num_ant) for j in range(i + 1, num_ant)], dtype=np.uint8
+    )
+    vis = rng.normal(size=(64, len(baselines))) + 1j * rng.normal(size=(64, len(baselines)))
+    start = datetime(2025, 1, 1, tzinfo=UTC)
+    frames = [
+        {"timestamp": start + timedelta(seconds=k), "baselines": baselines, "vis": vis[k % 64]}
+        for k in range(args.frames)
+    ]
+
+    cadences = [int(c) for c in args.cadences.split(",")]
+    print(f"{len(baselines)} baselines, {args.frames} frames")
+    print(f"{'cadences':>16s} {'us/frame':>9s} {'averages':>9s}")
+    for n in range(1, len(cadences) + 1):
+        integrator = Integrator({"cadences": cadences[:n], "ring_size": 60})
+        t0 = time.perf_counter()
+        averages = [a for frame in frames for a in integrator.add(frame)]
+        us = (time.perf_counter() - t0) / args.frames * 1e6
+        print(f"{','.join(map(str, cadences[:n])):>16s} {us:9.1f} {len(averages):9d}")
+
+    archive = IntegratedArchive(os.path.join(DATA_ROOT, "integrated"), keep_days=7)
+    t0 = time.perf_counter()
+    for average in averages:
+        archive.append(average)
+    ms = (time.perf_counter() - t0) / len(averages) * 1e3
+    print(f"archiving: {ms:.2f} ms per average")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Per-frame cost of the data quality metrics (/status/quality).
+
+Feeds simulated frames, of a point source with one dead antenna, through a
+QualityMonitor and reports the time per frame and the flags raised.
+
+    cd tart_api && python ../benchmarks/quality.py [--antennas 24]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_quality_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from app.config import create_runtime_config  # noqa: E402
+from services.channel_cache import init_channel_caches  # noqa: E402
+from services.quality import QualityMonitor  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--antennas", type=int, default=24)
+    parser.add_argument("--frames", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    num_ant = args.antennas
+    baselines = np.array(
+        [(i, j) for i in range(num_ant) for j in range(i + 1, num_ant)], dtype=np.uint8
+    )
+    # A point source at the phase centre with noise, and a dead antenna 0
+    noise = rng.normal(size=(64, len(baselines))) + 1j * rng.normal(size=(64, len(baselines)))
+    vis = 1.0 + 0.3 * noise
+    vis[:, baselines[:, 0] == 0] = 0.05 * noise[:, baselines[:, 0] == 0]
+    means = rng.normal(scale=0.01, size=(64, num_ant))
+    start = datetime(2025, 1, 1, tzinfo=UTC)
+    frames = [
+        {"timestamp": start + timedelta(seconds=k), "baselines": baselines, "vis": vis[k % 64]}
+        for k in range(args.frames)
+    ]
+
+    init_channel_caches(
+        num_ant,
+        [{"channel_id": i, "enabled": 1} for i in range(num_ant)],
+        0,
+        [(i, 0, 1.0, 0.0) for i in range(num_ant)],
+        0,
+    )
+    monitor = QualityMonitor(dict(create_runtime_config()["quality"]), num_ant)
+    t0 = time.perf_counter()
+    monitor.reset(baselines)
+    setup_ms = (time.perf_counter() - t0) * 1e3
+    print(f"{len(baselines)} baselines, {len(monitor.ij)} triangles")
+    print(f"index tables: {setup_ms:.1f} ms, once per baseline order")
+
+    t0 = time.perf_counter()
+    flags = sum(len(monitor.add(f, means[k % 64])["flags"]) for k, f in enumerate(frames))
+    ms = (time.perf_counter() - t0) / args.frames * 1e3
+    print(f"metrics: {ms:.3f} ms per frame, {flags} flags raised")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Visibility downtime of the raw snapshots taken during the vis stream.
+
+Times the snapshot sequence of the capture process (stop the correlator,
+capture, read back, unpack, re-arm) against the fake SPI module for each
+snapshot size, and adds the time the readback takes on the wire of a real
+SPI bus, which the fake module does not model.
+
+    cd tart_api && python ../benchmarks/raw_snapshot.py [--exps 16,18,20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_snapshot_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from app.config import create_runtime_config  # noqa: E402
+from tart_hardware_interface.stream_vis import capture_raw_snapshot  # noqa: E402
+from tart_hardware_interface.tart_fake_spi import TartFakeSPI  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--exps", default="16,18,20")
+    # The speed create_spi_object() opens the bus at
+    parser.add_argument("--spi-mhz", type=float, default=16.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    config = create_runtime_config()
+    config["sample_delay"] = 0
+    tart = TartFakeSPI(config, np.arange(24))
+    print(f"SPI at {args.spi_mhz:g} MHz")
+    print(f"{'exp':>4s} {'samples':>9s} {'fake ms':>8s} {'readback ms':>12s} {'downtime ms':>12s}")
+    for exp in (int(e) for e in args.exps.split(",")):
+        num_words = 2**exp
+        downtime = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            snapshot = capture_raw_snapshot(tart, config, num_words)
+            downtime.append(time.perf_counter() - t0)
+            assert snapshot["ant_data"].shape == (24, num_words)
+        fake_ms = np.median(downtime) * 1e3
+        # 3 bytes of 24 antenna bits per sample
+        readback_ms = num_words * 3 * 8 / (args.spi_mhz * 1e6) * 1e3
+        print(
+            f"{exp:4d} {num_words:9d} {fake_ms:8.1f} {readback_ms:12.1f}"
+            f" {fake_ms + readback_ms:12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
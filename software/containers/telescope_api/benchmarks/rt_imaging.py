@@ -0,0 +1,94 @@
+"""
+Per-image latency of the real-time synthesis imager (rt_syn_img mode).
+
+Builds the imager for each grid size, then times its stages on random
+frames: gridding and FFT (SynthesisImager.image), the PNG and the raw
+float32 encodings, and writing both files. The one-off cost of building
+the imager for a layout is reported separately.
+
+    cd tart_api && python ../benchmarks/rt_imaging.py [--positions calibrated_antenna_positions.json]
+
+Without --positions a random 24 antenna layout within 3 m is used.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_img_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from services.geometry import baseline_uvw, positions_key  # noqa: E402
+from services.synthesis import (  # noqa: E402
+    SPEED_OF_LIGHT,
+    SynthesisImager,
+    encode_png,
+    encode_raw,
+    write_atomic,
+)
+
+FREQUENCY = 1575.42e6
+
+
+def timed(f, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - t0)
+    return result, np.median(times) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--positions", help="antenna positions JSON file")
+    parser.add_argument("--sizes", default="128,256,512", help="comma separated grid sizes")
+    parser.add_argument("--repeat", type=int, default=50, help="images per size")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.positions:
+        with open(args.positions) as f:
+            positions = json.load(f)
+    else:
+        positions = np.c_[rng.uniform(-1.5, 1.5, (24, 2)), np.zeros(24)].tolist()
+    num_ant = len(positions)
+    uvw = baseline_uvw(positions_key(positions), SPEED_OF_LIGHT / FREQUENCY)
+    baselines = np.array(
+        [(i, j) for i in range(num_ant) for j in range(i + 1, num_ant)], dtype=np.uint8
+    )
+    vis = rng.normal(size=len(baselines)) + 1j * rng.normal(size=len(baselines))
+    weights = np.ones(len(baselines), dtype=bool)
+    png_path = os.path.join(DATA_ROOT, "image.png")
+    raw_path = os.path.join(DATA_ROOT, "image.npy")
+
+    print(f"{num_ant} antennas, {len(baselines)} baselines, median of {args.repeat} images")
+    print(
+        f"{'pixels':>6s} {'build ms':>9s} {'image ms':>9s} {'png ms':>8s} {'raw ms':>8s} "
+        f"{'write ms':>9s} {'total ms':>9s} {'png bytes':>10s}"
+    )
+    for n in [int(s) for s in args.sizes.split(",")]:
+        imager, build = timed(lambda: SynthesisImager(uvw, baselines, n), 3)
+        image, t_image = timed(lambda: imager.image(vis, weights), args.repeat)
+        png, t_png = timed(lambda: encode_png(image), args.repeat)
+        raw, t_raw = timed(lambda: encode_raw(image), args.repeat)
+        _, t_write = timed(
+            lambda: (write_atomic(raw_path, raw, 0), write_atomic(png_path, png, 0)), args.repeat
+        )
+        total = t_image + t_png + t_raw + t_write
+        print(
+            f"{n:6d} {build:9.2f} {t_image:9.2f} {t_png:8.2f} {t_raw:8.2f} "
+            f"{t_write:9.2f} {total:9.2f} {len(png):10d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Latency of the direct Fourier all-sky maps (/imaging/sky_map).
+
+For each HEALPix nside, times building the steering matrix, loading it
+back from the disk cache, mapping one frame, and mapping a batch of frames
+as one matrix product, reported per frame.
+
+    cd tart_api && python ../benchmarks/sky_map.py [--positions calibrated_antenna_positions.json]
+
+Without --positions a random 24 antenna layout within 3 m is used.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_sky_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from services.sky_map import SkyMapper, hemisphere_pixels  # noqa: E402
+
+FREQUENCY = 1575.42e6
+
+
+def timed(f, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - t0)
+    return result, np.median(times) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--positions", help="antenna positions JSON file")
+    parser.add_argument("--nside", default="16,32,64,128", help="comma separated nside values")
+    parser.add_argument("--batch", type=int, default=32, help="frames per batch")
+    parser.add_argument("--repeat", type=int, default=20, help="maps per measurement")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.positions:
+        with open(args.positions) as f:
+            positions = json.load(f)
+    else:
+        positions = np.c_[rng.uniform(-1.5, 1.5, (24, 2)), np.zeros(24)].tolist()
+    num_ant = len(positions)
+    baselines = np.array(
+        [(i, j) for i in range(num_ant) for j in range(i + 1, num_ant)], dtype=np.uint8
+    )
+    num_baselines = len(baselines)
+    frames = rng.normal(size=(args.batch, num_baselines)) + 1j * rng.normal(
+        size=(args.batch, num_baselines)
+    )
+    weights = np.ones(num_baselines)
+    cache_path = os.path.join(DATA_ROOT, "cache")
+
+    print(f"{num_ant} antennas, {num_baselines} baselines, batches of {args.batch} frames")
+    print(
+        f"{'nside':>5s} {'pixels':>7s} {'matrix MB':>10s} {'build ms':>9s} {'load ms':>8s} "
+        f"{'frame ms':>9s} {'batched ms/frame':>17s}"
+    )
+    for nside in [int(s) for s in args.nside.split(",")]:
+        t0 = time.perf_counter()
+        mapper = SkyMapper(positions, baselines, FREQUENCY, nside, cache_path)
+        build = (time.perf_counter() - t0) * 1e3
+        mapper, load = timed(
+            lambda: SkyMapper(positions, baselines, FREQUENCY, nside, cache_path), 3
+        )
+        mapper.map(frames[0], weights)
+        _, single = timed(lambda: mapper.map(frames[0], weights), args.repeat)
+        _, batch = timed(lambda: mapper.map(frames, weights), max(1, args.repeat // 4))
+        print(
+            f"{nside:5d} {hemisphere_pixels(nside):7d} {mapper.steering.nbytes / 2**20:10.1f} "
+            f"{build:9.1f} {load:8.2f} {single:9.2f} {batch / args.batch:17.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Cost of the spectra of the spectrum mode (/status/spectrum/waterfall).
+
+Times the spectra of all antennas of a simulated raw snapshot, computed at
+once and antenna by antenna as the diag mode used to, then recording them
+in the waterfall, reading it back, and archiving them.
+
+    cd tart_api && python ../benchmarks/spectrum.py [--nfft 1024]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_spectrum_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from database.migrations import to_ns  # noqa: E402
+from services.spectrum import SpectrumArchive, Waterfall  # noqa: E402
+from tart_hardware_interface.highlevel_modes_api import (  # noqa: E402
+    SAMPLING_RATE,
+    get_psd,
+    spectra_db,
+)
+
+
+def timed(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        ret = fn()
+    return ret, (time.perf_counter() - t0) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--antennas", type=int, default=24)
+    parser.add_argument("--samples-exp", type=int, default=16)
+    parser.add_argument("--nfft", type=int, default=1024)
+    parser.add_argument("--history", type=int, default=1440)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    num_ant = args.antennas
+    ant_data = rng.integers(0, 2, size=(num_ant, 2**args.samples_exp), dtype=np.uint8)
+
+    (power_db, freq), vectorized_ms = timed(lambda: spectra_db(ant_data, args.nfft), args.repeat)
+
+    def per_antenna():
+        signal = np.asarray(ant_data, dtype=np.float16) * 2 - 1.0
+        return [get_psd(s - s.mean(), SAMPLING_RATE, args.nfft) for s in signal]
+
+    spectra, loop_ms = timed(per_antenna, args.repeat)
+    error = max(
+        np.abs(10 * np.log10(power + 1e-32) - power_db[i]).max()
+        for i, (power, _) in enumerate(spectra)
+    )
+    print(f"{num_ant} antennas, 2^{args.samples_exp} samples, NFFT {args.nfft}")
+    print(f"spectra: {vectorized_ms:.1f} ms, per antenna {loop_ms:.1f} ms, max diff {error:.1e} dB")
+
+    waterfall = Waterfall(args.history, num_ant)
+    start = datetime(2025, 1, 1, tzinfo=UTC)
+    timestamps = [start + timedelta(seconds=10 * k) for k in range(2 * args.history)]
+    t0 = time.perf_counter()
+    for timestamp in timestamps:
+        waterfall.append(to_ns(timestamp), power_db, freq)
+    append_us = (time.perf_counter() - t0) / len(timestamps) * 1e6
+    print(f"waterfall of {args.history}: append {append_us:.1f} us")
+    for n in (1, 60, args.history):
+        _, read_ms = timed(lambda n=n: waterfall.recent(n), args.repeat)
+        print(f"  recent({n}): {read_ms:.3f} ms")
+
+    # As many snapshots as the waterfall holds, so the file overhead is spread out
+    archive = SpectrumArchive(os.path.join(DATA_ROOT, "spectrum"), keep_days=7)
+    t0 = time.perf_counter()
+    for timestamp in timestamps[: args.history]:
+        archive.append(timestamp, power_db, freq)
+    archive_ms = (time.perf_counter() - t0) / args.history * 1e3
+    size = sum(
+        os.path.getsize(archive.filename(day))
+        for day in {t.strftime("%Y-%m-%d") for t in timestamps[: args.history]}
+    )
+    size /= args.history
+    print(f"archive: {archive_ms:.2f} ms and {size / 1024:.1f} KiB per snapshot")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Polling benchmark for the latest visibilities endpoint of the TART API.
+
+Runs a number of concurrent clients polling /imaging/vis, as dashboards do,
+and reports the throughput and latency percentiles. With --etag the clients
+send the ETag of the last frame they received in If-None-Match.
+
+    python benchmarks/vis_feed.py --clients 32 --seconds 20 [--etag]
+
+The API to test is taken from API_BASE_URL (default http://localhost:8000).
+"""
+
+import argparse
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import requests
+
+
+def poller(base_url, deadline, use_etag, results, lock):
+    session = requests.Session()
+    timings = []
+    codes = Counter()
+    etag = None
+    while time.monotonic() < deadline:
+        headers = {"If-None-Match": etag} if use_etag and etag else {}
+        t0 = time.perf_counter()
+        response = session.get(f"{base_url}/imaging/vis", headers=headers)
+        timings.append(time.perf_counter() - t0)
+        codes[response.status_code] += 1
+        etag = response.headers.get("ETag", etag)
+    with lock:
+        results["timings"].extend(timings)
+        results["codes"].update(codes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=16, help="concurrent polling clients")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of the run")
+    parser.add_argument("--etag", action="store_true", help="send If-None-Match")
+    args = parser.parse_args()
+
+    base_url = os.getenv("API_BASE_URL", "http://localhost:8000")
+    results = {"timings": [], "codes": Counter()}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+
+    threads = [
+        threading.Thread(target=poller, args=(base_url, deadline, args.etag, results, lock))
+        for _ in range(args.clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    t = np.array(results["timings"]) * 1e3
+    p50, p95, p99 = np.percentile(t, [50, 95, 99])
+    print(f"{args.clients} clients, {args.seconds:.0f} s, etag={args.etag}")
+    print(f"{'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s}  status codes")
+    print(
+        f"{len(t) / args.seconds:8.1f} {p50:8.2f} {p95:8.2f} {p99:8.2f}  "
+        f"{dict(sorted(results['codes'].items()))}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Size and latency of the representations of the latest visibilities.
+
+Fetches /imaging/vis repeatedly as JSON and as the compact binary format
+(Accept: application/vnd.tart.vis), and reports the body size, the request
+latency and the time to decode the body into NumPy arrays on the client.
+The gzip size of each body is shown for comparison with compressing JSON
+on the wire instead.
+
+    python benchmarks/vis_formats.py --repeat 200
+
+The API to test is taken from API_BASE_URL (default http://localhost:8000).
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+
+import numpy as np
+import requests
+
+VIS_MEDIA_TYPE = "application/vnd.tart.vis"
+
+
+def decode_json(body):
+    data = json.loads(body)["data"]
+    baselines = np.array([(v["i"], v["j"]) for v in data], dtype=int)
+    vis = np.array([complex(v["re"], v["im"]) for v in data], dtype=np.complex64)
+    return baselines, vis
+
+
+def decode_binary(body):
+    # See app.vis_codec: header, baseline list, then one (timestamp, complex64 x B) record
+    num_baselines = int(np.frombuffer(body, dtype="<u2", count=1, offset=4)[0])
+    baselines = np.frombuffer(body, dtype=np.uint8, count=2 * num_baselines, offset=8)
+    vis = np.frombuffer(body, dtype="<c8", offset=8 + 2 * num_baselines + 8)
+    return baselines.reshape(-1, 2), vis
+
+
+FORMATS = {
+    "json": ("application/json", decode_json),
+    "binary": (VIS_MEDIA_TYPE, decode_binary),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=100, help="requests per format")
+    args = parser.parse_args()
+
+    base_url = os.getenv("API_BASE_URL", "http://localhost:8000")
+    session = requests.Session()
+    print(
+        f"{'format':8s} {'bytes':>8s} {'gzip':>8s} {'baselines':>10s} "
+        f"{'p50 ms':>8s} {'p95 ms':>8s} {'decode ms':>10s}"
+    )
+    for name, (media_type, decode) in FORMATS.items():
+        latencies = []
+        decode_times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            response = session.get(f"{base_url}/imaging/vis", headers={"Accept": media_type})
+            latencies.append(time.perf_counter() - t0)
+            response.raise_for_status()
+            assert response.headers["content-type"].startswith(media_type), name
+            t0 = time.perf_counter()
+            baselines, vis = decode(response.content)
+            decode_times.append(time.perf_counter() - t0)
+        body = response.content
+        p50, p95 = np.percentile(np.array(latencies) * 1e3, [50, 95])
+        print(
+            f"{name:8s} {len(body):8d} {len(gzip.compress(body)):8d} {len(vis):10d} "
+            f"{p50:8.2f} {p95:8.2f} {np.median(decode_times) * 1e3:10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Cost of the shared memory ring of recent frames (/imaging/vis/recent).
+
+Times recording a frame into the ring, and reading the latest n frames
+back and encoding them as the endpoint does.
+
+    cd tart_api && python ../benchmarks/vis_ring.py [--capacity 600]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+# The database module reads DATA_ROOT when it is first imported
+DATA_ROOT = tempfile.mkdtemp(prefix="tart_ring_bench_")
+os.environ["DATA_ROOT"] = DATA_ROOT
+sys.path[:0] = [os.getcwd(), os.path.join(os.getcwd(), "app")]
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from services.channel_cache import init_channel_caches  # noqa: E402
+from services.vis_feed import VisQuery  # noqa: E402
+from services.vis_ring import VisRing, encode_recent  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--capacity", type=int, default=600)
+    parser.add_argument("--antennas", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    num_ant = args.antennas
+    baselines = np.array(
+        [(i, j) for i in range(num_ant) for j in range(i + 1, num_ant)], dtype=np.uint8
+    )
+    vis = rng.normal(size=len(baselines)) + 1j * rng.normal(size=len(baselines))
+    start = datetime(2025, 1, 1, tzinfo=UTC)
+    frames = [
+        {"timestamp": start + timedelta(seconds=k), "baselines": baselines, "vis": vis}
+        for k in range(2 * args.capacity)
+    ]
+
+    init_channel_caches(
+        num_ant,
+        [{"channel_id": i, "enabled": 1} for i in range(num_ant)],
+        0,
+        [(i, 0, 1.0, 0.0) for i in range(num_ant)],
+        0,
+    )
+    ring = VisRing(args.capacity, num_ant)
+    t0 = time.perf_counter()
+    for frame in frames:
+        ring.append(frame)
+    append_us = (time.perf_counter() - t0) / len(frames) * 1e6
+    print(f"{len(baselines)} baselines, capacity {args.capacity} frames")
+    print(f"append: {append_us:.1f} us per frame")
+
+    print(f"{'n':>6s} {'read ms':>8s} {'encode ms':>10s} {'bytes':>9s}")
+    query = VisQuery()
+    for n in (1, 60, args.capacity):
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            recent = ring.recent(n)
+        read_ms = (time.perf_counter() - t0) / args.repeat * 1e3
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            body = encode_recent(*recent, query)
+        encode_ms = (time.perf_counter() - t0) / args.repeat * 1e3
+        print(f"{n:6d} {read_ms:8.3f} {encode_ms:10.3f} {len(body):9d}")
+
+
+if __name__ == "__main__":
+    main()
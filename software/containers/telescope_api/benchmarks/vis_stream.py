@@ -0,0 +1,110 @@
+"""
+Load test for the live visibility stream of the TART API.
+
+Connects a number of simulated WebSocket clients to /stream/ws and reports,
+per run, how many frames each client received and the delivery latency
+(arrival time minus frame timestamp). A fraction of the clients can be
+made slow, pausing after each message, to check that they lose frames
+without delaying the others.
+
+    python benchmarks/vis_stream.py --clients 100 --seconds 30 [--format binary]
+
+The API to test is taken from API_BASE_URL (default http://localhost:8000).
+Requires the websockets package (installed with uvicorn[standard]).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import struct
+import time
+
+import numpy as np
+import websockets
+
+
+def frame_time(message):
+    """Frame timestamp in seconds since the UNIX epoch, or None for status messages."""
+    if isinstance(message, bytes):
+        # The timestamp follows the baseline list of the header, see app.vis_codec
+        _, num_baselines, _ = struct.unpack_from("<4sHH", message)
+        return struct.unpack_from("<q", message, 8 + 2 * num_baselines)[0] * 1e-9
+    message = json.loads(message)
+    if message["type"] != "vis":
+        return None
+    timestamp = message["timestamp"].replace("Z", "+00:00")
+    return np.datetime64(timestamp[:-6]).astype("datetime64[ns]").astype(np.int64) * 1e-9
+
+
+async def client(url, deadline, slow, results):
+    latencies = []
+    frames = set()
+    async with websockets.connect(url, max_queue=None) as ws:
+        while (remaining := deadline - time.time()) > 0:
+            try:
+                message = await asyncio.wait_for(ws.recv(), remaining)
+            except TimeoutError:
+                break
+            t = frame_time(message)
+            if t is None:
+                continue
+            latencies.append(time.time() - t)
+            frames.add(t)
+            if slow:
+                await asyncio.sleep(slow)
+    results.append((slow, frames, latencies))
+
+
+async def run(args):
+    base_url = os.getenv("API_BASE_URL", "http://localhost:8000").replace("http", "ws", 1)
+    url = f"{base_url}/stream/ws?format={args.format}&status=false"
+    if args.antennas:
+        url += f"&antennas={args.antennas}"
+    n_slow = int(args.clients * args.slow_fraction)
+    results = []
+    deadline = time.time() + args.seconds
+    await asyncio.gather(
+        *[
+            client(url, deadline, args.slow_seconds if k < n_slow else 0, results)
+            for k in range(args.clients)
+        ]
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=100, help="simulated clients")
+    parser.add_argument("--seconds", type=float, default=30.0, help="duration of the run")
+    parser.add_argument("--format", choices=["json", "binary"], default="json")
+    parser.add_argument("--antennas", help="comma separated antenna subset")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="fraction of slow clients")
+    parser.add_argument(
+        "--slow-seconds", type=float, default=5.0, help="pause of slow clients per message"
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    published = set().union(*(frames for _, frames, _ in results))
+    print(f"{args.clients} clients, {args.seconds:.0f} s, format={args.format}")
+    print(f"frames published during the run: {len(published)}")
+    print(
+        f"{'clients':12s} {'n':>4s} {'frames min':>11s} {'p50 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}"
+    )
+    for name, group in (
+        ("normal", [r for r in results if not r[0]]),
+        ("slow", [r for r in results if r[0]]),
+    ):
+        if not group:
+            continue
+        lat = np.concatenate([r[2] for r in group]) * 1e3
+        p50, p99 = np.percentile(lat, [50, 99])
+        print(
+            f"{name:12s} {len(group):4d} {min(len(r[1]) for r in group):11d} "
+            f"{p50:8.1f} {p99:8.1f} {lat.max():8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import hashlib
+import io
 import logging
 import os
 
@@ -11,6 +12,10 @@ Helper functions
 """
 
 
+# Sample rate of the raw captures, and frequency axis of the spectra
+SAMPLING_RATE = 16e6
+
+
 def get_psd_ext(d, fs, nfft):
     logging.warning("DEPRECATED: Use get_psd_np instead.")
     from matplotlib import mlab
@@ -130,6 +135,83 @@ def get_psd_np(d, fs, nfft):
     return np.asarray(power_ret), np.asarray(freq_ret)
 
 
+def get_psd_all(ant_data, fs, nfft, num_bins=128):
+    """
+    Vectorized get_psd_np() of all antennas at once.
+
+    The signals are cut into non-overlapping segments of nfft samples (a tail
+    shorter than nfft is dropped), and the Hanning windowed periodograms of
+    all antennas and segments are computed in a single real FFT and averaged.
+
+    Args:
+        ant_data: (num_ant, N) signals, N >= nfft
+        fs: Sampling frequency
+        nfft: FFT size
+
+    Returns:
+        tuple: (power (num_ant, num_bins), freq (num_bins,)), each bin the
+        maximum (power) and mean (frequency) of the FFT bins it covers
+    """
+    num_freq = nfft // 2 + 1
+    assert num_freq >= num_bins, f"nfft={nfft} produces only {num_freq} frequency bins"
+    ant_data = np.asarray(ant_data)
+    num_ant, num_samples = ant_data.shape
+    num_segments = num_samples // nfft
+    assert num_segments > 0, f"{num_samples} samples is less than nfft={nfft}"
+
+    window = np.hanning(nfft).astype(np.float32)
+    segments = ant_data[:, : num_segments * nfft].reshape(num_ant, num_segments, nfft)
+    spectra = np.fft.rfft(segments * window, axis=-1)
+    power = (spectra.real**2 + spectra.imag**2).mean(axis=1) / (fs * np.sum(window**2))
+    # One-sided, so every bin but DC (and Nyquist for even nfft) counts twice
+    power[:, 1 : num_freq - (nfft % 2 == 0)] *= 2
+    freq = np.fft.rfftfreq(nfft, 1 / fs)
+
+    width = num_freq // num_bins
+    power = power[:, : num_bins * width].reshape(num_ant, num_bins, width).max(axis=-1)
+    freq = freq[: num_bins * width].reshape(num_bins, width).mean(axis=-1)
+    return power, freq
+
+
+def spectra_db(ant_data, nfft, fs=SAMPLING_RATE):
+    """
+    Power spectra in dB of the raw 1-bit samples of each antenna.
+
+    Args:
+        ant_data: (num_ant, N) samples, 0 or 1
+
+    Returns:
+        tuple: (power_db (num_ant, 128) float32, freq (128,) in Hz)
+    """
+    signal = np.asarray(ant_data, dtype=np.float32) * 2 - 1.0
+    signal -= signal.mean(axis=1, keepdims=True)
+    power, freq = get_psd_all(signal, fs, nfft)
+    power_db = 10.0 * np.log10(power + 1e-32)  # Avoid divide by zero
+    return np.nan_to_num(power_db), freq
+
+
+def acquire_snapshot(tart, runtime_config, num_words):
+    """
+    Take a short raw capture, e.g. for a spectrum, with the sample delay in use.
+
+    Returns:
+        tuple: (timestamp, ant_data) with the (24, num_words) samples, 0 or 1
+    """
+    tart.reset()
+    tart.debug(on=False, noisy=runtime_config["verbose"])
+    tart.capture(on=True, source=0, noisy=runtime_config["verbose"])
+    tart.set_sample_delay(runtime_config["sample_delay"])
+    tart.centre(runtime_config["centre"], noisy=runtime_config["verbose"])
+    timestamp = utc.now()
+    # A short capture fills the buffer in milliseconds, so poll instead of sleeping
+    tart.start_acquisition(0.005, False)
+    while not tart.data_ready():
+        tart.pause(duration=0.005)
+    data = np.asarray(tart.read_data(num_words=num_words), dtype=np.uint8)
+    tart.reset()
+    return timestamp, np.flipud(np.unpackbits(data).reshape(-1, 24).T)
+
+
 def get_psd(d, fs, nfft):
     # Validate nfft is large enough for 128 frequency bins
     expected_freq_bins = nfft // 2 + 1
@@ -139,12 +221,128 @@ def get_psd(d, fs, nfft):
     return get_psd_np(d, fs, nfft)
 
 
-def sha256_checksum(filename, block_size=65536):
-    sha256 = hashlib.sha256()
+CHECKSUM_ALGORITHMS = ("sha256", "blake2b")
+
+
+def new_checksum(algorithm="sha256"):
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+    return hashlib.new(algorithm)
+
+
+def file_checksum(filename, algorithm="sha256", block_size=65536):
+    digest = new_checksum(algorithm)
     with open(filename, "rb") as f:
         for block in iter(lambda: f.read(block_size), b""):
-            sha256.update(block)
-    return sha256.hexdigest()
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sha256_checksum(filename, block_size=65536):
+    return file_checksum(filename, "sha256", block_size)
+
+
+class HashingWriter:
+    """
+    Write-only file wrapper that updates a checksum with every byte written,
+    so the digest is available as soon as the file is closed.
+    """
+
+    def __init__(self, filename, algorithm="sha256"):
+        self.filename = filename
+        self.algorithm = algorithm
+        self._digest = new_checksum(algorithm)
+        self._f = open(filename, "wb")
+
+    def write(self, data):
+        self._digest.update(data)
+        return self._f.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def save_hashed(filename, image, algorithm="sha256", verify=False):
+    """
+    Write a complete file image to disk in a single hashing pass.
+
+    Args:
+        filename: Destination path
+        image: Bytes-like file contents
+        algorithm: One of CHECKSUM_ALGORITHMS
+        verify: Read the file back and compare checksums (doubles the I/O)
+
+    Returns:
+        str: Hex digest of the written bytes
+    """
+    with HashingWriter(filename, algorithm) as f:
+        f.write(image)
+    checksum = f.hexdigest()
+    if verify and file_checksum(filename, algorithm) != checksum:
+        raise OSError(f"Checksum verification failed for {filename}")
+    return checksum
+
+
+PARTIAL_SUFFIX = ".partial"
+
+
+def rename_hashed(partial_filename, filename, algorithm="sha256"):
+    """
+    Hash a finished file in blocks and rename it into place, for files that
+    were written incrementally and so could not be hashed as they were written.
+
+    Args:
+        partial_filename: The file as written, on the same filesystem as filename
+        filename: Destination path
+        algorithm: One of CHECKSUM_ALGORITHMS
+
+    Returns:
+        str: Hex digest of the file
+    """
+    checksum = file_checksum(partial_filename, algorithm)
+    os.replace(partial_filename, filename)
+    return checksum
+
+
+def save_hdf5_hashed(filename, write_hdf5, algorithm="sha256", verify=False):
+    """
+    Save an HDF5 product and return its checksum without re-reading the file.
+
+    HDF5 rewrites the superblock and object headers while a file is open, so a
+    digest of the write stream would not match the file. The file is built in
+    memory by write_hdf5(fileobj), which bounds this to products of a known
+    size such as raw snapshots, written to filename + PARTIAL_SUFFIX with
+    save_hashed() and renamed into place.
+    """
+    image = io.BytesIO()
+    write_hdf5(image)
+    partial_filename = filename + PARTIAL_SUFFIX
+    try:
+        with image.getbuffer() as buf:
+            checksum = save_hashed(partial_filename, buf, algorithm, verify)
+        os.replace(partial_filename, filename)
+    finally:
+        if os.path.exists(partial_filename):
+            os.remove(partial_filename)
+    return checksum
+
+
+def checksum_settings(runtime_config):
+    """Return the (algorithm, verify) pair from the runtime config."""
+    checksum_config = runtime_config.get("checksum", {})
+    return (
+        checksum_config.get("algorithm", "sha256"),
+        bool(checksum_config.get("verify", 0)),
+    )
 
 
 def ph_stats(vals, stable_threshold, N_samples):
@@ -262,7 +460,7 @@ def run_diagnostic(tart, runtime_config):
             )
         )
 
-    ant_data = np.asarray(ant_data, dtype=np.float16) * 2 - 1.0
+    power_db, freq = spectra_db(ant_data[:num_ant], runtime_config["diagnostic"]["spectre"]["NFFT"])
 
     channels = []
 
@@ -271,14 +469,7 @@ def run_diagnostic(tart, runtime_config):
         channel["id"] = i
         channel["phase"] = phases[i]
         channel["radio_mean"] = radio_means[i]
-        power, freq = get_psd(
-            ant_data[i] - ant_data[i].mean(),
-            16e6,
-            runtime_config["diagnostic"]["spectre"]["NFFT"],
-        )
-        power_db = 10.0 * np.log10(power + 1e-32)  # Avoid divide by zero
-        power_db = np.nan_to_num(power_db)
-        channel["power"] = (np.asarray(power_db * 1000, dtype=int) / 1000.0).tolist()
+        channel["power"] = (np.asarray(power_db[i] * 1000, dtype=int) / 1000.0).tolist()
         channel["freq"] = (freq / 1e6).tolist()
         channels.append(channel)
 
@@ -314,7 +505,6 @@ def run_acquire_raw(tart, runtime_config):
     else:
         ts = datetime.now(timezone.utc)
     tart.start_acquisition(1.1, True)
-    t_stmp, path = create_timestamp_and_path(runtime_config["raw"]["base_path"], ts)
 
     while not tart.data_ready():
         tart.pause(duration=0.005, noisy=True)
@@ -331,14 +521,25 @@ def run_acquire_raw(tart, runtime_config):
     data = np.asarray(data, dtype=np.uint8)
     ant_data = np.flipud(np.unpackbits(data).reshape(-1, 24).T)
     if runtime_config["raw"]["save"]:
-        config = settings.from_file(runtime_config["telescope_config_path"])
+        return save_raw(runtime_config, ts, ant_data)
+    return {}
 
-        fname = "data_{}.hdf".format(t_stmp.strftime("%Y-%m-%d_%H_%M_%S.%f"))
 
-        filename = os.path.join(path, fname)
+def save_raw(runtime_config, ts, ant_data):
+    """Save raw antenna data as an observation in the dated directories of raw.base_path."""
+    t_stmp, path = create_timestamp_and_path(runtime_config["raw"]["base_path"], ts)
+    config = settings.from_file(runtime_config["telescope_config_path"])
 
-        obs = observation.Observation(t_stmp, config, savedata=ant_data)
-        obs.to_hdf5(filename)
-        logging.info("Saved raw data to: %s", filename)
-        return {"filename": filename, "sha256": sha256_checksum(filename)}
-    return {}
+    fname = "data_{}.hdf".format(t_stmp.strftime("%Y-%m-%d_%H_%M_%S.%f"))
+
+    filename = os.path.join(path, fname)
+
+    obs = observation.Observation(t_stmp, config, savedata=ant_data)
+    algorithm, verify = checksum_settings(runtime_config)
+    checksum = save_hdf5_hashed(filename, obs.to_hdf5, algorithm, verify)
+    logging.info("Saved raw data to: %s", filename)
+    return {
+        "filename": filename,
+        "checksum": checksum,
+        "checksum_algorithm": algorithm,
+    }
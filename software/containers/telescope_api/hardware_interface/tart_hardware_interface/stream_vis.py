@@ -10,7 +10,7 @@ from tart.imaging import visibility
 from tart.operation import settings
 from tart.util import utc
 
-from tart_hardware_interface.highlevel_modes_api import get_status
+from tart_hardware_interface.highlevel_modes_api import acquire_snapshot, get_status
 
 logger = logging.getLogger(__name__)
 
@@ -66,12 +66,35 @@ def get_data(tart):
     return viz[tart.perm]
 
 
+def capture_raw_snapshot(tart, runtime_config, num_words):
+    """
+    Take a raw snapshot between two visibility reads, and re-arm the correlator.
+
+    Returns:
+        dict: the timestamp and (24, num_words) ant_data of the snapshot, and
+        the UTC gap_start and gap_end of the time the correlator was stopped
+    """
+    gap_start = utc.now()
+    timestamp, ant_data = acquire_snapshot(tart, runtime_config, num_words)
+    tart.debug(on=False, shift=False, count=False, noisy=False)
+    tart.capture(on=True, noisy=False)
+    tart.set_sample_delay(runtime_config["sample_delay"])
+    tart.start(runtime_config["vis"]["N_samples_exp"], True)
+    return {
+        "timestamp": timestamp,
+        "ant_data": ant_data,
+        "gap_start": gap_start,
+        "gap_end": utc.now(),
+    }
+
+
 def capture_loop(
     tart,
     process_queue,
     cmd_queue,
     runtime_config,
     logger=logger,
+    snapshot_queue=None,
 ):
     print("Capture Loop Start")
     tart.reset()
@@ -88,6 +111,8 @@ def capture_loop(
                 cmd = cmd_queue.get()
                 if cmd == "stop":
                     active = 0
+                elif cmd[0] == "raw":  # ("raw", num_words)
+                    snapshot_queue.put(capture_raw_snapshot(tart, runtime_config, cmd[1]))
             # Add the data to the process queue
             data = get_data(tart)
             d = get_status(tart)
@@ -145,10 +170,12 @@ def stream_vis_to_queue(tart, runtime_config):
     # >> [2x visibility and mean readout]
     # >> raw_data_queue >> [visibility assembly]
     # >> vis_queue
+    # and, on a ("raw", num_words) command, [raw snapshot] >> snapshot_queue
 
     # Send data to each process
     raw_data_queue = multiprocessing.Queue()
     vis_queue = multiprocessing.Queue()
+    snapshot_queue = multiprocessing.Queue()
 
     # Send commands to each process
     capture_cmd_queue = multiprocessing.Queue()
@@ -156,7 +183,7 @@ def stream_vis_to_queue(tart, runtime_config):
 
     capture_process = multiprocessing.Process(
         target=capture_loop,
-        args=(tart, raw_data_queue, capture_cmd_queue, runtime_config, logger),
+        args=(tart, raw_data_queue, capture_cmd_queue, runtime_config, logger, snapshot_queue),
     )
     vis_calc_process = multiprocessing.Process(
         target=process_loop,
@@ -171,4 +198,5 @@ def stream_vis_to_queue(tart, runtime_config):
         capture_process,
         vis_calc_cmd_queue,
         capture_cmd_queue,
+        snapshot_queue,
     )
@@ -21,6 +21,9 @@ class Settings(BaseSettings):
     login_password: str = "password"
     config_root: str = "/config_data"
     data_root: str = "/telescope_data"
+    db_workers: int = 4  # threads (and reader connections) for database calls
+    stream_queue_size: int = 16  # messages held per stream client before dropping the oldest
+    stream_status_seconds: float = 2.0  # how often the stream checks the FPGA status
 
     class Config:
         env_file = ".env"
@@ -59,6 +62,7 @@ def create_runtime_config() -> Any:
         "vis_save",
         "cal",
         "rt_syn_img",
+        "spectrum",
     ]
     config_dict["mode"] = "vis"
     config_dict["loop_mode"] = "loop"
@@ -75,6 +79,8 @@ def create_runtime_config() -> Any:
         "base_path": os.path.join(data_root, "raw"),
         "sync": 0,
         "sync_acquire_at_seconds": [0, 10, 20, 30, 40, 50],
+        # In the vis modes, also take a raw snapshot at each sync_acquire_at_seconds mark
+        "snapshot_schedule": 0,
     }
     config_dict["diagnostic"] = {
         "num_ant": 24,
@@ -85,9 +91,89 @@ def create_runtime_config() -> Any:
     }
     config_dict["vis"] = {
         "save": 1,
-        "chunksize": 60,
+        "chunksize": 60,  # frames per HDF5 chunk
+        "file_seconds": 600,  # roll over to a new vis file after this many seconds
+        "file_max_bytes": 16 * 2**20,  # ... or once the file reaches this size
         "N_samples_exp": 24,
         "base_path": os.path.join(data_root, "vis"),
+        "recent_frames": 600,  # frames kept in memory for /imaging/vis/recent, fixed at startup
+    }
+
+    # Quick-look images in the rt_syn_img mode
+    config_dict["rt_syn_img"] = {
+        "seconds": 5.0,  # time between images
+        "num_pixels": 128,  # image width and height, covering the whole sky
+    }
+
+    # Averages of the vis stream, served at /imaging/vis?integration=<cadence>
+    config_dict["integration"] = {
+        "cadences": [10, 60, 600],  # seconds
+        "ring_size": 60,  # recent averages kept per cadence
+        "save": 0,  # archive the averages, one file per cadence and day
+        "base_path": os.path.join(data_root, "vis", "integrated"),
+        "keep_days": 7,  # archived days kept
+    }
+
+    # RFI and outlier flags, carried in each frame and honoured downstream
+    config_dict["flagging"] = {
+        "enabled": 1,
+        "window": 32,  # frames in the running median and MAD of each baseline
+        "min_frames": 16,  # frames before anything is flagged
+        "threshold": 6.0,  # robust standard deviations from the median amplitude
+    }
+
+    # Per-frame data quality metrics, served at /status/quality
+    config_dict["quality"] = {
+        "ring_size": 60,  # recent reports kept
+        "decay_frames": 300,  # time constant of the running baseline amplitude statistics
+        "warmup_frames": 30,  # frames before baselines are flagged on their z-score
+        # Flag thresholds
+        "zscore": 5.0,  # baseline amplitude against its running mean and deviation
+        "amplitude_ratio": 0.2,  # antenna mean amplitude relative to the median antenna
+        # degrees, of the closure phases over the triangles of an antenna above the median antenna
+        "closure_phase_excess": 15.0,
+        "radio_mean": 0.2,  # magnitude of the mean of an antenna's radio samples
+    }
+
+    # Spectra of short raw snapshots, served at /status/spectrum/waterfall
+    config_dict["spectrum"] = {
+        "seconds": 10.0,  # time between snapshots
+        "in_stream": 1,  # also in the vis modes, pausing the correlator for each snapshot
+        "N_samples_exp": 16,  # samples per snapshot, 2**N_samples_exp
+        "NFFT": 1024,
+        "history": 1440,  # spectra kept in memory, fixed at startup
+        "save": 0,  # archive the spectra, one file per day
+        "base_path": os.path.join(data_root, "spectrum"),
+        "keep_days": 7,  # archived days kept
+    }
+
+    # Gain solutions in the cal mode
+    config_dict["cal"] = {
+        "frames": 30,  # frames averaged for a solution
+        "seconds": 600,  # time between solutions
+        # Sky model, [{"el": deg, "az": deg, "flux": ...}]; when empty, a point
+        # source in the brightest direction of the sky map
+        "sources": [],
+        "max_iterations": 100,
+        "tolerance": 1e-6,  # relative change in the gains at which to stop
+    }
+
+    # Direct Fourier all-sky maps at /imaging/sky_map
+    config_dict["sky_map"] = {
+        "nside": 32,  # default HEALPix resolution, 6080 pixels above the horizon
+        "cache_path": os.path.join(data_root, "cache"),  # steering matrices
+    }
+
+    config_dict["checksum"] = {
+        "algorithm": "sha256",  # or "blake2b", which is faster on 64-bit SBCs
+        "verify": 0,  # read raw files back after writing to confirm the checksum
+    }
+
+    # Per product limits on the file caches, None disables a limit
+    config_dict["retention"] = {
+        "raw": {"max_files": 10, "max_bytes": 2**30, "max_age": None},
+        "vis": {"max_files": 10, "max_bytes": 2**30, "max_age": None},
+        "sweep_seconds": 600,  # full sweep so age limits apply while idle
     }
 
     config_dict["telescope_config_path"] = os.path.join(config_root, "telescope_config.json")
@@ -116,9 +202,12 @@ def create_runtime_config() -> Any:
     with open(antenna_positions_path) as a_c:
         config_dict["antenna_positions"] = json.load(a_c)
         a_c.close()
+    # Bumped by geometry.set_antenna_positions(), see services.geometry
+    config_dict["antenna_positions_version"] = 0
 
     config_dict["calibration_dir"] = f"/{config_root}/"
     config_dict["realtime_image_path"] = f"{data_root}/assets/img/image.png"
+    config_dict["realtime_image_raw_path"] = f"{data_root}/assets/img/image.npy"
     config_dict["hostname"] = socket.gethostname()
 
     return config_dict
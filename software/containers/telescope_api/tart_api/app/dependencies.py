@@ -5,11 +5,15 @@ This module provides dependency injection for configuration, authentication,
 and other shared resources.
 """
 
+from datetime import UTC, datetime
 from typing import Annotated, Any
 
+import numpy as np
 from fastapi import Depends, HTTPException, Request, status
+from fastapi.requests import HTTPConnection
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
+from pydantic import AfterValidator
 
 from .config import settings
 
@@ -53,7 +57,7 @@ class JWTBearer(HTTPBearer):
 security = JWTBearer()
 
 
-def get_runtime_config(request: Request) -> Any:
+def get_runtime_config(request: HTTPConnection) -> Any:
     """Dependency to get the runtime configuration from app state."""
     # Try to get shared config first (for mode switching to work)
     try:
@@ -102,6 +106,89 @@ async def get_current_user(username: Annotated[str, Depends(verify_jwt_token)])
     return username
 
 
+def as_utc(timestamp: datetime) -> datetime:
+    """Treat naive query timestamps as UTC."""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=UTC)
+    return timestamp
+
+
+def parse_antennas(antennas: str | None, num_ant: int) -> np.ndarray | None:
+    """Parse a comma separated antenna list such as "0,1,5"."""
+    if antennas is None:
+        return None
+    try:
+        ret = np.array([int(a) for a in antennas.split(",") if a.strip()], dtype=int)
+    except ValueError:
+        raise HTTPException(
+            status_code=422, detail="antennas must be comma separated integers"
+        ) from None
+    if np.any((ret < 0) | (ret >= num_ant)):
+        raise HTTPException(
+            status_code=422, detail=f"antennas must be in the range 0-{num_ant - 1}"
+        )
+    return ret
+
+
+def parse_baselines(baselines: str | None, num_ant: int) -> list[tuple[int, int]] | None:
+    """Parse a comma separated baseline list such as "0-1,2-5" into (i, j) with i < j."""
+    if baselines is None:
+        return None
+    ret = []
+    for item in baselines.split(","):
+        if not item.strip():
+            continue
+        try:
+            i, j = (int(a) for a in item.split("-"))
+        except ValueError:
+            raise HTTPException(
+                status_code=422, detail="baselines must be comma separated pairs such as 0-1"
+            ) from None
+        if not (0 <= i < num_ant and 0 <= j < num_ant) or i == j:
+            raise HTTPException(
+                status_code=422,
+                detail=f"baselines must join two different antennas in the range 0-{num_ant - 1}",
+            )
+        ret.append((min(i, j), max(i, j)))
+    return ret
+
+
+def negotiate_media_type(accept: str | None, offers: list[str]) -> str:
+    """
+    Pick the offered media type the Accept header prefers, by q-value and
+    then specificity. The first offer is the default, also when nothing
+    offered is acceptable, so clients sending an odd Accept keep working.
+    """
+    if not accept:
+        return offers[0]
+    ranges = []
+    for part in accept.split(","):
+        media_range, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((media_range.lower(), q))
+
+    def quality(offer):
+        main_type = offer.split("/")[0]
+        # The most specific matching range decides
+        for pattern in (offer, f"{main_type}/*", "*/*"):
+            for media_range, q in ranges:
+                if media_range == pattern:
+                    return q, pattern == offer
+        return 0.0, False
+
+    best = max(offers, key=quality)
+    return best if quality(best)[0] > 0 else offers[0]
+
+
 # Type aliases for cleaner dependency injection
 ConfigDep = Annotated[Any, Depends(get_runtime_config)]
 AuthDep = Annotated[str, Depends(get_current_user)]
+# Timestamp query parameter, naive values are taken to be UTC
+UTCDatetime = Annotated[datetime, AfterValidator(as_utc)]
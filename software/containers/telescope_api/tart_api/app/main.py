@@ -10,9 +10,15 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from database import init_database
-from services import cleanup_telescope_service, init_telescope_service
+from services import (
+    cleanup_telescope_service,
+    get_telescope_service,
+    init_telescope_service,
+)
+from services.channel_cache import init_channel_caches
+from services.vis_stream import stream_hub
 
-from .config import init_config
+from .config import init_config, settings
 from .routers import (
     acquisition,
     auth,
@@ -23,6 +29,7 @@ from .routers import (
     info,
     operation,
     status,
+    stream,
 )
 
 
@@ -51,15 +58,38 @@ async def lifespan(app: FastAPI):
     persisted_sync_seconds = await db.get_setting("raw.sync_acquire_at_seconds")
     if persisted_sync_seconds is not None:
         raw_config["sync_acquire_at_seconds"] = persisted_sync_seconds
+    persisted_schedule = await db.get_setting("raw.snapshot_schedule")
+    if persisted_schedule is not None:
+        raw_config["snapshot_schedule"] = persisted_schedule
     config["raw"] = raw_config
 
+    # Shared channel mask and gain caches, inherited by the worker processes
+    init_channel_caches(
+        num_ant,
+        await db.get_manual_channel_status(),
+        await db.get_channel_version(),
+        await db.get_gain(),
+        await db.get_gain_version(),
+    )
+
     # Start telescope control service (state machine)
     await init_telescope_service(config)
 
+    # Push new frames and status to the stream subscribers
+    service = await get_telescope_service()
+    stream_hub.start(
+        service.shared_config,
+        service.vis_frames,
+        settings.stream_queue_size,
+        settings.stream_status_seconds,
+    )
+
     yield
 
     # Cleanup on shutdown
+    await stream_hub.stop()
     await cleanup_telescope_service()
+    await db.close()
 
 
 app = FastAPI(
@@ -90,6 +120,7 @@ app.include_router(calibration.router, prefix="/calibration", tags=["calibration
 app.include_router(channel.router, prefix="/channel", tags=["channel"])
 app.include_router(acquisition.router, prefix="/acquire", tags=["acquisition"])
 app.include_router(data.router, prefix="", tags=["data"])
+app.include_router(stream.router, prefix="/stream", tags=["stream"])
 
 
 @app.get("/")
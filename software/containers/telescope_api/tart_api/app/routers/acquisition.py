@@ -7,15 +7,20 @@ Flask acquisition logic while providing FastAPI-compatible responses.
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 
 from database import AsyncDatabase, get_database
 from generated_models.acquisition_models import (
+    RawSnapshotRequestResponse,
+    RawSnapshotsResponse,
     SampleExponentResponse,
     SaveFlagResponse,
+    SnapshotScheduleResponse,
     SyncResponse,
     SyncAcquireAtSecondsResponse,
 )
+from services.raw_snapshots import request_snapshot
+from services.tart_control import STREAM_STATES
 
 from ..dependencies import AuthDep, ConfigDep
 
@@ -181,3 +186,65 @@ async def get_raw_sync_acquire_at_seconds(config: ConfigDep):
     Get the allowed seconds-of-the-minute at which raw acquisition may start.
     """
     return SyncAcquireAtSecondsResponse(sync_acquire_at_seconds=config["raw"].get("sync_acquire_at_seconds", [0, 10, 20, 30, 40, 50]))
+
+
+@router.put("/raw/snapshot_schedule/{flag}", response_model=SnapshotScheduleResponse)
+async def set_raw_snapshot_schedule(
+    flag: int, config: ConfigDep, _: AuthDep, db: Annotated[AsyncDatabase, Depends(get_database)]
+):
+    """
+    Enable or disable scheduled raw snapshots in the vis modes.
+
+    When enabled, the visibility stream is paused at each of the
+    sync_acquire_at_seconds marks for a raw snapshot of
+    2**N_samples_exp samples, and resumed straight after it.
+    Requires JWT authentication.
+    """
+    raw_config = config["raw"]
+    raw_config["snapshot_schedule"] = flag
+    config["raw"] = raw_config
+    await db.set_setting("raw.snapshot_schedule", flag)
+    return SnapshotScheduleResponse(snapshot_schedule=config["raw"]["snapshot_schedule"])
+
+
+@router.get("/raw/snapshot_schedule", response_model=SnapshotScheduleResponse)
+async def get_raw_snapshot_schedule(config: ConfigDep):
+    """
+    Get the scheduled raw snapshot flag.
+    """
+    return SnapshotScheduleResponse(snapshot_schedule=config["raw"].get("snapshot_schedule", 0))
+
+
+@router.post(
+    "/raw/snapshot",
+    response_model=RawSnapshotRequestResponse,
+    status_code=202,
+    responses={409: {"description": "The telescope is not streaming visibilities"}},
+)
+async def request_raw_snapshot(config: ConfigDep, _: AuthDep):
+    """
+    Take a raw snapshot without leaving the vis mode.
+
+    The correlator is stopped between two visibility frames for the capture
+    and readback of 2**N_samples_exp samples, and re-armed straight away.
+    The snapshot is saved like a raw mode acquisition when the raw save flag
+    is set, and appears in /acquire/raw/snapshots with the gap it left in the
+    visibilities. Requires JWT authentication.
+    """
+    if config.get("mode") not in STREAM_STATES:
+        raise HTTPException(
+            status_code=409, detail=f"Raw snapshots are taken in the {', '.join(STREAM_STATES)} modes"
+        )
+    return RawSnapshotRequestResponse(requested_at=request_snapshot())
+
+
+@router.get("/raw/snapshots", response_model=RawSnapshotsResponse)
+async def get_raw_snapshots(config: ConfigDep, n: Annotated[int, Query(ge=1)] = 60):
+    """
+    Get the latest n raw snapshots taken in the vis modes.
+
+    Each has the time of the capture, the interval in which the correlator
+    was stopped and no visibilities were measured (gap_start to gap_end),
+    its length as the downtime in seconds, and the saved file if any.
+    """
+    return RawSnapshotsResponse(snapshots=(config.get("raw_snapshots") or [])[-n:])
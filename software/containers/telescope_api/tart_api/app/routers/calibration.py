@@ -7,17 +7,21 @@ Flask calibration logic while providing FastAPI-compatible responses.
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
 from database import AsyncDatabase, get_database
 from generated_models.calibration_models import (
+    CalibrationStatusResponse,
+    GainHistoryResponse,
     GetGainResponse,
     SetAntennaPositionsRequest,
     SetGainRequest,
 )
 from generated_models.common_models import EmptyResponse
+from services import channel_cache
+from services.geometry import set_antenna_positions
 
-from ..dependencies import AuthDep, ConfigDep
+from ..dependencies import AuthDep, ConfigDep, UTCDatetime
 
 router = APIRouter()
 
@@ -35,7 +39,8 @@ async def set_gain(
     This endpoint reuses the existing Flask logic for gain calibration.
     Requires JWT authentication.
     """
-    await db.insert_gain(gain_request.gain, gain_request.phase_offset)
+    version = await db.insert_gain(gain_request.gain, gain_request.phase_offset)
+    channel_cache.set_gains(gain_request.gain, gain_request.phase_offset, version)
     return EmptyResponse()
 
 
@@ -62,21 +67,68 @@ async def set_calibration_antenna_positions(
     else:
         raise HTTPException(status_code=422, detail="Invalid antenna positions format")
 
-    config["antenna_positions"] = raw_positions
+    set_antenna_positions(config, raw_positions)
     return EmptyResponse()
 
 
 @router.get("/gain", response_model=GetGainResponse)
-async def get_gain(config: ConfigDep, db: Annotated[AsyncDatabase, Depends(get_database)]):
+async def get_gain(
+    config: ConfigDep,
+    db: Annotated[AsyncDatabase, Depends(get_database)],
+    at: UTCDatetime | None = None,
+):
     """
     Get channel based complex gains.
 
     This endpoint reuses the existing Flask logic for gain retrieval.
+    With at=<UTC timestamp>, returns the gains that were in use at that time.
     """
+    if at is None:
+        gain, phase_offset = channel_cache.current_gains()
+        return GetGainResponse(gain=gain.tolist(), phase_offset=phase_offset.tolist())
+
     num_ant = config["telescope_config"]["num_antenna"]
-    rows_dict = await db.get_gain()
+    rows_dict = await db.get_gain_at(at)
+    if len(rows_dict) == 0:
+        raise HTTPException(status_code=404, detail="No calibration recorded at that time")
 
     ret_gain = [rows_dict[i][2] for i in range(num_ant)]
     ret_ph = [rows_dict[i][3] for i in range(num_ant)]
 
     return GetGainResponse(gain=ret_gain, phase_offset=ret_ph)
+
+
+@router.get("/gain/history", response_model=GainHistoryResponse)
+async def get_gain_history(
+    db: Annotated[AsyncDatabase, Depends(get_database)],
+    limit: Annotated[int, Query(ge=1, le=500)] = 50,
+    before: UTCDatetime | None = None,
+):
+    """
+    Get the history of channel gains, newest first.
+
+    Each entry applies from its timestamp until the next one. Pages are
+    limited to limit entries; pass next_before as before to get the next page.
+    """
+    items = await db.get_gain_history(limit + 1, before)
+    next_before = items[limit - 1]["timestamp"] if len(items) > limit else None
+    return GainHistoryResponse(items=items[:limit], next_before=next_before)
+
+
+@router.get(
+    "/status",
+    response_model=CalibrationStatusResponse,
+    responses={404: {"description": "No solution made in cal mode yet"}},
+)
+async def get_calibration_status(config: ConfigDep):
+    """
+    Get the report of the last gain solution made in cal mode.
+
+    In cal mode the telescope averages the configured number of frames,
+    solves for the antenna gains against the sky model and stores them as
+    the current gains, then repeats at the configured interval.
+    """
+    status = config.get("calibration_status")
+    if status is None:
+        raise HTTPException(status_code=404, detail="No calibration solution available")
+    return CalibrationStatusResponse(**status)
@@ -7,12 +7,19 @@ Flask channel logic while providing FastAPI-compatible responses.
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 
 from database import AsyncDatabase, get_database
-from generated_models.channel_models import ChannelStatusResponse, ChannelToggleResponse
+from generated_models.channel_models import (
+    ChannelBulkUpdateRequest,
+    ChannelBulkUpdateResponse,
+    ChannelMaskUpdate,
+    ChannelStatusResponse,
+    ChannelToggleResponse,
+)
+from services import channel_cache
 
-from ..dependencies import AuthDep
+from ..dependencies import AuthDep, ConfigDep
 
 router = APIRouter()
 
@@ -30,16 +37,49 @@ async def set_channel(
     This endpoint reuses the existing Flask logic for channel management.
     Requires JWT authentication.
     """
-    await db.update_manual_channel_status(channel_idx, bool(enable))
+    version, channels = await db.update_manual_channel_status(channel_idx, bool(enable))
+    channel_cache.set_channels(channels, version)
     return ChannelToggleResponse({str(channel_idx): enable})
 
 
+@router.put("", response_model=ChannelBulkUpdateResponse)
+async def set_channels(
+    request: ChannelBulkUpdateRequest,
+    config: ConfigDep,
+    _: AuthDep,
+    db: Annotated[AsyncDatabase, Depends(get_database)],
+):
+    """
+    Enable/Disable several channels at once.
+
+    Takes either the full mask, {"mask": [1, 0, ...]} with one flag per
+    channel, or a list of changes, {"changes": [{"channel_id": 3, "enabled": 0}]}.
+    All of them are applied in a single transaction that bumps the channel
+    configuration version, so readers never see a partial update.
+    Requires JWT authentication.
+    """
+    update = request.root
+    if isinstance(update, ChannelMaskUpdate):
+        num_ant = config["telescope_config"]["num_antenna"]
+        if len(update.mask) != num_ant:
+            raise HTTPException(
+                status_code=422,
+                detail=f"mask must have one flag for each of the {num_ant} channels",
+            )
+        changes = list(enumerate(update.mask))
+    else:
+        changes = [(ch.channel_id.root, ch.enabled) for ch in update.changes]
+
+    version, channels = await db.update_channels(changes)
+    channel_cache.set_channels(channels, version)
+    return ChannelBulkUpdateResponse(version=version, channels=channels)
+
+
 @router.get("", response_model=ChannelStatusResponse)
-async def get_all_channels(db: Annotated[AsyncDatabase, Depends(get_database)]):
+async def get_all_channels():
     """
     Get all channels and their enabled/disabled status.
 
     This endpoint reuses the existing Flask logic for channel status retrieval.
     """
-    ret = await db.get_manual_channel_status()
-    return ChannelStatusResponse(ret)
+    return ChannelStatusResponse(channel_cache.channel_status())
@@ -5,50 +5,248 @@ This module provides imaging data endpoints that reuse the existing
 Flask imaging logic while providing FastAPI-compatible responses.
 """
 
+import asyncio
+import json
+import os
+from datetime import UTC, datetime, timedelta
+from typing import Annotated, Literal
+
 import numpy as np
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
+from database import AsyncDatabase, get_database
+from database.operations import to_ns
 from generated_models.imaging_models import (
     AntennaPositionsResponse,
     AntennaPositionsResponseItem,
+    SkyMapResponse,
+    UVWResponse,
     VisibilityResponse,
 )
+from services.geometry import array_geometry
+from services.sky_map import frame_sky_map
+from services.synthesis import SPEED_OF_LIGHT, encode_raw
+from services.vis_feed import JSON_MEDIA_TYPE, VisQuery, make_etag, vis_feed
+from services.vis_history import iter_history
+from services.vis_ring import encode_recent, recent_averages, recent_frames
+from services.vis_stream import stream_hub
 
-from ..dependencies import ConfigDep
+from ..dependencies import (
+    ConfigDep,
+    UTCDatetime,
+    negotiate_media_type,
+    parse_antennas,
+    parse_baselines,
+)
+from ..vis_codec import VIS_MEDIA_TYPE
 
 router = APIRouter()
 
+# Upper limit on the number of times in one /imaging/uvw response
+MAX_UVW_TIMES = 1440
 
-@router.get("/vis", response_model=VisibilityResponse)
-async def get_latest_vis(config: ConfigDep):
+
+@router.get(
+    "/vis",
+    response_model=VisibilityResponse,
+    responses={
+        200: {
+            "content": {VIS_MEDIA_TYPE: {}},
+            "description": "JSON, or with Accept: application/vnd.tart.vis a single frame in "
+            "the compact binary format of app.vis_codec",
+        },
+        204: {"description": "No frame newer than after was published before the timeout"},
+        304: {"description": "The frame matching If-None-Match is still the latest"},
+        422: {"description": "Invalid subset or integration, or a representation not in binary"},
+    },
+)
+async def get_latest_vis(
+    config: ConfigDep,
+    antennas: str | None = None,
+    baselines: str | None = None,
+    min_length: Annotated[float | None, Query(ge=0)] = None,
+    max_length: Annotated[float | None, Query(ge=0)] = None,
+    representation: Literal["reim", "ampphase"] = "reim",
+    precision: Literal["float64", "float32"] = "float64",
+    calibrated: bool = False,
+    integration: Annotated[int | None, Query(gt=0)] = None,
+    after: UTCDatetime | None = None,
+    timeout: Annotated[float, Query(gt=0, le=120)] = 30.0,
+    accept: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
     """
     Get latest visibilities.
 
-    This endpoint reuses the existing Flask logic for visibility data,
-    including filtering by enabled channels.
-    """
-    if "vis_current" in config:
-        ret = dict(config["vis_current"])
+    Only baselines between enabled channels that are not flagged in the
+    frame (see the flagging settings) are returned. They can be
+    narrowed down to those between a comma separated list of antennas
+    (antennas=0,1,5), to a list of baselines (baselines=0-1,2-5) and to a
+    range of baseline lengths in metres from the antenna positions
+    (min_length, max_length). representation=ampphase returns amp and phase
+    (radians) instead of re and im, and precision=float32 rounds the values
+    to 7 significant digits. calibrated=true applies the current gains and
+    phase offsets (see /calibration/gain).
 
-        # Import database functions to reuse channel filtering logic
-        from database import get_database
+    integration=<seconds> returns the latest average over one of the
+    cadences of the integration settings (by default 10, 60 and 600 s)
+    instead of the latest frame, with its number of frames in samples. Its
+    timestamp is the start of the averaging interval, which is aligned to
+    UTC multiples of the cadence.
 
-        db = get_database()
-        channel_list = await db.get_manual_channel_status()
-        active_channels = np.zeros(len(channel_list))
-        for ch in channel_list:
-            active_channels[ch["channel_id"]] = ch["enabled"]
+    JSON is the default; clients that send Accept: application/vnd.tart.vis
+    get the frame as a binary header (timestamp and baseline list) followed
+    by little-endian complex64 visibilities, about a sixth of the size.
+    The encoded response is shared by all clients making the same request
+    until the frame, the channel mask or, when calibrated, the gains change. Send the ETag back in
+    If-None-Match to get a 304 while the frame you have is still the latest.
 
-        active_vis = []
-        for v in ret["data"]:
-            if active_channels[v["i"]] and active_channels[v["j"]]:
-                active_vis.append(v)
-        ret["data"] = active_vis
+    Long polling: with after=<timestamp of the frame you have>, the request
+    waits until a newer frame is published and returns it straight away, or
+    returns 204 after timeout seconds (default 30) if none arrives.
+    """
+    num_ant = config["telescope_config"]["num_antenna"]
+    ant = parse_antennas(antennas, num_ant)
+    pairs = parse_baselines(baselines, num_ant)
+    query = VisQuery(
+        antennas=None if ant is None else tuple(sorted(set(ant.tolist()))),
+        baselines=None if pairs is None else tuple(sorted(set(pairs))),
+        min_length=min_length,
+        max_length=max_length,
+        representation=representation,
+        precision=precision,
+        calibrated=calibrated,
+        integration=integration,
+    )
+    if integration is not None and integration not in config["integration"]["cadences"]:
+        raise HTTPException(
+            status_code=422,
+            detail=f"integration must be one of {config['integration']['cadences']}",
+        )
+    media_type = negotiate_media_type(accept, [JSON_MEDIA_TYPE, VIS_MEDIA_TYPE])
+    if media_type == VIS_MEDIA_TYPE and representation != "reim":
+        raise HTTPException(
+            status_code=422, detail="representation=ampphase is only available as JSON"
+        )
 
-        return VisibilityResponse(**ret)
-    else:
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept"}
+    if (
+        after is not None
+        and await stream_hub.frame_after(config, after, timeout, integration) is None
+    ):
+        return Response(status_code=204, headers=headers)
+
+    key = vis_feed.current_key(config, media_type, query)
+    if key is not None and if_none_match is not None:
+        if make_etag(*key) in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": make_etag(*key), **headers})
+
+    entry = await vis_feed.get(config, media_type, query)
+    if entry is None:
         # Return empty visibility response when no data available
         return VisibilityResponse(data=[])
+    return Response(
+        content=entry.body, media_type=media_type, headers={"ETag": entry.etag, **headers}
+    )
+
+
+@router.get(
+    "/vis/history",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {VIS_MEDIA_TYPE: {}},
+            "description": "Archived frames in the compact binary format of app.vis_codec",
+        },
+        422: {"description": "Invalid time range or antenna list"},
+    },
+)
+async def get_vis_history(
+    start: UTCDatetime,
+    end: UTCDatetime,
+    config: ConfigDep,
+    db: Annotated[AsyncDatabase, Depends(get_database)],
+    antennas: str | None = None,
+):
+    """
+    Get archived visibilities between two UTC timestamps.
+
+    Frames are located through the time index of the vis archive and streamed
+    as a binary header (baseline list) followed by one record per frame
+    (timestamp_ns + complex64 visibilities). Optionally restrict the baselines
+    to those between a comma separated list of antennas, e.g. antennas=0,1,5.
+    Flagged visibilities are NaN. Frames in the file that is currently being
+    written are not yet indexed.
+    """
+    start_ns = to_ns(start)
+    end_ns = to_ns(end)
+    if end_ns < start_ns:
+        raise HTTPException(status_code=422, detail="end must not be before start")
+    ant = parse_antennas(antennas, config["telescope_config"]["num_antenna"])
+
+    blocks = await db.get_vis_blocks(start_ns, end_ns)
+    return StreamingResponse(iter_history(blocks, start_ns, end_ns, ant), media_type=VIS_MEDIA_TYPE)
+
+
+@router.get(
+    "/vis/recent",
+    response_class=Response,
+    responses={
+        200: {
+            "content": {VIS_MEDIA_TYPE: {}},
+            "description": "The frames in the compact binary format of app.vis_codec",
+        },
+        404: {"description": "No visibilities, or averages at that integration, yet"},
+        422: {"description": "Invalid antenna list or integration"},
+    },
+)
+async def get_recent_vis(
+    config: ConfigDep,
+    n: Annotated[int, Query(ge=1)] = 60,
+    after: UTCDatetime | None = None,
+    antennas: str | None = None,
+    calibrated: bool = False,
+    integration: Annotated[int | None, Query(gt=0)] = None,
+):
+    """
+    Get the latest n frames from memory.
+
+    The frames are held in a ring buffer of the most recent vis.recent_frames
+    frames (n is capped at that), so this needs no disk access. They are
+    returned oldest first in the binary format of /imaging/vis/history, only
+    those newer than after if given, so that a display can poll for the
+    frames it has not seen. Only baselines between enabled channels, and
+    between the comma separated antennas if given, are included, calibrated
+    with the current gains when calibrated=true. Flagged visibilities are
+    NaN. With integration=<seconds>
+    the frames are the latest averages at that cadence instead (see
+    /imaging/vis).
+    """
+    num_ant = config["telescope_config"]["num_antenna"]
+    ant = parse_antennas(antennas, num_ant)
+    if integration is not None and integration not in config["integration"]["cadences"]:
+        raise HTTPException(
+            status_code=422,
+            detail=f"integration must be one of {config['integration']['cadences']}",
+        )
+    query = VisQuery(
+        antennas=None if ant is None else tuple(sorted(set(ant.tolist()))),
+        calibrated=calibrated,
+    )
+    after_ns = None if after is None else to_ns(after)
+
+    if integration is None:
+        recent = recent_frames(n, after_ns)
+    else:
+        recent = recent_averages(config, integration, n, after_ns)
+    if recent is None:
+        raise HTTPException(status_code=404, detail="No visibilities available")
+    return Response(
+        content=encode_recent(*recent, query),
+        media_type=VIS_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 @router.get("/antenna_positions", response_model=AntennaPositionsResponse)
@@ -81,3 +279,164 @@ async def get_imaging_timestamp(config: ConfigDep):
         return utc.to_string(config["vis_timestamp"])
     else:
         raise HTTPException(status_code=404, detail="No visibility timestamp available")
+
+
+IMAGE_FORMATS = {
+    "png": ("realtime_image_path", "image/png"),
+    "raw": ("realtime_image_raw_path", "application/octet-stream"),
+}
+
+
+def read_image(path):
+    """The image file and its modification time, read through one handle."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(), os.fstat(f.fileno()).st_mtime_ns
+    except FileNotFoundError:
+        return None, None
+
+
+@router.get(
+    "/image",
+    response_class=Response,
+    responses={
+        200: {
+            "content": {"image/png": {}, "application/octet-stream": {}},
+            "description": "The latest quick-look image, as a PNG or a float32 .npy array",
+        },
+        304: {"description": "The image matching If-None-Match is still the latest"},
+        404: {"description": "No image available"},
+    },
+)
+async def get_realtime_image(
+    config: ConfigDep,
+    fmt: Annotated[Literal["png", "raw"], Query(alias="format")] = "png",
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    """
+    Get the latest quick-look all-sky image of the rt_syn_img mode.
+
+    The image has north up and east on the left, and covers the sky down to
+    the horizon. format=raw returns the image as a float32 array in NumPy
+    .npy format, with NaN below the horizon. The image is replaced at the
+    cadence set in the rt_syn_img settings of the runtime config.
+    """
+    key, media_type = IMAGE_FORMATS[fmt]
+    body, mtime_ns = read_image(config[key])
+    if body is None:
+        raise HTTPException(status_code=404, detail="No image available")
+
+    # The image files carry the frame timestamp as their modification time
+    etag = f'"{mtime_ns}-{fmt}"'
+    headers = {"Cache-Control": "no-cache", "ETag": etag}
+    if if_none_match is not None and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+@router.get(
+    "/sky_map",
+    response_model=SkyMapResponse,
+    responses={
+        200: {
+            "content": {"application/octet-stream": {}},
+            "description": "JSON, or with format=raw the map as a float32 .npy array",
+        },
+        404: {"description": "No visibilities available"},
+        422: {"description": "nside is not a power of two"},
+    },
+)
+async def get_sky_map(
+    config: ConfigDep,
+    nside: Annotated[int | None, Query(ge=1, le=128)] = None,
+    fmt: Annotated[Literal["json", "raw"], Query(alias="format")] = "json",
+):
+    """
+    Get an all-sky map of the latest visibilities by direct Fourier sum.
+
+    The map holds the brightness of the HEALPix pixels above the horizon,
+    in RING order with the zenith as the pole, so that every pixel covers
+    the same solid angle. nside (a power of two, default from the sky_map
+    settings of the runtime config) sets the resolution: 6 nside^2 - 2 nside
+    pixels. The current gains are applied and the baselines of disabled
+    channels left out. The steering matrix for a layout and nside is built
+    on the first request and then reused from disk.
+    """
+    nside = nside or config["sky_map"]["nside"]
+    if nside & (nside - 1):
+        raise HTTPException(status_code=422, detail="nside must be a power of two")
+    frame = config.get("vis_current")
+    if frame is None:
+        raise HTTPException(status_code=404, detail="No visibilities available")
+
+    sky = await asyncio.to_thread(frame_sky_map, frame, config, nside)
+    if fmt == "raw":
+        return Response(content=encode_raw(sky), media_type="application/octet-stream")
+    return SkyMapResponse(timestamp=frame["timestamp"], nside=nside, map=sky.tolist())
+
+
+def uvw_body(geometry, times, telescope, ra, dec, units, fmt):
+    times_ns = np.array([to_ns(t) for t in times], dtype=np.int64)
+    uvw = geometry.uvw_at(times_ns, telescope["lat"], telescope["lon"], ra, dec)
+    if units == "wavelengths":
+        uvw /= SPEED_OF_LIGHT / telescope["frequency"]
+    if fmt == "raw":
+        return encode_raw(uvw)
+    timestamps = [t.isoformat().replace("+00:00", "Z") for t in times]
+    body = {
+        "version": geometry.version,
+        "units": units,
+        "baselines": geometry.baselines.tolist(),
+        "timestamps": timestamps,
+        "uvw": uvw.tolist(),
+    }
+    return json.dumps(body, separators=(",", ":")).encode()
+
+
+@router.get(
+    "/uvw",
+    response_model=UVWResponse,
+    responses={
+        200: {
+            "content": {"application/octet-stream": {}},
+            "description": "JSON, or with format=raw the (times, baselines, 3) float64 .npy array",
+        },
+        422: {"description": "Only one of ra and dec, or too many times"},
+    },
+)
+async def get_uvw(
+    config: ConfigDep,
+    ra: Annotated[float | None, Query(ge=0, lt=360)] = None,
+    dec: Annotated[float | None, Query(ge=-90, le=90)] = None,
+    start: UTCDatetime | None = None,
+    seconds: Annotated[float, Query(ge=0, le=86400)] = 0.0,
+    step: Annotated[float, Query(gt=0)] = 60.0,
+    units: Literal["wavelengths", "metres"] = "wavelengths",
+    fmt: Annotated[Literal["json", "raw"], Query(alias="format")] = "json",
+):
+    """
+    Get the (u, v, w) coordinates of the baselines.
+
+    The baselines are the pairs (i, j), i < j, of the current antenna
+    positions, in the order of the visibilities, and (u, v, w) is position i
+    minus position j, in wavelengths at the observing frequency or in metres.
+    With ra and dec (degrees) the phase centre is fixed on the sky and the
+    coordinates are returned every step seconds from start (default now) for
+    seconds; without them the phase centre is the zenith, where (u, v, w) is
+    the east, north, up baseline at any time. The version changes whenever
+    the antenna positions are set.
+    """
+    if (ra is None) != (dec is None):
+        raise HTTPException(status_code=422, detail="ra and dec must be given together")
+    num_times = int(seconds // step) + 1
+    if num_times > MAX_UVW_TIMES:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_UVW_TIMES} times, increase step")
+    start = start or datetime.now(UTC)
+    times = [start + timedelta(seconds=k * step) for k in range(num_times)]
+
+    geometry = array_geometry.get(config)
+    body = await asyncio.to_thread(
+        uvw_body, geometry, times, config["telescope_config"], ra, dec, units, fmt
+    )
+    media_type = "application/octet-stream" if fmt == "raw" else JSON_MEDIA_TYPE
+    return Response(content=body, media_type=media_type)
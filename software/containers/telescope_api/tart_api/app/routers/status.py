@@ -5,19 +5,27 @@ This module provides status monitoring endpoints that reuse the existing
 Flask status logic while providing FastAPI-compatible responses.
 """
 
-from typing import Annotated
+import io
+from datetime import UTC, datetime
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Response
 from tart.util import utc
 
-from database import AsyncDatabase, get_database
+from database.operations import to_ns
 from generated_models.status_models import (
+    QualityResponse,
+    SpectrumWaterfallResponse,
     StatusChannelAllResponse,
     StatusChannelSingleResponse,
     StatusFPGAResponse,
 )
+from services import channel_cache
+from services.quality import recent_reports
+from services.spectrum import recent_spectra
 
-from ..dependencies import ConfigDep
+from ..dependencies import ConfigDep, UTCDatetime, parse_antennas
 
 router = APIRouter()
 
@@ -70,9 +78,7 @@ async def get_status_fpga(config: ConfigDep):
 
 
 @router.get("/channel", response_model=StatusChannelAllResponse)
-async def get_status_channel_all(
-    config: ConfigDep, db: Annotated[AsyncDatabase, Depends(get_database)]
-):
+async def get_status_channel_all(config: ConfigDep):
     """
     Get all channel status information.
 
@@ -80,17 +86,12 @@ async def get_status_channel_all(
     including enabled/disabled status from the database.
     """
     if "channels" in config:
-        channel_list = await db.get_manual_channel_status()
+        mask = channel_cache.channel_mask()
         ret = list(config["channels"])
 
         # Apply the same logic as Flask app
         for ch in ret:
-            # Find corresponding channel in database
-            db_channel = next(
-                (c for c in channel_list if c["channel_id"] == ch["id"]),
-                {"enabled": True},
-            )
-            ch["enabled"] = db_channel["enabled"]
+            ch["enabled"] = int(mask[ch["id"]]) if ch["id"] < len(mask) else True
 
             # Apply same rounding as Flask
             if "phase" in ch and "stability" in ch["phase"]:
@@ -107,7 +108,6 @@ async def get_status_channel_all(
 async def get_status_channel_i(
     channel_idx: int,
     config: ConfigDep,
-    db: Annotated[AsyncDatabase, Depends(get_database)],
 ):
     """
     Get specific channel status information.
@@ -116,15 +116,9 @@ async def get_status_channel_i(
     """
     if "channels" in config:
         if 0 <= channel_idx < 24:
-            channel_list = await db.get_manual_channel_status()
+            mask = channel_cache.channel_mask()
             ret = dict(config["channels"][channel_idx])
-
-            # Find corresponding channel in database
-            db_channel = next(
-                (c for c in channel_list if c["channel_id"] == channel_idx),
-                {"enabled": True},
-            )
-            ret["enabled"] = db_channel["enabled"]
+            ret["enabled"] = int(mask[channel_idx]) if channel_idx < len(mask) else True
 
             return StatusChannelSingleResponse(**ret)
 
@@ -143,3 +137,88 @@ async def get_status_channel_i(
         freq=[],
         power=[],
     )
+
+
+@router.get("/quality", response_model=QualityResponse)
+async def get_status_quality(n: Annotated[int, Query(ge=1)] = 1):
+    """
+    Get the data quality reports of the latest n frames.
+
+    Each report has the per-antenna mean amplitudes, radio sample means and
+    closure phase statistics, per-baseline amplitude z-scores, and flags for
+    the thresholds in the quality settings that the frame crossed.
+    """
+    reports = recent_reports(n)
+    if not reports:
+        return QualityResponse(baselines=[], reports=[])
+    baselines = reports[-1]["baselines"]
+    # Only the reports with the latest baseline order, which the z-scores follow
+    reports = [r for r in reports if np.array_equal(r["baselines"], baselines)]
+    return QualityResponse(
+        baselines=baselines.tolist(),
+        reports=[
+            {
+                "timestamp": r["timestamp"],
+                "amplitude": r["amplitude"].tolist(),
+                "radio_mean": r["radio_mean"].tolist(),
+                "closure_phase_rms": r["closure_phase_rms"],
+                "antenna_closure_phase_rms": r["antenna_closure_phase_rms"].tolist(),
+                "zscore": r["zscore"].tolist(),
+                "flags": r["flags"],
+            }
+            for r in reports
+        ],
+    )
+
+
+@router.get(
+    "/spectrum/waterfall",
+    response_model=SpectrumWaterfallResponse,
+    responses={
+        200: {
+            "content": {"application/octet-stream": {}},
+            "description": "JSON, or with format=raw the waterfall as a NumPy .npz file",
+        },
+        404: {"description": "No spectra recorded yet"},
+        422: {"description": "Invalid antenna list"},
+    },
+)
+async def get_spectrum_waterfall(
+    config: ConfigDep,
+    n: Annotated[int, Query(ge=1)] = 60,
+    after: UTCDatetime | None = None,
+    antennas: str | None = None,
+    fmt: Annotated[Literal["json", "raw"], Query(alias="format")] = "json",
+):
+    """
+    Get the power spectra of the latest n raw snapshots.
+
+    The spectra are held in memory, the latest spectrum.history snapshots
+    (n is capped at that), and returned oldest first, only those newer than
+    after if given, so that a display can poll for new rows of its
+    waterfall. Only the comma separated antennas are included if given.
+    format=raw returns a .npz file with the arrays freq (Hz), antennas,
+    timestamp_ns and power_db (float32, snapshots x antennas x bins).
+    """
+    ant = parse_antennas(antennas, config["telescope_config"]["num_antenna"])
+    recent = recent_spectra(n, None if after is None else to_ns(after))
+    if recent is None:
+        raise HTTPException(status_code=404, detail="No spectra available")
+    freq, timestamps_ns, power_db = recent
+    if ant is None:
+        ant = np.arange(power_db.shape[1])
+    power_db = power_db[:, ant]
+    if fmt == "raw":
+        buf = io.BytesIO()
+        np.savez(buf, freq=freq, antennas=ant, timestamp_ns=timestamps_ns, power_db=power_db)
+        return Response(
+            content=buf.getvalue(),
+            media_type="application/octet-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+    return SpectrumWaterfallResponse(
+        freq=(freq / 1e6).tolist(),
+        antennas=ant.tolist(),
+        timestamps=[datetime.fromtimestamp(t / 1e9, UTC) for t in timestamps_ns.tolist()],
+        power=np.round(power_db, 3).tolist(),
+    )
@@ -0,0 +1,127 @@
+"""
+Stream router for TART telescope API.
+
+This module pushes every new visibility frame, and changes of the FPGA
+status, to subscribed clients over a WebSocket or Server-Sent Events,
+instead of clients polling /imaging/vis and /status/fpga.
+"""
+
+import asyncio
+from typing import Annotated, Literal
+
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Query,
+    WebSocket,
+    WebSocketException,
+    status,
+)
+from fastapi.responses import StreamingResponse
+
+from services.vis_stream import stream_hub
+
+from ..dependencies import ConfigDep, parse_antennas
+
+router = APIRouter()
+
+# Comment lines keep idle event streams open through proxies
+SSE_KEEPALIVE_SECONDS = 15
+
+
+async def _wait_disconnect(websocket: WebSocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+async def _send(websocket: WebSocket, sub):
+    while True:
+        _, message = await sub.get()
+        if isinstance(message, bytes):
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_text(message)
+
+
+@router.websocket("/ws")
+async def stream_websocket(
+    websocket: WebSocket,
+    config: ConfigDep,
+    fmt: Annotated[Literal["json", "binary"], Query(alias="format")] = "json",
+    antennas: str | None = None,
+    status_updates: Annotated[bool, Query(alias="status")] = True,
+    calibrated: bool = False,
+):
+    """
+    Live visibilities and FPGA status over a WebSocket.
+
+    Each new frame is sent as it is published, as a JSON text message
+    {"type": "vis", "data": [...], "timestamp": ...} in the layout of
+    /imaging/vis, or with format=binary as a binary message holding a single
+    frame in the format of app.vis_codec. FPGA status changes are sent as
+    JSON text messages {"type": "status", "status": {...}} unless status=false.
+    A raw snapshot taken during the stream is announced by a JSON text message
+    {"type": "gap", "gap_start": ..., "gap_end": ..., "downtime": ...} with
+    the UTC interval in which no visibilities were measured (see
+    /acquire/raw/snapshots).
+    Only baselines between enabled channels, and between the comma separated
+    antennas if given, are included, calibrated with the current gains when
+    calibrated=true. A client that falls behind loses the
+    oldest messages rather than delaying the others.
+    """
+    try:
+        ant = parse_antennas(antennas, config["telescope_config"]["num_antenna"])
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail) from None
+
+    await websocket.accept()
+    with stream_hub.subscribe(fmt, ant, status_updates, calibrated) as sub:
+        tasks = [
+            asyncio.create_task(_wait_disconnect(websocket)),
+            asyncio.create_task(_send(websocket, sub)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+@router.get(
+    "/events",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"text/event-stream": {}},
+            "description": "Server-Sent Events named vis, status and gap with JSON data",
+        },
+        422: {"description": "Invalid antenna list"},
+    },
+)
+async def stream_events(
+    config: ConfigDep,
+    antennas: str | None = None,
+    status_updates: Annotated[bool, Query(alias="status")] = True,
+    calibrated: bool = False,
+):
+    """
+    Live visibilities and FPGA status as Server-Sent Events.
+
+    The same messages as the WebSocket stream in JSON format, as events
+    named vis, status and gap, for clients that cannot use WebSockets.
+    """
+    ant = parse_antennas(antennas, config["telescope_config"]["num_antenna"])
+
+    async def events():
+        with stream_hub.subscribe("json", ant, status_updates, calibrated) as sub:
+            while True:
+                try:
+                    event, message = await asyncio.wait_for(sub.get(), SSE_KEEPALIVE_SECONDS)
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {message}\n\n"
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
@@ -0,0 +1,59 @@
+"""
+Compact binary encoding of visibility frames for the TART telescope API.
+
+A stream starts with a header listing the baselines, followed by one record
+per frame. All values are little-endian.
+
+    header:  4s   magic b"TVF1"
+             u2   number of baselines (B)
+             u2   reserved (0)
+             B x (u1 i, u1 j) baseline antenna indices
+    record:  i8   timestamp in nanoseconds since the UNIX epoch
+             B x c8 visibilities (complex64)
+
+A single frame is a header followed by exactly one record. Its flagged
+baselines are left out of the header, while in a stream of several frames
+the flagged visibilities are NaN.
+"""
+
+import struct
+
+import numpy as np
+
+VIS_MEDIA_TYPE = "application/vnd.tart.vis"
+MAGIC = b"TVF1"
+
+_HEADER = struct.Struct("<4sHH")
+
+
+def encode_header(baselines):
+    baselines = np.asarray(baselines, dtype=np.uint8).reshape(-1, 2)
+    return _HEADER.pack(MAGIC, len(baselines), 0) + baselines.tobytes()
+
+
+def encode_records(timestamps_ns, vis):
+    """Encode a block of frames, vis has shape (len(timestamps_ns), B)."""
+    vis = np.asarray(vis, dtype="<c8")
+    records = np.empty(len(timestamps_ns), dtype=[("t", "<i8"), ("v", "<c8", vis.shape[1:])])
+    records["t"] = timestamps_ns
+    records["v"] = vis
+    return records.tobytes()
+
+
+def decode(buf):
+    """
+    Decode a binary visibility stream.
+
+    Returns:
+        tuple: (baselines (B, 2) int array, timestamps_ns (N,), vis (N, B) complex64)
+    """
+    magic, num_baselines, _ = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Not a TART visibility stream (magic={magic!r})")
+    offset = _HEADER.size
+    baselines = np.frombuffer(buf, dtype=np.uint8, count=2 * num_baselines, offset=offset)
+    offset += baselines.nbytes
+    records = np.frombuffer(
+        buf, dtype=[("t", "<i8"), ("v", "<c8", (num_baselines,))], offset=offset
+    )
+    return baselines.reshape(-1, 2).astype(int), records["t"], records["v"]
@@ -6,136 +6,174 @@ operations while maintaining compatibility with the Flask codebase.
 """
 
 import asyncio
-
-# Import existing database functions to reuse logic
-from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
-import aiosqlite
+from app.config import settings
 
+# Import existing database functions to reuse logic
 from . import operations as db_ops
 
 
 class AsyncDatabase:
-    """Async wrapper for existing SQLite database operations."""
+    """
+    Async wrapper for existing SQLite database operations.
 
-    def __init__(self, db_path: str | None = None):
+    Calls run on a small dedicated thread pool rather than the event loop's
+    default executor, so slow queries cannot starve other blocking work. Each
+    pool thread keeps its own long-lived reader connection.
+    """
+
+    def __init__(self, db_path: str | None = None, max_workers: int | None = None):
         self.db_path = db_ops.get_db_path()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.db_workers,
+            thread_name_prefix="tart-db",
+        )
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
 
-    @asynccontextmanager
-    async def get_connection(self):
-        """Get async database connection."""
-        async with aiosqlite.connect(self.db_path) as conn:
-            yield conn
+    async def close(self) -> None:
+        """Close the pooled connections and stop the executor."""
+        await self._run(db_ops.close_connections)
+        self.executor.shutdown(wait=True)
 
     async def setup_db(self, num_ant: int) -> None:
         """Async wrapper for setup_db - reuses existing logic."""
-        # Run the existing setup_db function in thread pool
-        await asyncio.get_event_loop().run_in_executor(None, db_ops.setup_db, num_ant)
+        await self._run(db_ops.setup_db, num_ant)
 
     async def get_manual_channel_status(self) -> list[dict[str, Any]]:
         """Async wrapper for get_manual_channel_status."""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.get_manual_channel_status
-        )
+        return await self._run(db_ops.get_manual_channel_status)
 
-    async def update_manual_channel_status(self, channel_idx: int, enable: bool) -> None:
+    async def update_manual_channel_status(
+        self, channel_idx: int, enable: bool
+    ) -> tuple[int, list[dict[str, Any]]]:
         """Async wrapper for update_manual_channel_status."""
-        await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.update_manual_channel_status, channel_idx, enable
-        )
+        return await self._run(db_ops.update_manual_channel_status, channel_idx, enable)
+
+    async def get_channel_version(self) -> int:
+        """Async wrapper for get_channel_version."""
+        return await self._run(db_ops.get_channel_version)
+
+    async def update_channels(
+        self, changes: list[tuple[int, bool]]
+    ) -> tuple[int, list[dict[str, Any]]]:
+        """Async wrapper for update_channels."""
+        return await self._run(db_ops.update_channels, changes)
 
     async def get_sample_delay(self) -> float:
         """Async wrapper for get_sample_delay."""
-        return await asyncio.get_event_loop().run_in_executor(None, db_ops.get_sample_delay)
+        return await self._run(db_ops.get_sample_delay)
 
     async def insert_sample_delay(self, timestamp: Any, sample_delay: float) -> int:
         """Async wrapper for insert_sample_delay."""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.insert_sample_delay, timestamp, sample_delay
-        )
+        return await self._run(db_ops.insert_sample_delay, timestamp, sample_delay)
 
     async def get_gain(self) -> dict[int, tuple]:
         """Async wrapper for get_gain."""
-        return await asyncio.get_event_loop().run_in_executor(None, db_ops.get_gain)
+        return await self._run(db_ops.get_gain)
+
+    async def get_gain_at(self, timestamp: Any) -> dict[int, tuple]:
+        """Async wrapper for get_gain_at."""
+        return await self._run(db_ops.get_gain_at, timestamp)
 
-    async def insert_gain(self, gain: list[float], phase: list[float]) -> None:
+    async def get_gain_history(self, limit: int, before: Any = None) -> list[dict[str, Any]]:
+        """Async wrapper for get_gain_history."""
+        return await self._run(db_ops.get_gain_history, limit, before)
+
+    async def get_gain_version(self) -> int:
+        """Async wrapper for get_gain_version."""
+        return await self._run(db_ops.get_gain_version)
+
+    async def insert_gain(self, gain: list[float], phase: list[float]) -> int:
         """Async wrapper for insert_gain."""
 
         def _insert_gain():
-            with db_ops.connect_to_db() as con:
+            with db_ops.write_db() as con:
                 c = con.cursor()
-                db_ops.insert_gain(c, gain, phase)
+                return db_ops.insert_gain(c, gain, phase)
 
-        await asyncio.get_event_loop().run_in_executor(None, _insert_gain)
+        return await self._run(_insert_gain)
 
-    async def insert_raw_file_handle(self, filename: str, checksum: str) -> None:
+    async def insert_raw_file_handle(
+        self,
+        filename: str,
+        checksum: str,
+        checksum_algorithm: str = "sha256",
+        size_bytes: int | None = None,
+    ) -> None:
         """Async wrapper for insert_raw_file_handle."""
-        await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.insert_raw_file_handle, filename, checksum
+        await self._run(
+            db_ops.insert_raw_file_handle,
+            filename,
+            checksum,
+            checksum_algorithm,
+            size_bytes,
         )
 
     async def remove_raw_file_handle_by_id(self, file_id: int) -> None:
         """Async wrapper for remove_raw_file_handle_by_Id."""
-        await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.remove_raw_file_handle_by_id, file_id
-        )
+        await self._run(db_ops.remove_raw_file_handle_by_id, file_id)
 
     async def get_raw_file_handle(self) -> list[dict[str, Any]]:
         """Async wrapper for get_raw_file_handle."""
-        return await asyncio.get_event_loop().run_in_executor(None, db_ops.get_raw_file_handle)
+        return await self._run(db_ops.get_raw_file_handle)
 
     async def update_observation_cache_process_state(self, state: str) -> None:
         """Async wrapper for update_observation_cache_process_state."""
-        await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.update_observation_cache_process_state, state
-        )
+        await self._run(db_ops.update_observation_cache_process_state, state)
 
     async def get_observation_cache_process_state(self) -> dict[str, Any]:
         """Async wrapper for get_observation_cache_process_state."""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.get_observation_cache_process_state
-        )
-
-    async def insert_vis_file_handle(self, filename: str, checksum: str) -> None:
+        return await self._run(db_ops.get_observation_cache_process_state)
+
+    async def insert_vis_file_handle(
+        self,
+        filename: str,
+        checksum: str,
+        checksum_algorithm: str = "sha256",
+        blocks: list[dict[str, Any]] = (),
+        size_bytes: int | None = None,
+    ) -> int:
         """Async wrapper for insert_vis_file_handle."""
-        await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.insert_vis_file_handle, filename, checksum
+        return await self._run(
+            db_ops.insert_vis_file_handle,
+            filename,
+            checksum,
+            checksum_algorithm,
+            blocks,
+            size_bytes,
         )
 
+    async def get_vis_blocks(self, start_ns: int, end_ns: int) -> list[dict[str, Any]]:
+        """Async wrapper for get_vis_blocks."""
+        return await self._run(db_ops.get_vis_blocks, start_ns, end_ns)
+
     async def remove_vis_file_handle_by_id(self, file_id: int) -> None:
         """Async wrapper for remove_vis_file_handle_by_Id."""
-        await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.remove_vis_file_handle_by_id, file_id
-        )
+        await self._run(db_ops.remove_vis_file_handle_by_id, file_id)
 
     async def get_vis_file_handle(self) -> list[dict[str, Any]]:
         """Async wrapper for get_vis_file_handle."""
-        return await asyncio.get_event_loop().run_in_executor(None, db_ops.get_vis_file_handle)
+        return await self._run(db_ops.get_vis_file_handle)
 
     async def update_vis_cache_process_state(self, state: str) -> None:
         """Async wrapper for update_vis_cache_process_state."""
-        await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.update_vis_cache_process_state, state
-        )
+        await self._run(db_ops.update_vis_cache_process_state, state)
 
     async def get_vis_cache_process_state(self) -> dict[str, Any]:
         """Async wrapper for get_vis_cache_process_state."""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.get_vis_cache_process_state
-        )
+        return await self._run(db_ops.get_vis_cache_process_state)
 
     async def get_setting(self, key: str, default: Any = None) -> Any:
         """Async wrapper for get_setting."""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.get_setting, key, default
-        )
+        return await self._run(db_ops.get_setting, key, default)
 
     async def set_setting(self, key: str, value: Any) -> None:
         """Async wrapper for set_setting."""
-        return await asyncio.get_event_loop().run_in_executor(
-            None, db_ops.set_setting, key, value
-        )
+        return await self._run(db_ops.set_setting, key, value)
 
 
 # Global database instance
@@ -0,0 +1,207 @@
+"""
+Versioned schema migrations for the TART web api database.
+
+The schema version is kept in SQLite's user_version. Each migration runs in
+its own transaction and bumps the version, so an interrupted upgrade
+resumes where it stopped. Migrations are never edited once released; add a
+new one to change the schema.
+
+Databases created before versioning report version 0. The early migrations
+are written to be idempotent so they also apply cleanly to those.
+"""
+
+import logging
+from datetime import UTC, datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+def to_ns(timestamp):
+    """Convert an aware datetime to integer nanoseconds since the UNIX epoch."""
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10**9 + delta.microseconds * 1000
+
+
+def text_to_ns(text):
+    """Convert a stored ISO timestamp to nanoseconds, or None if it cannot be parsed."""
+    try:
+        timestamp = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+    if timestamp.tzinfo is None:
+        # v1 databases stored naive timestamps, which were always UTC
+        timestamp = timestamp.replace(tzinfo=UTC)
+    return to_ns(timestamp)
+
+
+def add_column_if_missing(c, table, column, decl):
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def initial_schema(c):
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS raw_data (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, filename TEXT, checksum TEXT)"
+    )
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS observation_cache_process (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, state TEXT)"
+    )
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS vis_data (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, filename TEXT, checksum TEXT)"
+    )
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS vis_cache_process (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, state TEXT)"
+    )
+    c.execute("CREATE TABLE IF NOT EXISTS sample_delay (utc_timestamp TEXT, delay REAL)")
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS calibration (utc_timestamp TEXT, antenna INTEGER, g_abs REAL, g_phase REAL)"
+    )
+    c.execute("CREATE TABLE IF NOT EXISTS channels (channel_id INTEGER, enabled BOOLEAN)")
+    c.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def file_metadata(c):
+    # Checksum algorithm and size of each file
+    add_column_if_missing(c, "raw_data", "checksum_algorithm", "TEXT DEFAULT 'sha256'")
+    add_column_if_missing(c, "vis_data", "checksum_algorithm", "TEXT DEFAULT 'sha256'")
+    add_column_if_missing(c, "raw_data", "size_bytes", "INTEGER")
+    add_column_if_missing(c, "vis_data", "size_bytes", "INTEGER")
+    # Time index of the frame blocks in vis files
+    add_column_if_missing(c, "vis_data", "start_ns", "INTEGER")
+    add_column_if_missing(c, "vis_data", "end_ns", "INTEGER")
+    add_column_if_missing(c, "vis_data", "n_frames", "INTEGER")
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS vis_blocks (vis_id INTEGER, block INTEGER, start_ns INTEGER, end_ns INTEGER, frame_offset INTEGER, n_frames INTEGER, vis_offset INTEGER, vis_nbytes INTEGER, ts_offset INTEGER, ts_nbytes INTEGER)"
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS vis_blocks_start_ns ON vis_blocks(start_ns)")
+    c.execute("CREATE INDEX IF NOT EXISTS vis_blocks_vis_id ON vis_blocks(vis_id)")
+
+
+TIMESTAMPED_TABLES = ("raw_data", "vis_data", "sample_delay", "calibration")
+
+
+def integer_timestamps(c):
+    """Add indexed nanosecond timestamps, backfilled from the text timestamps."""
+    for table in TIMESTAMPED_TABLES:
+        add_column_if_missing(c, table, "ts_ns", "INTEGER")
+        c.execute(f"SELECT rowid, utc_timestamp FROM {table} WHERE ts_ns IS NULL")
+        rows = c.fetchall()
+        c.executemany(
+            f"UPDATE {table} SET ts_ns = ? WHERE rowid = ?",
+            [(text_to_ns(text), rowid) for rowid, text in rows],
+        )
+        logger.info("Backfilled ts_ns for %d rows of %s", len(rows), table)
+    c.execute("CREATE INDEX IF NOT EXISTS raw_data_ts_ns ON raw_data(ts_ns)")
+    c.execute("CREATE INDEX IF NOT EXISTS vis_data_ts_ns ON vis_data(ts_ns)")
+    c.execute("CREATE INDEX IF NOT EXISTS sample_delay_ts_ns ON sample_delay(ts_ns)")
+    # Covers the lookup of a whole calibration set, in antenna order
+    c.execute("CREATE INDEX IF NOT EXISTS calibration_ts_ns ON calibration(ts_ns, antenna)")
+
+
+def pack_array(values):
+    """Pack per-antenna values into a BLOB of little-endian doubles."""
+    return np.asarray(values, dtype="<f8").tobytes()
+
+
+def calibration_sets(c):
+    """
+    Store each calibration as one row, with the gains and phases of all
+    antennas packed into BLOBs, and drop consecutive duplicate sets.
+    """
+    c.execute(
+        "CREATE TABLE calibration_sets (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, ts_ns INTEGER, num_ant INTEGER, gains BLOB, phases BLOB)"
+    )
+    c.execute("CREATE INDEX calibration_sets_ts_ns ON calibration_sets(ts_ns)")
+
+    c.execute(
+        "SELECT utc_timestamp, ts_ns, g_abs, g_phase FROM calibration ORDER BY ts_ns, antenna"
+    )
+    sets = {}
+    for timestamp, ts_ns, g_abs, g_phase in c.fetchall():
+        sets.setdefault(ts_ns, (timestamp, [], []))
+        sets[ts_ns][1].append(g_abs)
+        sets[ts_ns][2].append(g_phase)
+    c.executemany(
+        "INSERT INTO calibration_sets(utc_timestamp, ts_ns, num_ant, gains, phases) VALUES (?,?,?,?,?)",
+        [
+            (timestamp, ts_ns, len(gains), pack_array(gains), pack_array(phases))
+            for ts_ns, (timestamp, gains, phases) in sets.items()
+        ],
+    )
+    c.execute("DROP TABLE calibration")
+    removed = compact_calibration_sets(c)
+    logger.info("Converted %d calibration sets, %d duplicates removed", len(sets), removed)
+
+
+def compact_calibration_sets(c):
+    """
+    Remove calibration sets identical to the set before them. Lookups by
+    time return the same values afterwards, since the earlier set covers
+    the period of the duplicate.
+
+    Returns:
+        int: the number of sets removed
+    """
+    c.execute(
+        "DELETE FROM calibration_sets WHERE Id IN ("
+        "SELECT Id FROM (SELECT Id, gains, phases,"
+        " LAG(gains) OVER (ORDER BY ts_ns) AS prev_gains,"
+        " LAG(phases) OVER (ORDER BY ts_ns) AS prev_phases"
+        " FROM calibration_sets)"
+        " WHERE gains = prev_gains AND phases = prev_phases)"
+    )
+    return c.rowcount
+
+
+def flag_blocks(c):
+    """Byte offsets of the flag chunks of the frame blocks, NULL in files from before flagging."""
+    add_column_if_missing(c, "vis_blocks", "flags_offset", "INTEGER")
+    add_column_if_missing(c, "vis_blocks", "flags_nbytes", "INTEGER")
+
+
+# (version, migration), in order
+MIGRATIONS = (
+    (1, initial_schema),
+    (2, file_metadata),
+    (3, integer_timestamps),
+    (4, calibration_sets),
+    (5, flag_blocks),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(con):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(con):
+    """
+    Bring the database up to SCHEMA_VERSION.
+
+    Args:
+        con: a connection in autocommit mode (isolation_level=None)
+
+    Returns:
+        int: the number of migrations applied
+    """
+    applied = 0
+    for version, migration in MIGRATIONS:
+        # Re-read under the write lock, another process may have migrated
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(con) < version:
+                migration(con.cursor())
+                con.execute(f"PRAGMA user_version = {version}")
+                logger.info("Migrated database to version %d (%s)", version, migration.__name__)
+                applied += 1
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+    return applied
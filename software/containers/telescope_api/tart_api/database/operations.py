@@ -2,63 +2,148 @@ import json
 import logging
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 
+import numpy as np
 from tart.util import utc
 
 from app.config import settings
 
+from .migrations import migrate, pack_array, to_ns
+
 
 def get_db_path():
     return os.path.join(settings.data_root, "tart_web_api_database_v2.db")
 
 
-def connect_to_db():
-    # v1 none utc timestamps
-    # v2 utc timestamps!
-    con = None
-    try:
-        db_path = get_db_path()
-        con = sqlite3.connect(db_path)
-    except Exception as e:
-        logging.error("Database connection failed: %s (%s)", e, type(e).__name__)
-        logging.debug("Exception args: %s", e.args)
-    return con
+# Applied to every connection. WAL lets readers run alongside the writer,
+# and synchronous=NORMAL only risks the last transactions on power loss.
+PRAGMAS = (
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8192",
+    "PRAGMA mmap_size=67108864",
+)
+# Prepared statements kept per connection
+CACHED_STATEMENTS = 256
+
+
+class _Connections:
+    """
+    Long-lived connections of one process.
+
+    Each thread gets its own reader connection, and all writes in the process
+    go through a single writer connection guarded by a lock. Connections are
+    never shared across a fork; a child process opens its own on first use.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.writer_con = None
+        self.write_lock = threading.Lock()
+        self.open = []
+        self.open_lock = threading.Lock()
+
+    def connect(self, **kwargs):
+        # v1 none utc timestamps
+        # v2 utc timestamps!
+        try:
+            con = sqlite3.connect(
+                get_db_path(),
+                check_same_thread=False,
+                cached_statements=CACHED_STATEMENTS,
+                **kwargs,
+            )
+            for pragma in PRAGMAS:
+                con.execute(pragma)
+        except Exception as e:
+            logging.error("Database connection failed: %s (%s)", e, type(e).__name__)
+            logging.debug("Exception args: %s", e.args)
+            raise
+        with self.open_lock:
+            self.open.append(con)
+        return con
+
+    def writer(self):
+        if self.writer_con is None:
+            # Transactions are managed explicitly, see write_db()
+            self.writer_con = self.connect(isolation_level=None)
+        return self.writer_con
+
+    def reader(self):
+        con = getattr(self.local, "con", None)
+        if con is None:
+            con = self.local.con = self.connect()
+        return con
+
+    def close(self):
+        with self.open_lock:
+            for con in self.open:
+                con.close()
+            self.open = []
+        self.local = threading.local()
+        self.writer_con = None
+
+
+_connections = None
+
+
+def connections():
+    global _connections
+    if _connections is None or _connections.pid != os.getpid():
+        _connections = _Connections()
+    return _connections
+
+
+@contextmanager
+def read_db():
+    """This thread's connection, for queries."""
+    yield connections().reader()
+
+
+@contextmanager
+def write_db():
+    """The process' writer connection, inside a transaction that commits on exit."""
+    conns = connections()
+    with conns.write_lock:
+        con = conns.writer()
+        # Take the write lock up front, so concurrent writers from other
+        # processes wait on busy_timeout rather than failing to upgrade
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+        except BaseException:
+            con.rollback()
+            raise
+        con.commit()
+
+
+def close_connections():
+    """Close all connections opened by this process."""
+    if _connections is not None and _connections.pid == os.getpid():
+        _connections.close()
 
 
 def setup_db(num_ant):
-    with connect_to_db() as con:
-        c = con.cursor()
-        c.execute(
-            "CREATE TABLE IF NOT EXISTS raw_data (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, filename TEXT, checksum TEXT)"
-        )
-        c.execute(
-            "CREATE TABLE IF NOT EXISTS observation_cache_process (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, state TEXT)"
-        )
-        c.execute(
-            "CREATE TABLE IF NOT EXISTS vis_data (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, filename TEXT, checksum TEXT)"
-        )
-        c.execute(
-            "CREATE TABLE IF NOT EXISTS vis_cache_process (Id INTEGER PRIMARY KEY, utc_timestamp TEXT, state TEXT)"
-        )
-        c.execute("CREATE TABLE IF NOT EXISTS sample_delay (utc_timestamp TEXT, delay REAL)")
-        c.execute(
-            "CREATE TABLE IF NOT EXISTS calibration (utc_timestamp TEXT, antenna INTEGER, g_abs REAL, g_phase REAL)"
-        )
-        c.execute("CREATE TABLE IF NOT EXISTS channels (channel_id INTEGER, enabled BOOLEAN)")
-        c.execute(
-            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)"
-        )
-    with connect_to_db() as con:
+    conns = connections()
+    with conns.write_lock:
+        migrate(conns.writer())
+
+    with write_db() as con:
         c = con.cursor()
         c.execute("SELECT * FROM channels;")
         if len(c.fetchall()) == 0:
             ch = [(i, 1) for i in range(num_ant)]
             c.executemany("INSERT INTO channels(channel_id, enabled) values (?, ?)", ch)
 
-    with connect_to_db() as con:
+    with write_db() as con:
         c = con.cursor()
-        c.execute("SELECT * FROM calibration;")
-        if len(c.fetchall()) == 0:
+        c.execute("SELECT 1 FROM calibration_sets LIMIT 1;")
+        if c.fetchone() is None:
             g = [
                 1,
             ] * num_ant
@@ -69,7 +154,7 @@ def setup_db(num_ant):
 
 
 def get_manual_channel_status():
-    with connect_to_db() as con:
+    with read_db() as con:
         c = con.cursor()
         c.execute("SELECT * FROM channels;")
         rows = c.fetchall()
@@ -78,19 +163,51 @@ def get_manual_channel_status():
 
 
 def update_manual_channel_status(channel_idx, enable):
-    with connect_to_db() as con:
+    return update_channels([(channel_idx, enable)])
+
+
+CHANNEL_VERSION_KEY = "channel_config_version"
+
+
+def get_channel_version():
+    """The channel configuration version, bumped by every channel update."""
+    return get_setting(CHANNEL_VERSION_KEY, 0)
+
+
+def update_channels(changes):
+    """
+    Apply channel enable changes in one transaction and bump the channel
+    configuration version. Unknown channels are ignored.
+
+    Args:
+        changes: iterable of (channel_id, enabled)
+
+    Returns:
+        tuple: (version, channel status rows as from get_manual_channel_status)
+    """
+    with write_db() as con:
         c = con.cursor()
-        c.execute(
+        c.executemany(
             "UPDATE channels SET enabled = ? WHERE channel_id = ?",
-            (enable, channel_idx),
+            [(bool(enable), int(channel_idx)) for channel_idx, enable in changes],
+        )
+        c.execute(
+            "INSERT INTO settings (key, value) VALUES (?, '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+            (CHANNEL_VERSION_KEY,),
         )
+        c.execute("SELECT value FROM settings WHERE key = ?", (CHANNEL_VERSION_KEY,))
+        version = json.loads(c.fetchone()[0])
+        c.execute("SELECT channel_id, enabled FROM channels ORDER BY channel_id")
+        rows = [{"channel_id": row[0], "enabled": row[1]} for row in c.fetchall()]
+    return version, rows
 
 
 def get_sample_delay():
     ret = 0
-    with connect_to_db() as con:
+    with read_db() as con:
         c = con.cursor()
-        c.execute("SELECT * FROM sample_delay ORDER BY datetime(utc_timestamp) DESC LIMIT 1")
+        c.execute("SELECT utc_timestamp, delay FROM sample_delay ORDER BY ts_ns DESC LIMIT 1")
         rows = c.fetchall()
         if len(rows) == 0:
             ret = 0
@@ -100,10 +217,10 @@ def get_sample_delay():
 
 
 def insert_sample_delay(timestamp, sample_delay):
-    with connect_to_db() as con:
+    with write_db() as con:
         c = con.cursor()
-        sql = "INSERT INTO sample_delay(utc_timestamp, delay) values (?, ?)"
-        c.execute(sql, (utc.to_string(timestamp), sample_delay))
+        sql = "INSERT INTO sample_delay(utc_timestamp, ts_ns, delay) values (?, ?, ?)"
+        c.execute(sql, (utc.to_string(timestamp), to_ns(timestamp), sample_delay))
     return 1
 
 
@@ -113,26 +230,97 @@ def insert_sample_delay(timestamp, sample_delay):
 
 
 def insert_gain(c, g, ph):
+    """
+    Record a calibration set, unless it is identical to the latest one.
+
+    Returns:
+        int: the gains version, see get_gain_version()
+    """
     utc_date = utc.now()
-    for ant_i in range(len(g)):
+    c.execute(
+        "INSERT INTO calibration_sets(utc_timestamp, ts_ns, num_ant, gains, phases) "
+        "SELECT :timestamp, :ts_ns, :num_ant, :gains, :phases WHERE NOT EXISTS ("
+        "SELECT 1 FROM (SELECT gains, phases FROM calibration_sets ORDER BY ts_ns DESC LIMIT 1) "
+        "WHERE gains = :gains AND phases = :phases)",
+        {
+            "timestamp": utc.to_string(utc_date),
+            "ts_ns": to_ns(utc_date),
+            "num_ant": len(g),
+            "gains": pack_array(g),
+            "phases": pack_array(ph),
+        },
+    )
+    c.execute("SELECT MAX(ts_ns) FROM calibration_sets")
+    return c.fetchone()[0]
+
+
+def get_gain_version():
+    """The gains version, the ts_ns of the latest calibration set."""
+    with read_db() as con:
+        c = con.cursor()
+        c.execute("SELECT MAX(ts_ns) FROM calibration_sets")
+        return c.fetchone()[0] or 0
+
+
+def calibration_set(row):
+    timestamp, gains, phases = row
+    return {
+        "timestamp": utc.from_string(timestamp),
+        "gain": np.frombuffer(gains, dtype="<f8").tolist(),
+        "phase_offset": np.frombuffer(phases, dtype="<f8").tolist(),
+    }
+
+
+def gain_rows(row):
+    """A calibration set as {antenna: (utc_timestamp, antenna, g_abs, g_phase)}."""
+    if row is None:
+        return {}
+    cal = calibration_set(row)
+    return {
+        ant: (row[0], ant, g, ph)
+        for ant, (g, ph) in enumerate(zip(cal["gain"], cal["phase_offset"], strict=True))
+    }
+
+
+def get_gain():
+    with read_db() as con:
+        c = con.cursor()
         c.execute(
-            "INSERT INTO calibration VALUES (?,?,?,?)",
-            (utc.to_string(utc_date), ant_i, g[ant_i], ph[ant_i]),
+            "SELECT utc_timestamp, gains, phases FROM calibration_sets ORDER BY ts_ns DESC LIMIT 1"
         )
+        row = c.fetchone()
+    return gain_rows(row)
 
 
-def get_gain():
-    rows_dict = {}
-    with connect_to_db() as con:
+def get_gain_at(timestamp):
+    """The calibration that was current at timestamp, in the same form as get_gain()."""
+    with read_db() as con:
         c = con.cursor()
         c.execute(
-            "SELECT utc_timestamp, antenna, g_abs, g_phase from calibration WHERE utc_timestamp = (SELECT MAX(utc_timestamp) FROM calibration) ORDER BY antenna;"
+            "SELECT utc_timestamp, gains, phases FROM calibration_sets WHERE ts_ns <= ? ORDER BY ts_ns DESC LIMIT 1",
+            (to_ns(timestamp),),
         )
-        rows = c.fetchall()
-        for row in rows:
-            rows_dict[row[1]] = row
+        row = c.fetchone()
+    return gain_rows(row)
 
-    return rows_dict
+
+def get_gain_history(limit, before=None):
+    """
+    Calibration sets, newest first, at most limit of them and optionally
+    only those older than before.
+
+    Returns:
+        list: of dicts with timestamp, gain and phase_offset
+    """
+    before_ns = 2**63 - 1 if before is None else to_ns(before)
+    with read_db() as con:
+        c = con.cursor()
+        c.execute(
+            "SELECT utc_timestamp, gains, phases FROM calibration_sets WHERE ts_ns < ? ORDER BY ts_ns DESC LIMIT ?",
+            (before_ns, int(limit)),
+        )
+        rows = c.fetchall()
+    return [calibration_set(row) for row in rows]
 
 
 ####################
@@ -140,33 +328,43 @@ def get_gain():
 ####################
 
 
-def insert_raw_file_handle(filename, checksum):
-    with connect_to_db() as con:
+def insert_raw_file_handle(filename, checksum, checksum_algorithm="sha256", size_bytes=None):
+    with write_db() as con:
         c = con.cursor()
         timestamp = utc.now()
         c.execute(
-            "INSERT INTO raw_data(utc_timestamp, filename, checksum) VALUES (?,?,?)",
-            (utc.to_string(timestamp), filename, checksum),
+            "INSERT INTO raw_data(utc_timestamp, ts_ns, filename, checksum, checksum_algorithm, size_bytes) VALUES (?,?,?,?,?,?)",
+            (
+                utc.to_string(timestamp),
+                to_ns(timestamp),
+                filename,
+                checksum,
+                checksum_algorithm,
+                size_bytes,
+            ),
         )
 
 
 def remove_raw_file_handle_by_id(file_id):
-    with connect_to_db() as con:
+    with write_db() as con:
         c = con.cursor()
         c.execute("DELETE FROM raw_data WHERE Id=?", (file_id,))
 
 
 def get_raw_file_handle():
     ret = ""
-    with connect_to_db() as con:
+    with read_db() as con:
         c = con.cursor()
-        c.execute("SELECT * FROM raw_data ORDER BY utc_timestamp DESC")
+        c.execute(
+            "SELECT Id, utc_timestamp, filename, checksum, checksum_algorithm FROM raw_data ORDER BY ts_ns DESC"
+        )
         rows = c.fetchall()
         ret = [
             {
                 "filename": row[2],
                 "timestamp": utc.from_string(row[1]),
                 "checksum": row[3],
+                "checksum_algorithm": row[4] or "sha256",
                 "Id": row[0],
             }
             for row in rows
@@ -175,7 +373,7 @@ def get_raw_file_handle():
 
 
 def update_observation_cache_process_state(state):
-    with connect_to_db() as con:
+    with write_db() as con:
         c = con.cursor()
         ts = utc.now()
         c.execute(
@@ -185,7 +383,7 @@ def update_observation_cache_process_state(state):
 
 
 def get_observation_cache_process_state():
-    with connect_to_db() as con:
+    with read_db() as con:
         c = con.cursor()
         c.execute("SELECT * FROM observation_cache_process")
         rows = c.fetchall()
@@ -201,33 +399,89 @@ def get_observation_cache_process_state():
 ###########################
 
 
-def insert_vis_file_handle(filename, checksum):
-    with connect_to_db() as con:
+def insert_vis_file_handle(
+    filename, checksum, checksum_algorithm="sha256", blocks=(), size_bytes=None
+):
+    """
+    Record a visibility file, together with the time index of its frame blocks.
+
+    Each block is a dict with the block number, start_ns, end_ns, frame_offset,
+    n_frames and the byte offset/size of its vis and timestamp_ns chunks.
+    """
+    with write_db() as con:
         c = con.cursor()
         timestamp = utc.now()
         c.execute(
-            "INSERT INTO vis_data(utc_timestamp, filename, checksum) VALUES (?,?,?)",
-            (utc.to_string(timestamp), filename, checksum),
+            "INSERT INTO vis_data(utc_timestamp, ts_ns, filename, checksum, checksum_algorithm, size_bytes, start_ns, end_ns, n_frames) VALUES (?,?,?,?,?,?,?,?,?)",
+            (
+                utc.to_string(timestamp),
+                to_ns(timestamp),
+                filename,
+                checksum,
+                checksum_algorithm,
+                size_bytes,
+                min((b["start_ns"] for b in blocks), default=None),
+                max((b["end_ns"] for b in blocks), default=None),
+                sum(b["n_frames"] for b in blocks),
+            ),
+        )
+        vis_id = c.lastrowid
+        c.executemany(
+            "INSERT INTO vis_blocks VALUES (:vis_id, :block, :start_ns, :end_ns, :frame_offset, :n_frames, :vis_offset, :vis_nbytes, :ts_offset, :ts_nbytes, :flags_offset, :flags_nbytes)",
+            [dict(b, vis_id=vis_id) for b in blocks],
         )
+    return vis_id
 
 
 def remove_vis_file_handle_by_id(file_id):
-    with connect_to_db() as con:
+    with write_db() as con:
         c = con.cursor()
+        c.execute("DELETE FROM vis_blocks WHERE vis_id=?", (file_id,))
         c.execute("DELETE FROM vis_data WHERE Id=?", (file_id,))
 
 
+def get_vis_blocks(start_ns, end_ns):
+    """Return the indexed frame blocks that overlap [start_ns, end_ns], oldest first."""
+    with read_db() as con:
+        c = con.cursor()
+        c.execute(
+            "SELECT d.filename, b.block, b.start_ns, b.end_ns, b.n_frames, b.vis_offset, b.vis_nbytes, b.ts_offset, b.ts_nbytes, "
+            "b.flags_offset, b.flags_nbytes "
+            "FROM vis_blocks b JOIN vis_data d ON d.Id = b.vis_id "
+            "WHERE b.start_ns <= ? AND b.end_ns >= ? ORDER BY b.start_ns",
+            (int(end_ns), int(start_ns)),
+        )
+        keys = [
+            "filename",
+            "block",
+            "start_ns",
+            "end_ns",
+            "n_frames",
+            "vis_offset",
+            "vis_nbytes",
+            "ts_offset",
+            "ts_nbytes",
+            "flags_offset",
+            "flags_nbytes",
+        ]
+        ret = [dict(zip(keys, row, strict=True)) for row in c.fetchall()]
+    return ret
+
+
 def get_vis_file_handle():
     ret = ""
-    with connect_to_db() as con:
+    with read_db() as con:
         c = con.cursor()
-        c.execute("SELECT * FROM vis_data ORDER BY utc_timestamp DESC")
+        c.execute(
+            "SELECT Id, utc_timestamp, filename, checksum, checksum_algorithm FROM vis_data ORDER BY ts_ns DESC"
+        )
         rows = c.fetchall()
         ret = [
             {
                 "filename": row[2],
                 "timestamp": utc.from_string(row[1]),
                 "checksum": row[3],
+                "checksum_algorithm": row[4] or "sha256",
                 "Id": row[0],
             }
             for row in rows
@@ -236,7 +490,7 @@ def get_vis_file_handle():
 
 
 def update_vis_cache_process_state(state):
-    with connect_to_db() as con:
+    with write_db() as con:
         c = con.cursor()
         ts = utc.now()
         c.execute(
@@ -246,7 +500,7 @@ def update_vis_cache_process_state(state):
 
 
 def get_vis_cache_process_state():
-    with connect_to_db() as con:
+    with read_db() as con:
         c = con.cursor()
         c.execute("SELECT * FROM vis_cache_process")
         rows = c.fetchall()
@@ -257,6 +511,45 @@ def get_vis_cache_process_state():
     return ret
 
 
+###############
+#  Retention  #
+###############
+
+FILE_TABLES = {"raw": "raw_data", "vis": "vis_data"}
+
+
+def get_file_catalog(product):
+    """All files of a product type (raw or vis), newest first."""
+    table = FILE_TABLES[product]
+    with read_db() as con:
+        c = con.cursor()
+        c.execute(
+            f"SELECT Id, utc_timestamp, filename, size_bytes FROM {table} ORDER BY ts_ns DESC"
+        )
+        rows = c.fetchall()
+        ret = [
+            {
+                "Id": row[0],
+                "timestamp": utc.from_string(row[1]),
+                "filename": row[2],
+                "size_bytes": row[3],
+            }
+            for row in rows
+        ]
+    return ret
+
+
+def remove_file_handles(product, file_ids):
+    """Remove the catalog entries of several files in a single transaction."""
+    table = FILE_TABLES[product]
+    params = [(file_id,) for file_id in file_ids]
+    with write_db() as con:
+        c = con.cursor()
+        if product == "vis":
+            c.executemany("DELETE FROM vis_blocks WHERE vis_id=?", params)
+        c.executemany(f"DELETE FROM {table} WHERE Id=?", params)
+
+
 ################
 #  Settings    #
 ################
@@ -264,7 +557,7 @@ def get_vis_cache_process_state():
 
 def get_setting(key, default=None):
     """Get a setting value by key. Values are stored as JSON."""
-    with connect_to_db() as con:
+    with read_db() as con:
         c = con.cursor()
         c.execute("SELECT value FROM settings WHERE key = ?", (key,))
         row = c.fetchone()
@@ -275,7 +568,7 @@ def get_setting(key, default=None):
 
 def set_setting(key, value):
     """Set a setting value by key. Values are stored as JSON."""
-    with connect_to_db() as con:
+    with write_db() as con:
         c = con.cursor()
         c.execute(
             "INSERT INTO settings (key, value) VALUES (?, ?) "
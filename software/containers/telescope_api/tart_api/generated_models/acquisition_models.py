@@ -74,6 +74,7 @@ class TelescopeMode(StrEnum):
     vis_save = "vis_save"
     cal = "cal"
     rt_syn_img = "rt_syn_img"
+    spectrum = "spectrum"
 
 
 class LoopMode(StrEnum):
@@ -172,6 +173,66 @@ class SyncAcquireAtSecondsResponse(BaseModel):
     """
 
 
+class SnapshotScheduleResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    snapshot_schedule: BinaryFlag
+    """
+    Schedule flag: 1=in the vis modes, take a raw snapshot at each sync_acquire_at_seconds mark
+    """
+
+
+class RawSnapshotRequestResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    requested_at: UTCTimestamp
+    """
+    UTC time of the request
+    """
+
+
+class RawSnapshot(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    timestamp: UTCTimestamp
+    """
+    UTC start of the raw capture
+    """
+    gap_start: UTCTimestamp
+    """
+    UTC time the correlator was stopped
+    """
+    gap_end: UTCTimestamp
+    """
+    UTC time the correlator was re-armed
+    """
+    downtime: Annotated[float, Field(ge=0.0)]
+    """
+    Seconds without visibilities, gap_end - gap_start
+    """
+    num_samples: Annotated[int, Field(ge=0)]
+    """
+    Samples captured per antenna
+    """
+    filename: str | None
+    """
+    The saved observation, if raw saving is on
+    """
+
+
+class RawSnapshotsResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    snapshots: list[RawSnapshot]
+    """
+    The latest snapshots, oldest first
+    """
+
+
 class SaveFlagResponse(BaseModel):
     model_config = ConfigDict(
         extra="forbid",
@@ -7,7 +7,8 @@
 
 from __future__ import annotations
 from typing import Annotated, Any
-from pydantic import BaseModel, ConfigDict, Field, RootModel
+from pydantic import AwareDatetime, BaseModel, ConfigDict, Field, RootModel
+from enum import StrEnum
 
 
 class Model(RootModel[Any]):
@@ -56,6 +57,81 @@ class GetGainResponse(BaseModel):
     """
 
 
+class CalibrationSet(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    timestamp: AwareDatetime
+    """
+    UTC time from which this calibration applies
+    """
+    gain: list[float]
+    """
+    List of channel gains
+    """
+    phase_offset: list[float]
+    """
+    List of channel phase offsets in radians
+    """
+
+
+class GainHistoryResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    items: list[CalibrationSet]
+    """
+    Calibration sets, newest first
+    """
+    next_before: AwareDatetime | None
+    """
+    Pass as 'before' to fetch the next (older) page, null on the last page
+    """
+
+
+class SkyModel(StrEnum):
+    """
+    Sky model: the configured sources, or a point source in the brightest direction
+    """
+
+    sources = "sources"
+    brightest = "brightest"
+
+
+class CalibrationStatusResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    timestamp: AwareDatetime
+    """
+    UTC timestamp of the last frame used in the solution
+    """
+    frames: Annotated[int, Field(ge=1)]
+    """
+    Number of frames averaged
+    """
+    sky_model: SkyModel
+    """
+    Sky model: the configured sources, or a point source in the brightest direction
+    """
+    iterations: Annotated[int, Field(ge=1)]
+    """
+    Solver iterations
+    """
+    converged: bool
+    """
+    Whether the gains converged within the tolerance
+    """
+    residual: float
+    """
+    Norm of the data minus the calibrated model, relative to the data
+    """
+    solve_ms: float
+    """
+    Time taken to solve, in milliseconds
+    """
+
+
 class EmptyResponse(BaseModel):
     model_config = ConfigDict(
         extra="forbid",
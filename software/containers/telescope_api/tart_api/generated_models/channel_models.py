@@ -74,6 +74,7 @@ class TelescopeMode(StrEnum):
     vis_save = "vis_save"
     cal = "cal"
     rt_syn_img = "rt_syn_img"
+    spectrum = "spectrum"
 
 
 class LoopMode(StrEnum):
@@ -174,6 +175,47 @@ class ChannelStatusResponse(RootModel[list[ChannelStatus]]):
     root: list[ChannelStatus]
 
 
+class ChannelMaskUpdate(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    mask: list[BinaryFlag]
+    """
+    Enable flag of every channel, in channel order
+    """
+
+
+class ChannelChangesUpdate(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    changes: Annotated[list[ChannelStatus], Field(min_length=1)]
+    """
+    Channels to change, the others are left as they are
+    """
+
+
+class ChannelBulkUpdateRequest(RootModel[ChannelMaskUpdate | ChannelChangesUpdate]):
+    root: ChannelMaskUpdate | ChannelChangesUpdate
+    """
+    Either a full mask or a list of changes, applied in one transaction
+    """
+
+
+class ChannelBulkUpdateResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    version: Annotated[int, Field(ge=0)]
+    """
+    Channel configuration version after the update
+    """
+    channels: list[ChannelStatus]
+    """
+    Status of every channel after the update
+    """
+
+
 class ChannelToggleResponse(RootModel[dict[constr(pattern=r"^[0-9]+$"), BinaryFlag]]):
     root: dict[constr(pattern=r"^[0-9]+$"), BinaryFlag]
 
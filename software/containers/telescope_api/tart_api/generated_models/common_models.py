@@ -74,6 +74,7 @@ class TelescopeMode(StrEnum):
     vis_save = "vis_save"
     cal = "cal"
     rt_syn_img = "rt_syn_img"
+    spectrum = "spectrum"
 
 
 class LoopMode(StrEnum):
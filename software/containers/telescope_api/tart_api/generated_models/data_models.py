@@ -8,12 +8,22 @@
 from __future__ import annotations
 from typing import Any
 from pydantic import BaseModel, ConfigDict, RootModel
+from enum import StrEnum
 
 
 class Model(RootModel[Any]):
     root: Any
 
 
+class ChecksumAlgorithm(StrEnum):
+    """
+    Hash algorithm used to compute the checksum
+    """
+
+    sha256 = "sha256"
+    blake2b = "blake2b"
+
+
 class FileHandle(BaseModel):
     model_config = ConfigDict(
         extra="forbid",
@@ -24,7 +34,11 @@ class FileHandle(BaseModel):
     """
     checksum: str
     """
-    SHA256 checksum
+    File checksum (hex digest)
+    """
+    checksum_algorithm: ChecksumAlgorithm | None
+    """
+    Hash algorithm used to compute the checksum
     """
     timestamp: str
     """
@@ -8,6 +8,7 @@
 from __future__ import annotations
 from typing import Annotated, Any
 from pydantic import AwareDatetime, BaseModel, ConfigDict, Field, RootModel
+from enum import StrEnum
 
 
 class Model(RootModel[Any]):
@@ -53,6 +54,67 @@ class TimestampResponse(RootModel[AwareDatetime]):
     """
 
 
+class SkyMapResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    timestamp: AwareDatetime
+    """
+    UTC timestamp of the visibilities that were mapped
+    """
+    nside: Annotated[int, Field(ge=1)]
+    """
+    HEALPix resolution parameter
+    """
+    map: list[float]
+    """
+    Brightness of the HEALPix pixels above the horizon in RING order, with the zenith as the pole and azimuth from north through east
+    """
+
+
+class Units(StrEnum):
+    """
+    Units of the coordinates
+    """
+
+    wavelengths = "wavelengths"
+    metres = "metres"
+
+
+class Baseline(RootModel[list[int]]):
+    root: Annotated[list[int], Field(max_length=2, min_length=2)]
+
+
+class UvwItem(RootModel[list[float]]):
+    root: Annotated[list[float], Field(max_length=3, min_length=3)]
+
+
+class UVWResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    version: Annotated[int, Field(ge=0)]
+    """
+    Version of the antenna positions the coordinates were computed from
+    """
+    units: Units
+    """
+    Units of the coordinates
+    """
+    baselines: list[Baseline]
+    """
+    Antenna pairs [i, j], i < j, in the order of the visibilities
+    """
+    timestamps: list[AwareDatetime]
+    """
+    UTC times of the samples
+    """
+    uvw: list[list[UvwItem]]
+    """
+    [u, v, w] of each baseline (position i minus position j) at each time
+    """
+
+
 class EmptyResponse(BaseModel):
     model_config = ConfigDict(
         extra="forbid",
@@ -166,6 +166,7 @@ class TelescopeMode(StrEnum):
     vis_save = "vis_save"
     cal = "cal"
     rt_syn_img = "rt_syn_img"
+    spectrum = "spectrum"
 
 
 class LoopMode(StrEnum):
@@ -322,6 +323,117 @@ class StatusChannelSingleResponse(BaseModel):
     """
 
 
+class Metric(StrEnum):
+    """
+    Metric that crossed its threshold
+    """
+
+    amplitude_ratio = "amplitude_ratio"
+    radio_mean = "radio_mean"
+    closure_phase_excess = "closure_phase_excess"
+    zscore = "zscore"
+
+
+class Antenna(RootModel[int]):
+    root: Annotated[int, Field(ge=0)]
+
+
+class QualityFlag(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    metric: Metric
+    """
+    Metric that crossed its threshold
+    """
+    antennas: list[Antenna]
+    """
+    The antenna, or the two antennas of a baseline
+    """
+    value: float
+    """
+    Value of the metric
+    """
+    threshold: float
+    """
+    Threshold it crossed
+    """
+
+
+class QualityReport(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    timestamp: UTCTimestamp
+    """
+    UTC timestamp of the frame
+    """
+    amplitude: list[float]
+    """
+    Mean visibility amplitude of each antenna over its baselines
+    """
+    radio_mean: list[float]
+    """
+    Mean of each antenna's radio samples, from the correlator
+    """
+    closure_phase_rms: Annotated[float, Field(ge=0.0)]
+    """
+    Circular standard deviation of the closure phases of all triangles (degrees)
+    """
+    antenna_closure_phase_rms: list[float]
+    """
+    Circular standard deviation of the closure phases of each antenna's triangles (degrees)
+    """
+    zscore: list[float]
+    """
+    Amplitude of each baseline against its running mean, in running standard deviations
+    """
+    flags: list[QualityFlag]
+    """
+    Thresholds crossed in the frame
+    """
+
+
+class Baseline(RootModel[list[int]]):
+    root: Annotated[list[int], Field(max_length=2, min_length=2)]
+
+
+class QualityResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    baselines: list[Baseline]
+    """
+    Antenna pairs [i, j], i < j, in the order of the z-scores
+    """
+    reports: list[QualityReport]
+    """
+    The latest reports, oldest first
+    """
+
+
+class SpectrumWaterfallResponse(BaseModel):
+    model_config = ConfigDict(
+        extra="forbid",
+    )
+    freq: list[float]
+    """
+    Centre frequency of each bin (MHz)
+    """
+    antennas: list[Antenna]
+    """
+    Antennas, in the order of the spectra
+    """
+    timestamps: list[UTCTimestamp]
+    """
+    UTC timestamp of each snapshot, oldest first
+    """
+    power: list[list[list[float]]]
+    """
+    Power spectral density (dB) per snapshot, antenna and bin
+    """
+
+
 class AqSystem(BaseModel):
     model_config = ConfigDict(
         extra="forbid",
@@ -8,6 +8,7 @@
 from __future__ import annotations
 from typing import Annotated, Any
 from pydantic import BaseModel, ConfigDict, Field, RootModel
+from enum import StrEnum
 
 
 class Model(RootModel[Any]):
@@ -123,6 +124,15 @@ class AntennaPositionsCalibration(BaseModel):
     """
 
 
+class ChecksumAlgorithm(StrEnum):
+    """
+    Hash algorithm used to compute the checksum
+    """
+
+    sha256 = "sha256"
+    blake2b = "blake2b"
+
+
 class FileHandle(BaseModel):
     model_config = ConfigDict(
         extra="forbid",
@@ -133,7 +143,11 @@ class FileHandle(BaseModel):
     """
     checksum: str
     """
-    SHA256 checksum
+    File checksum (hex digest)
+    """
+    checksum_algorithm: ChecksumAlgorithm | None
+    """
+    Hash algorithm used to compute the checksum
     """
     timestamp: str
     """
@@ -0,0 +1,234 @@
+"""
+On-board gain calibration for the TART web api (the cal mode).
+
+While the telescope is in cal mode the vis stream keeps running, and the
+control loop collects the frames it receives. Once enough have arrived,
+their average is compared with a model of the sky, the complex gain of
+every antenna is solved for, and the solution is stored like one posted to
+/calibration/gain. Collection then pauses until the next solution is due.
+
+The model is the point sources in the cal settings (elevation and azimuth
+in degrees, and flux), or when there are none, a single point source in
+the brightest direction of the current all-sky map, which refines the
+gains in use (self-calibration).
+
+The solver is StefCal (Salvini and Wijnholds 2014): an alternating least
+squares update of all the gains at once, each iteration a handful of
+(antenna x antenna) array operations, with leading axes solved as a batch.
+For 24 antennas it converges in well under a millisecond per iteration.
+"""
+
+import logging
+import time
+
+import numpy as np
+
+from database import operations as db
+
+from .channel_cache import channel_mask, current_gains, set_gains
+from .flagger import frame_flags, pack_flags
+from .geometry import array_geometry
+from .sky_map import hemisphere_directions, sky_mappers
+from .synthesis import SPEED_OF_LIGHT, calibrated_vis
+
+logger = logging.getLogger(__name__)
+
+# HEALPix resolution used to find the brightest direction for self-calibration
+SELF_CAL_NSIDE = 16
+
+
+def baseline_matrix(baselines, vis, num_ant):
+    """
+    Args:
+        baselines: (B, 2) antenna pairs (i, j)
+        vis: (..., B) visibilities of those baselines
+        num_ant: number of antennas
+
+    Returns:
+        ndarray: (..., num_ant, num_ant) Hermitian matrix with the visibilities
+        at (i, j), their conjugates at (j, i) and zeros on the diagonal
+    """
+    vis = np.asarray(vis)
+    i, j = baselines[:, 0], baselines[:, 1]
+    out = np.zeros(vis.shape[:-1] + (num_ant, num_ant), dtype=np.complex128)
+    out[..., i, j] = vis
+    out[..., j, i] = np.conj(vis)
+    return out
+
+
+def source_directions(sources):
+    """(S, 3) direction cosines (east, north, up) of {"el", "az"} sources in degrees."""
+    el = np.radians([s["el"] for s in sources])
+    az = np.radians([s["az"] for s in sources])
+    return np.column_stack([np.cos(el) * np.sin(az), np.cos(el) * np.cos(az), np.sin(el)])
+
+
+def point_source_model(uvw, directions, fluxes):
+    """
+    Args:
+        uvw: (num_ant, num_ant, 3) baseline table from geometry.baseline_uvw
+        directions: (S, 3) direction cosines of the sources
+        fluxes: (S,) source fluxes
+
+    Returns:
+        ndarray: (num_ant, num_ant) model visibilities, zero on the diagonal
+    """
+    phase = (-2j * np.pi) * (uvw @ np.asarray(directions).T)
+    model = np.exp(phase) @ np.asarray(fluxes, dtype=np.float64)
+    np.fill_diagonal(model, 0.0)
+    return model
+
+
+def solve_gains(data, model, weights, max_iterations=100, tolerance=1e-6):
+    """
+    Solve data = G model G^H for the diagonal complex gains G, by StefCal.
+
+    Args:
+        data: (..., A, A) Hermitian visibility matrices
+        model: (..., A, A) model visibilities for the same baselines
+        weights: (..., A, A) real weights, 0 for baselines to leave out
+        max_iterations: limit on the number of iterations
+        tolerance: relative change in the gains at which to stop
+
+    Returns:
+        tuple: (gains (..., A), iterations, converged, residual). Antennas with no
+        weighted baselines have a gain of 1. The first antenna that has baselines
+        is the phase reference.
+    """
+    data = np.asarray(data) * weights
+    model = np.broadcast_to(np.asarray(model) * weights, data.shape)
+    gains = np.ones(data.shape[:-1], dtype=np.complex128)
+    solvable = (np.abs(model) ** 2).sum(axis=-2) > 0
+
+    converged = False
+    for iteration in range(1, max_iterations + 1):
+        # z[q, p] = g_q M_qp, and g_p = sum_q conj(R_qp) z_qp / sum_q |z_qp|^2
+        z = gains[..., :, np.newaxis] * model
+        numerator = (np.conj(data) * z).sum(axis=-2)
+        denominator = (np.abs(z) ** 2).sum(axis=-2)
+        update = np.where(solvable, numerator / np.where(solvable, denominator, 1.0), 1.0)
+        if iteration % 2 == 0:
+            # Averaging every other step stops the iteration oscillating
+            update = 0.5 * (update + gains)
+        change = np.linalg.norm(update - gains, axis=-1) / np.linalg.norm(update, axis=-1)
+        gains = update
+        if np.all(change < tolerance):
+            converged = True
+            break
+
+    reference = np.argmax(solvable, axis=-1)
+    ref_gain = np.take_along_axis(gains, reference[..., np.newaxis], axis=-1)
+    gains = np.where(solvable, gains * (np.abs(ref_gain) / ref_gain), 1.0)
+
+    predicted = gains[..., :, np.newaxis] * model * np.conj(gains[..., np.newaxis, :])
+    residual = np.linalg.norm(data - predicted, axis=(-2, -1)) / np.linalg.norm(data, axis=(-2, -1))
+    return gains, iteration, converged, residual
+
+
+def gain_phase(gains, solvable, previous):
+    """
+    The TART form of a gain solution: vis * g_i g_j exp(-1j (ph_i - ph_j)) is
+    calibrated, so g is 1 / |G| and ph is the phase of G. Antennas without a
+    solution keep their previous (gain, phase_offset).
+    """
+    gain = np.where(solvable, 1.0 / np.abs(gains), previous[0])
+    phase = np.where(solvable, np.angle(gains), previous[1])
+    return gain, phase
+
+
+class Calibrator:
+    """
+    Collects frames in cal mode and solves for the gains every settings["seconds"].
+
+    settings are the cal settings of the runtime config: frames to average,
+    seconds between solutions, the sky model sources, max_iterations and
+    tolerance.
+    """
+
+    def __init__(self, runtime_config):
+        self.config = runtime_config
+        self.frames = []
+        self.next_solution_at = 0.0
+
+    def add(self, frame):
+        """
+        Offer a frame. Returns the report of the solution when one was made, or None.
+        """
+        settings = self.config["cal"]
+        if time.monotonic() < self.next_solution_at:
+            return None
+        self.frames.append(frame)
+        if len(self.frames) < settings["frames"]:
+            return None
+        frames, self.frames = self.frames, []
+        self.next_solution_at = time.monotonic() + settings["seconds"]
+        return self.solve(frames, settings)
+
+    def solve(self, frames, settings):
+        telescope = self.config["telescope_config"]
+        num_ant = telescope["num_antenna"]
+        baselines = frames[-1]["baselines"]
+        frames = [f for f in frames if np.array_equal(f["baselines"], baselines)]
+        # Each baseline averaged over the frames in which it is not flagged
+        unflagged = ~np.array([frame_flags(f) for f in frames])
+        counts = unflagged.sum(axis=0)
+        vis = np.sum([f["vis"] for f in frames], axis=0, where=unflagged) / np.maximum(counts, 1)
+        uvw = array_geometry.get(self.config).uvw(SPEED_OF_LIGHT / telescope["frequency"])
+        previous = current_gains()
+        mask = channel_mask()
+
+        sources = settings["sources"]
+        if sources:
+            directions = source_directions(sources)
+            fluxes = [s.get("flux", 1.0) for s in sources]
+            model_kind = "sources"
+        else:
+            directions = self.brightest_direction(baselines, vis, pack_flags(counts == 0))
+            fluxes = [1.0]
+            model_kind = "brightest"
+
+        weights = np.outer(mask, mask).astype(np.float64)
+        np.fill_diagonal(weights, 0.0)
+        i, j = baselines[counts == 0].T
+        weights[i, j] = weights[j, i] = 0.0
+        t0 = time.perf_counter()
+        gains, iterations, converged, residual = solve_gains(
+            baseline_matrix(baselines, vis, num_ant),
+            point_source_model(uvw, directions, fluxes),
+            weights,
+            settings["max_iterations"],
+            settings["tolerance"],
+        )
+        solve_ms = (time.perf_counter() - t0) * 1e3
+
+        solvable = weights.sum(axis=0) > 0
+        gain, phase = gain_phase(gains, solvable, previous)
+        with db.write_db() as con:
+            version = db.insert_gain(con.cursor(), gain.tolist(), phase.tolist())
+        set_gains(gain.tolist(), phase.tolist(), version)
+        report = {
+            "timestamp": frames[-1]["timestamp"],
+            "frames": len(frames),
+            "sky_model": model_kind,
+            "iterations": iterations,
+            "converged": converged,
+            "residual": float(residual),
+            "solve_ms": solve_ms,
+        }
+        logger.info(
+            f"Calibrated on {len(frames)} frames against {model_kind}: {iterations} "
+            f"iterations, converged {converged}, residual {residual:.3g}, {solve_ms:.1f} ms"
+        )
+        return report
+
+    def brightest_direction(self, baselines, vis, flags=None):
+        """The direction of the peak of the all-sky map with the gains in use."""
+        mapper = sky_mappers.get(
+            array_geometry.get(self.config),
+            baselines,
+            self.config["telescope_config"]["frequency"],
+            SELF_CAL_NSIDE,
+            self.config["sky_map"]["cache_path"],
+        )
+        sky = mapper.map(*calibrated_vis({"baselines": baselines, "vis": vis, "flags": flags}))
+        return hemisphere_directions(SELF_CAL_NSIDE)[[np.argmax(sky)]]
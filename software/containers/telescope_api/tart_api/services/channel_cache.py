@@ -0,0 +1,215 @@
+"""
+Shared caches of the channel enable mask and the current gains, and the
+calibration stage derived from them.
+
+The database stays the source of truth. Writers update it first and then
+write the new values through to these caches, which live in shared memory
+created before the background processes are forked, so the API, control
+and archive processes all see the same values. A read is a version check
+on shared memory; the NumPy copy held by each process is only refreshed
+when the version has changed.
+
+The calibration stage turns the gains and the mask into one complex
+correction per baseline, so that a frame is calibrated with one multiply.
+Each process recomputes the vector only when either version changes.
+"""
+
+import logging
+import multiprocessing
+
+import numpy as np
+
+from database import operations as db
+
+logger = logging.getLogger(__name__)
+
+
+class SharedArrayCache:
+    """A fixed size array in shared memory with a version counter."""
+
+    def __init__(self, typecode, dtype, values, version=0):
+        self._array = multiprocessing.Array(typecode, len(values))
+        # Guarded by the array's lock
+        self._version = multiprocessing.Value("q", version - 1, lock=False)
+        self._dtype = dtype
+        self._local = (None, None)
+        self.set(values, version=version)
+
+    @property
+    def version(self):
+        return self._version.value
+
+    def get(self):
+        """The current values as a read-only array."""
+        return self.snapshot()[1]
+
+    def snapshot(self):
+        """
+        Returns:
+            tuple: (version, values), read together
+        """
+        if self._local[0] != self._version.value:
+            with self._array.get_lock():
+                values = np.array(self._array[:], dtype=self._dtype)
+                version = self._version.value
+            values.flags.writeable = False
+            self._local = (version, values)
+        return self._local
+
+    def set(self, values, index=None, version=None):
+        """
+        Update the values. With a version, e.g. one persisted with the values,
+        the update is dropped if the cache already holds that version or a
+        later one, so concurrent writers cannot leave older values behind.
+
+        Returns:
+            bool: whether the cache was updated
+        """
+        with self._array.get_lock():
+            if version is None:
+                version = self._version.value + 1
+            elif version <= self._version.value:
+                return False
+            if index is None:
+                self._array[:] = np.asarray(values).tolist()
+            else:
+                self._array[index] = values
+            self._version.value = version
+        return True
+
+
+_channels = None
+_gains = None
+# (key, mask, correction) of the last calibration() in this process
+_calibration = (None, None, None)
+
+
+def mask_from_status(channel_list, num_ant=None):
+    """Channel enable mask from get_manual_channel_status() rows."""
+    num_ant = num_ant or len(channel_list)
+    mask = np.zeros(num_ant, dtype=bool)
+    for ch in channel_list:
+        mask[ch["channel_id"]] = ch["enabled"]
+    return mask
+
+
+def init_channel_caches(num_ant, channel_list, channel_version, gain_rows, gain_version):
+    """Create the caches from the database state, before forking any workers."""
+    global _channels, _gains
+    _channels = SharedArrayCache(
+        "b", bool, mask_from_status(channel_list, num_ant), version=channel_version
+    )
+    # Gains followed by phases
+    _gains = SharedArrayCache(
+        "d",
+        np.float64,
+        [gain_rows[i][2] for i in range(num_ant)] + [gain_rows[i][3] for i in range(num_ant)],
+        version=gain_version,
+    )
+
+
+def channel_mask():
+    """Boolean enable mask, indexed by channel."""
+    if _channels is None:
+        return mask_from_status(db.get_manual_channel_status())
+    return _channels.get()
+
+
+def channel_status():
+    """The channel mask in the form of get_manual_channel_status()."""
+    return [{"channel_id": i, "enabled": int(e)} for i, e in enumerate(channel_mask())]
+
+
+def versioned_channel_mask():
+    """
+    Returns:
+        tuple: (channel configuration version, enable mask) read together
+    """
+    if _channels is None:
+        return db.get_channel_version(), mask_from_status(db.get_manual_channel_status())
+    return _channels.snapshot()
+
+
+def channel_version():
+    """
+    The channel configuration version. Anything derived from the channel
+    mask can be keyed on it, it changes whenever the mask does.
+    """
+    if _channels is None:
+        return db.get_channel_version()
+    return _channels.version
+
+
+def set_channels(channel_list, version):
+    """Write through the channel status committed at the given version."""
+    if _channels is not None:
+        _channels.set(mask_from_status(channel_list, len(_channels.get())), version=version)
+
+
+def current_gains():
+    """
+    Returns:
+        tuple: (gain, phase_offset) arrays, one entry per antenna
+    """
+    if _gains is None:
+        rows_dict = db.get_gain()
+        num_ant = len(rows_dict)
+        return (
+            np.array([rows_dict[i][2] for i in range(num_ant)]),
+            np.array([rows_dict[i][3] for i in range(num_ant)]),
+        )
+    values = _gains.get()
+    num_ant = len(values) // 2
+    return values[:num_ant], values[num_ant:]
+
+
+def set_gains(gain, phase_offset, version):
+    """Write through the gains of the calibration set stored at the given version."""
+    if _gains is not None:
+        _gains.set(list(gain) + list(phase_offset), version=version)
+
+
+def gains_version():
+    """
+    The gains version, the ts_ns of the calibration set the gains come from.
+    It changes whenever the gains do.
+    """
+    if _gains is None:
+        return db.get_gain_version()
+    return _gains.version
+
+
+def correction_vector(baselines, mask, gain, phase_offset):
+    """
+    Returns:
+        ndarray: (B,) complex correction g_i g_j exp(-1j (ph_i - ph_j)) of the
+        baselines (i, j), 0 for baselines of disabled channels
+    """
+    i, j = baselines[:, 0], baselines[:, 1]
+    correction = gain[i] * gain[j] * np.exp(-1j * (phase_offset[i] - phase_offset[j]))
+    return np.where(mask[i] & mask[j], correction, 0.0)
+
+
+def calibration(baselines):
+    """
+    The calibration stage for frames with the given baseline order.
+
+    Returns:
+        tuple: (version, mask, correction) where version is the (channel version,
+        gains version) both were computed from, mask the channel enable mask and
+        correction the read-only (B,) vector to multiply the visibilities by
+    """
+    global _calibration
+    if _channels is None or _gains is None:
+        channels, mask = versioned_channel_mask()
+        return (channels, None), mask, correction_vector(baselines, mask, *current_gains())
+
+    channels, mask = _channels.snapshot()
+    gains, values = _gains.snapshot()
+    key = (channels, gains, baselines.tobytes())
+    if _calibration[0] != key:
+        num_ant = len(values) // 2
+        correction = correction_vector(baselines, mask, values[:num_ant], values[num_ant:])
+        correction.flags.writeable = False
+        _calibration = (key, mask, correction)
+    return (channels, gains), _calibration[1], _calibration[2]
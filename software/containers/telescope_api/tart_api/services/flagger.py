@@ -0,0 +1,89 @@
+"""
+Streaming RFI and outlier flagging of the visibility frames.
+
+The control loop hands every frame to a Flagger before it is published. The
+flagger keeps the amplitudes of each baseline over the last few frames in a
+(window, baselines) array, replacing one row per frame, and flags the
+baselines whose amplitude deviates from their running median by more than
+threshold robust standard deviations (1.4826 MAD). All baselines are
+handled by the same few NumPy reductions. Flagged amplitudes still enter
+the window, so interference that lasts for more than half the window
+becomes the new median and is no longer flagged.
+
+The flags travel with the frame as frame["flags"], the packed bits
+(np.packbits, little bit order) of one bool per baseline, and are honoured
+downstream:
+
+- /imaging/vis and the streams leave flagged baselines out of the frame
+- /imaging/vis/recent and /imaging/vis/history return them as NaN
+- the archive saves the flags next to the visibilities
+- the integrator averages each baseline over its unflagged frames
+- imaging, sky maps and self-calibration give them no weight
+"""
+
+import numpy as np
+
+# MAD to standard deviation, for Gaussian noise
+MAD_SIGMA = 1.4826
+
+
+def pack_flags(flags):
+    """Packed bits of a (B,) bool flag array."""
+    return np.packbits(flags, bitorder="little")
+
+
+def unpack_flags(packed, num_baselines):
+    """The (..., B) bool flags from their packed bits (..., (B + 7) // 8)."""
+    return np.unpackbits(packed, axis=-1, count=num_baselines, bitorder="little").view(bool)
+
+
+def frame_flags(frame):
+    """(B,) bool flags of a frame, none flagged if it carries no flags."""
+    num_baselines = len(frame["baselines"])
+    packed = frame.get("flags")
+    if packed is None:
+        return np.zeros(num_baselines, dtype=bool)
+    return unpack_flags(packed, num_baselines)
+
+
+def flagged_nan(vis, flags):
+    """A copy of vis (..., B) with the flagged visibilities set to NaN."""
+    return np.where(flags, np.complex64(np.nan), vis)
+
+
+class Flagger:
+    """
+    Running median and MAD flagger with the settings of the "flagging"
+    runtime config.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.baselines = None
+
+    def reset(self, baselines):
+        """Start a new window for a baseline order."""
+        self.baselines = baselines
+        self.window = np.zeros((self.settings["window"], len(baselines)), dtype=np.float32)
+        self.frames = 0
+
+    def add(self, frame):
+        """
+        Returns:
+            ndarray: the packed flags of the frame
+        """
+        if self.baselines is None or not np.array_equal(frame["baselines"], self.baselines):
+            self.reset(frame["baselines"])
+        settings = self.settings
+        amplitude = np.abs(frame["vis"])
+        flags = np.zeros(len(amplitude), dtype=bool)
+
+        filled = min(self.frames, len(self.window))
+        if settings["enabled"] == 1 and filled >= settings["min_frames"]:
+            window = self.window[:filled]
+            median = np.median(window, axis=0)
+            mad = np.median(np.abs(window - median), axis=0)
+            flags = np.abs(amplitude - median) > settings["threshold"] * MAD_SIGMA * mad
+        self.window[self.frames % len(self.window)] = amplitude
+        self.frames += 1
+        return pack_flags(flags)
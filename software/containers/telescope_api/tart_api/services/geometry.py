@@ -0,0 +1,200 @@
+"""
+Array geometry derived from the antenna positions.
+
+The positions only change when they are recalibrated, so the derived
+tables are cached by the positions themselves and shared by every request
+until then.
+
+Setting the positions with set_antenna_positions() also bumps
+antenna_positions_version in the runtime config. Every process holds one
+ArrayGeometry for the current version. Consumers only read the version to
+find out whether it is stale, and key anything they derive from the layout
+on it.
+"""
+
+import functools
+from dataclasses import dataclass
+
+import numpy as np
+
+# Julian date of the Unix epoch, and of J2000.0
+JD_UNIX_EPOCH = 2440587.5
+JD_J2000 = 2451545.0
+
+
+def positions_key(antenna_positions):
+    """Hashable form of the antenna_positions from the runtime config."""
+    return tuple(tuple(float(x) for x in pos) for pos in antenna_positions)
+
+
+@functools.lru_cache(maxsize=4)
+def baseline_lengths(positions):
+    """
+    Args:
+        positions: antenna positions [[e, n, u], ...] in metres, as from positions_key()
+
+    Returns:
+        ndarray: (num_ant, num_ant) read-only table of baseline lengths in metres
+    """
+    enu = np.asarray(positions, dtype=np.float64)
+    lengths = np.linalg.norm(enu[:, np.newaxis, :] - enu[np.newaxis, :, :], axis=-1)
+    lengths.flags.writeable = False
+    return lengths
+
+
+@functools.lru_cache(maxsize=4)
+def baseline_uvw(positions, wavelength):
+    """
+    Args:
+        positions: antenna positions [[e, n, u], ...] in metres, as from positions_key()
+        wavelength: observing wavelength in metres
+
+    Returns:
+        ndarray: (num_ant, num_ant, 3) read-only table of the (u, v, w) of baseline
+        (i, j) in wavelengths, for a phase centre at the zenith. As in
+        tart.imaging, (u, v, w) is position i minus position j.
+    """
+    enu = np.asarray(positions, dtype=np.float64) / wavelength
+    uvw = enu[:, np.newaxis, :] - enu[np.newaxis, :, :]
+    uvw.flags.writeable = False
+    return uvw
+
+
+def local_sidereal_time(timestamps_ns, lon):
+    """
+    Args:
+        timestamps_ns: (T,) UTC times in ns since the epoch
+        lon: longitude in degrees east
+
+    Returns:
+        ndarray: (T,) local mean sidereal time in radians
+    """
+    jd = np.asarray(timestamps_ns, dtype=np.float64) / 86400e9 + JD_UNIX_EPOCH
+    gmst = 280.46061837 + 360.98564736629 * (jd - JD_J2000)
+    return np.radians((gmst + lon) % 360.0)
+
+
+def enu_to_xyz(enu, lat):
+    """
+    Rotate (..., 3) local east, north, up vectors at latitude lat (degrees) to
+    the equatorial frame: X towards hour angle 0, Y towards hour angle -6h
+    (east) and Z towards the celestial pole.
+    """
+    sin_lat, cos_lat = np.sin(np.radians(lat)), np.cos(np.radians(lat))
+    e, n, u = enu[..., 0], enu[..., 1], enu[..., 2]
+    return np.stack([cos_lat * u - sin_lat * n, e, sin_lat * u + cos_lat * n], axis=-1)
+
+
+def uvw_rotation(hour_angle, dec):
+    """
+    Args:
+        hour_angle: (T,) hour angles of the phase centre in radians
+        dec: (T,) or scalar declination of the phase centre in radians
+
+    Returns:
+        ndarray: (T, 3, 3) matrices taking equatorial (X, Y, Z) to (u, v, w)
+    """
+    hour_angle = np.asarray(hour_angle, dtype=np.float64)
+    dec = np.broadcast_to(np.asarray(dec, dtype=np.float64), hour_angle.shape)
+    sin_h, cos_h = np.sin(hour_angle), np.cos(hour_angle)
+    sin_d, cos_d = np.sin(dec), np.cos(dec)
+    zero = np.zeros_like(hour_angle)
+    return np.stack(
+        [
+            np.stack([sin_h, cos_h, zero], axis=-1),
+            np.stack([-sin_d * cos_h, sin_d * sin_h, cos_d], axis=-1),
+            np.stack([cos_d * cos_h, -cos_d * sin_h, sin_d], axis=-1),
+        ],
+        axis=-2,
+    )
+
+
+@dataclass(frozen=True)
+class ArrayGeometry:
+    """
+    The layout at one antenna_positions_version, and the tables derived from
+    it, each computed once on first use.
+    """
+
+    version: int
+    positions: tuple
+
+    @functools.cached_property
+    def num_ant(self):
+        return len(self.positions)
+
+    @functools.cached_property
+    def baselines(self):
+        """(B, 2) uint8 baselines (i, j), i < j, in the order of the visibilities."""
+        i, j = np.triu_indices(self.num_ant, k=1)
+        baselines = np.column_stack([i, j]).astype(np.uint8)
+        baselines.flags.writeable = False
+        return baselines
+
+    @functools.cached_property
+    def vectors(self):
+        """(B, 3) east, north, up vectors of the baselines in metres, position i minus j."""
+        enu = np.asarray(self.positions, dtype=np.float64)
+        vectors = enu[self.baselines[:, 0]] - enu[self.baselines[:, 1]]
+        vectors.flags.writeable = False
+        return vectors
+
+    @property
+    def lengths(self):
+        """(num_ant, num_ant) table of baseline lengths in metres."""
+        return baseline_lengths(self.positions)
+
+    def uvw(self, wavelength):
+        """(num_ant, num_ant, 3) uvw table for the zenith, see baseline_uvw()."""
+        return baseline_uvw(self.positions, wavelength)
+
+    def uvw_at(self, timestamps_ns, lat, lon, ra=None, dec=None, baselines=None):
+        """
+        The (u, v, w) of the baselines towards a phase centre fixed on the sky.
+
+        Args:
+            timestamps_ns: (T,) UTC times in ns since the epoch
+            lat, lon: telescope latitude and longitude in degrees
+            ra, dec: phase centre in degrees, or None for the zenith at each time
+            baselines: (B, 2) baselines (i, j), by default self.baselines
+
+        Returns:
+            ndarray: (T, B, 3) in metres
+        """
+        if baselines is None:
+            vectors = self.vectors
+        else:
+            enu = np.asarray(self.positions, dtype=np.float64)
+            vectors = enu[baselines[:, 0]] - enu[baselines[:, 1]]
+        lst = local_sidereal_time(timestamps_ns, lon)
+        if ra is None:
+            hour_angle, dec = np.zeros_like(lst), np.radians(lat)
+        else:
+            hour_angle, dec = lst - np.radians(ra), np.radians(dec)
+        rotation = uvw_rotation(hour_angle, dec)
+        return np.einsum("tij,bj->tbi", rotation, enu_to_xyz(vectors, lat))
+
+
+class GeometryCache:
+    """The ArrayGeometry of the current antenna_positions_version in this process."""
+
+    def __init__(self):
+        self._geometry = None
+
+    def get(self, config):
+        version = config.get("antenna_positions_version", 0)
+        geometry = self._geometry
+        if geometry is None or geometry.version != version:
+            geometry = ArrayGeometry(version, positions_key(config["antenna_positions"]))
+            self._geometry = geometry
+        return geometry
+
+
+array_geometry = GeometryCache()
+
+
+def set_antenna_positions(config, antenna_positions):
+    """Replace the positions in the runtime config and move on to a new version."""
+    version = config.get("antenna_positions_version", 0) + 1
+    # A single update, so no process sees the new version with the old positions
+    config.update({"antenna_positions": antenna_positions, "antenna_positions_version": version})
@@ -0,0 +1,177 @@
+"""
+Time averaged visibilities at several cadences.
+
+The control loop hands every frame to an Integrator, which keeps a running
+sum per cadence: one vector add per frame and cadence, whatever the length
+of the average. Flagged visibilities (see services.flagger) are left out,
+so each baseline is averaged over its own unflagged frames. Averaging
+intervals are aligned to UTC multiples of the cadence, so the 60 s averages
+start on the minute. When a frame arrives in a later interval the finished
+average is emitted with the number of frames in it, appended to an
+in-memory ring of recent averages, and optionally archived.
+
+Averaged frames have the layout of the vis_current frames plus
+"integration" (the cadence in seconds) and "samples" (frames), and their
+timestamp is the start of the interval they cover. Baselines flagged in all
+the frames of the interval are flagged in the average, and zero.
+"""
+
+import glob
+import logging
+import os
+from collections import deque
+from datetime import UTC, datetime, timedelta
+
+import h5py
+import numpy as np
+
+from database import operations as db
+
+from .flagger import frame_flags, pack_flags
+
+logger = logging.getLogger(__name__)
+
+
+class RunningAverage:
+    """The average of the frames in the current interval of one cadence."""
+
+    def __init__(self, cadence):
+        self.cadence = cadence
+        self.interval_ns = int(cadence * 1e9)
+        self.start_ns = None
+        self.baselines = None
+        self.sum = None
+        self.counts = None
+        self.samples = 0
+
+    def add(self, frame, unflagged):
+        """
+        Add a frame, with the mask of its unflagged baselines. Returns the
+        previous interval's average if the frame starts a new one, otherwise None.
+        """
+        timestamp_ns = db.to_ns(frame["timestamp"])
+        start_ns = timestamp_ns - timestamp_ns % self.interval_ns
+        finished = None
+        if start_ns != self.start_ns or not np.array_equal(frame["baselines"], self.baselines):
+            finished = self.flush()
+            self.start_ns = start_ns
+            self.baselines = frame["baselines"]
+            self.sum = np.zeros(len(self.baselines), dtype=np.complex128)
+            self.counts = np.zeros(len(self.baselines), dtype=np.int64)
+        np.add(self.sum, frame["vis"], out=self.sum, where=unflagged)
+        self.counts += unflagged
+        self.samples += 1
+        return finished
+
+    def flush(self):
+        """Emit the average of the current interval, if it has any frames, and reset."""
+        if not self.samples:
+            return None
+        average = {
+            "timestamp": datetime.fromtimestamp(self.start_ns / 1e9, UTC),
+            "baselines": self.baselines,
+            "vis": self.sum / np.maximum(self.counts, 1),
+            "flags": pack_flags(self.counts == 0),
+            "integration": self.cadence,
+            "samples": self.samples,
+        }
+        self.start_ns = None
+        self.sum = None
+        self.counts = None
+        self.samples = 0
+        return average
+
+
+class Integrator:
+    """
+    Running averages at each of settings["cadences"] (seconds), with a ring of
+    the latest settings["ring_size"] averages per cadence.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.averages = [RunningAverage(c) for c in sorted(settings["cadences"])]
+        self.rings = {c: deque(maxlen=settings["ring_size"]) for c in settings["cadences"]}
+
+    def add(self, frame):
+        """Returns the averages that the frame completed, possibly none."""
+        unflagged = ~frame_flags(frame)
+        finished = [a.add(frame, unflagged) for a in self.averages]
+        return self._emit(finished)
+
+    def flush(self):
+        """Emit the partial averages, e.g. when the stream stops."""
+        return self._emit([a.flush() for a in self.averages])
+
+    def _emit(self, finished):
+        finished = [f for f in finished if f is not None]
+        for average in finished:
+            self.rings[average["integration"]].append(average)
+        return finished
+
+    def latest(self):
+        """{cadence: latest average} of the cadences that have one."""
+        return {c: ring[-1] for c, ring in self.rings.items() if ring}
+
+    def recent(self):
+        """{cadence: [averages, oldest first]}"""
+        return {c: list(ring) for c, ring in self.rings.items() if ring}
+
+
+class IntegratedArchive:
+    """
+    Appends averaged frames to one HDF5 file per cadence and UTC day, in
+    base_path, and removes the files of days older than keep_days.
+
+    Each file holds the baselines, and extendible timestamp_ns, vis
+    (complex64), samples and flags (packed bits) datasets.
+    """
+
+    def __init__(self, base_path, keep_days):
+        self.base_path = base_path
+        self.keep_days = keep_days
+
+    def filename(self, cadence, day):
+        return os.path.join(self.base_path, f"vis_{cadence}s_{day}.hdf")
+
+    def append(self, average):
+        cadence = average["integration"]
+        day = average["timestamp"].strftime("%Y-%m-%d")
+        filename = self.filename(cadence, day)
+        if not os.path.exists(filename):
+            os.makedirs(self.base_path, exist_ok=True)
+            self.prune(cadence, average["timestamp"])
+        with h5py.File(filename, "a") as h5f:
+            if "vis" not in h5f:
+                h5f.create_dataset("baselines", data=average["baselines"])
+                h5f.attrs["integration"] = cadence
+            elif not np.array_equal(h5f["baselines"][:], average["baselines"]):
+                logger.warning(f"Baselines changed, not archiving the {cadence} s average")
+                return
+            n = len(h5f["timestamp_ns"]) if "timestamp_ns" in h5f else 0
+            num_baselines = len(average["baselines"])
+            flags = average["flags"]
+            for name, shape, dtype in (
+                ("timestamp_ns", (n,), "<i8"),
+                ("vis", (n, num_baselines), np.complex64),
+                ("samples", (n,), "<i4"),
+                # Files started before flagging have no flags for their earlier averages
+                ("flags", (n, len(flags)), np.uint8),
+            ):
+                if name not in h5f:
+                    h5f.create_dataset(name, shape=shape, maxshape=(None,) + shape[1:], dtype=dtype)
+            for name, value in (
+                ("timestamp_ns", db.to_ns(average["timestamp"])),
+                ("vis", average["vis"]),
+                ("samples", average["samples"]),
+                ("flags", flags),
+            ):
+                h5f[name].resize(n + 1, axis=0)
+                h5f[name][n] = value
+
+    def prune(self, cadence, now):
+        oldest = (now - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        for filename in glob.glob(self.filename(cadence, "*")):
+            if filename < self.filename(cadence, oldest):
+                os.remove(filename)
+                logger.info(f"Removed {filename}")
@@ -0,0 +1,210 @@
+"""
+Per-frame data quality metrics, served at /status/quality.
+
+The control loop hands every frame, with the per-antenna means of the
+radio samples from the correlator, to a QualityMonitor. For each frame it
+computes, with a few vectorized operations on precomputed index tables:
+
+- the mean visibility amplitude of each antenna over its baselines,
+- closure phase statistics over all antenna triangles, for the whole array
+  and per antenna,
+- a z-score of each baseline's amplitude against an exponentially weighted
+  running mean and variance,
+
+and raises flags where these cross the thresholds in the settings, so that
+a dead antenna or new interference shows up without looking at the data.
+Only enabled channels are flagged. The latest reports are kept in a list
+held by the config manager, created before the control process is forked.
+The control process appends each new report to it, so only that report
+crosses to the manager, and the API fetches just the reports it serves.
+"""
+
+import numpy as np
+
+from . import channel_cache
+
+# The latest reports, a list in the config manager
+_reports = None
+
+
+def triangle_tables(baselines, num_ant):
+    """
+    Index tables of the antenna triangles i < j < k.
+
+    Returns:
+        tuple: (ij, jk, ik) indices into the baselines of each triangle's three
+        baselines, and the (num_ant, triangles) float incidence of the
+        antennas in each triangle. Triangles missing a baseline are left out.
+    """
+    index = np.full((num_ant, num_ant), -1, dtype=np.intp)
+    index[baselines[:, 0], baselines[:, 1]] = np.arange(len(baselines))
+    i, j, k = (
+        np.array(
+            [
+                (i, j, k)
+                for i in range(num_ant)
+                for j in range(i + 1, num_ant)
+                for k in range(j + 1, num_ant)
+            ],
+            dtype=np.intp,
+        )
+        .reshape(-1, 3)
+        .T
+    )
+    ij, jk, ik = index[i, j], index[j, k], index[i, k]
+    complete = (ij >= 0) & (jk >= 0) & (ik >= 0)
+    incidence = np.zeros((num_ant, complete.sum()))
+    for antennas in (i, j, k):
+        incidence[antennas[complete], np.arange(complete.sum())] = 1.0
+    return ij[complete], jk[complete], ik[complete], incidence
+
+
+def circular_rms(phasors):
+    """The circular standard deviation in degrees of unit phasors averaged along the last axis."""
+    resultant = np.clip(np.abs(phasors), 1e-12, 1.0)
+    return np.degrees(np.sqrt(-2.0 * np.log(resultant)))
+
+
+class QualityMonitor:
+    """
+    Quality metrics of the frames of a num_ant antenna array, with the
+    thresholds and ring size in settings (the "quality" runtime config).
+    """
+
+    def __init__(self, settings, num_ant):
+        self.settings = settings
+        self.num_ant = num_ant
+        self.baselines = None
+
+    def reset(self, baselines):
+        """Rebuild the index tables and restart the running statistics for a baseline order."""
+        self.baselines = baselines
+        i, j = baselines[:, 0], baselines[:, 1]
+        self.ij, self.jk, self.ik, self.incidence = triangle_tables(baselines, self.num_ant)
+        self.triangles_per_antenna = self.incidence.sum(axis=1)
+        # (num_ant, baselines) incidence of the antennas in each baseline
+        self.antenna_baselines = np.zeros((self.num_ant, len(baselines)))
+        self.antenna_baselines[i, np.arange(len(baselines))] = 1.0
+        self.antenna_baselines[j, np.arange(len(baselines))] = 1.0
+        self.baselines_per_antenna = self.antenna_baselines.sum(axis=1)
+        self.amplitude_mean = np.zeros(len(baselines))
+        self.amplitude_var = np.zeros(len(baselines))
+        self.frames = 0
+
+    def add(self, frame, means):
+        """Compute and publish the report of a frame, and return it."""
+        if self.baselines is None or not np.array_equal(frame["baselines"], self.baselines):
+            self.reset(frame["baselines"])
+        settings = self.settings
+        vis = frame["vis"]
+        amplitude = np.abs(vis)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            antenna_amplitude = self.antenna_baselines @ amplitude / self.baselines_per_antenna
+            closure = vis[self.ij] * vis[self.jk] * np.conj(vis[self.ik])
+            phasors = closure / np.abs(closure)
+            phasors[~np.isfinite(phasors)] = 0.0
+            closure_rms = circular_rms(phasors.mean()) if len(phasors) else 0.0
+            antenna_closure_rms = circular_rms(
+                self.incidence @ phasors / self.triangles_per_antenna
+            )
+
+        # Exponentially weighted running statistics, a plain running average
+        # until there have been decay_frames frames
+        self.frames += 1
+        alpha = 1.0 / min(self.frames, settings["decay_frames"])
+        deviation = amplitude - self.amplitude_mean
+        std = np.sqrt(self.amplitude_var)
+        zscore = np.divide(deviation, std, out=np.zeros_like(deviation), where=std > 0)
+        self.amplitude_mean += alpha * deviation
+        self.amplitude_var = (1.0 - alpha) * (self.amplitude_var + alpha * deviation**2)
+
+        means = np.asarray(means, dtype=float)
+        report = {
+            "timestamp": frame["timestamp"],
+            "amplitude": antenna_amplitude,
+            "radio_mean": means,
+            "closure_phase_rms": float(closure_rms),
+            "antenna_closure_phase_rms": antenna_closure_rms,
+            "baselines": self.baselines,
+            "zscore": zscore,
+            "flags": self.flags(antenna_amplitude, antenna_closure_rms, zscore, means),
+        }
+        publish_report(report, settings["ring_size"])
+        return report
+
+    def flags(self, antenna_amplitude, antenna_closure_rms, zscore, means):
+        """[{"metric", "antennas", "value", "threshold"}] of the thresholds crossed."""
+        settings = self.settings
+        enabled = channel_cache.channel_mask()[: self.num_ant]
+        flags = []
+
+        def flag(metric, values, threshold, crossed, antennas):
+            for n in np.flatnonzero(crossed):
+                flags.append(
+                    {
+                        "metric": metric,
+                        "antennas": [int(a) for a in np.atleast_1d(antennas[n])],
+                        "value": float(values[n]),
+                        "threshold": threshold,
+                    }
+                )
+
+        antennas = np.arange(self.num_ant)
+        flag(
+            "radio_mean",
+            means,
+            settings["radio_mean"],
+            enabled & (np.abs(means) > settings["radio_mean"]),
+            antennas,
+        )
+        if np.any(enabled):
+            # Relative to the median antenna, as the sky sets the overall level
+            # of both. Antenna gains cancel in closure phases, so a high excess
+            # points at the antenna's signal itself, e.g. a dead receiver.
+            ratio = antenna_amplitude / np.median(antenna_amplitude[enabled])
+            flag(
+                "amplitude_ratio",
+                ratio,
+                settings["amplitude_ratio"],
+                enabled & (ratio < settings["amplitude_ratio"]),
+                antennas,
+            )
+            excess = antenna_closure_rms - np.median(antenna_closure_rms[enabled])
+            flag(
+                "closure_phase_excess",
+                excess,
+                settings["closure_phase_excess"],
+                enabled & (excess > settings["closure_phase_excess"]),
+                antennas,
+            )
+        if self.frames > settings["warmup_frames"]:
+            i, j = self.baselines[:, 0], self.baselines[:, 1]
+            flag(
+                "zscore",
+                zscore,
+                settings["zscore"],
+                enabled[i] & enabled[j] & (np.abs(zscore) > settings["zscore"]),
+                self.baselines,
+            )
+        return flags
+
+
+def init_quality_reports(manager):
+    global _reports
+    _reports = manager.list()
+    return _reports
+
+
+def publish_report(report, ring_size):
+    """Append a report to the shared list, keeping the latest ring_size."""
+    if _reports is not None:
+        _reports.append(report)
+        del _reports[:-ring_size]
+
+
+def recent_reports(n):
+    """The latest n reports, oldest first, [] before the list has been created."""
+    if _reports is None:
+        return []
+    return _reports[-n:]
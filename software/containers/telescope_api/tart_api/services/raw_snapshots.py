@@ -0,0 +1,108 @@
+"""
+Raw snapshots taken while the visibilities stream (the vis modes).
+
+While the correlator runs the capture process owns the SPI bus, so a raw
+snapshot is a command to it: between two visibility reads it stops the
+correlator, captures and reads back 2**raw.N_samples_exp samples, and
+re-arms the correlator straight away, without tearing down the stream.
+Snapshots are taken on demand (POST /acquire/raw/snapshot) and, with
+raw.snapshot_schedule set, at the raw.sync_acquire_at_seconds marks of
+each minute. A snapshot starts when the frame being integrated has been
+read, up to one frame after the request or mark, and requests made while
+one is under way are served by it.
+
+Each snapshot leaves a gap in the vis stream, from gap_start to gap_end,
+which the stream subscribers are sent as a gap message. The snapshots are
+saved and catalogued like those of the raw mode when raw.save is set, and
+the latest are recorded, with the downtime of the correlator, for
+/acquire/raw/snapshots. The spectrum snapshots of the vis modes
+(services.spectrum) are taken the same way and recorded with them.
+"""
+
+import multiprocessing
+import queue
+from collections import deque
+from datetime import timedelta
+
+from tart.util import utc
+
+# Snapshots recorded for /acquire/raw/snapshots
+RECENT_SNAPSHOTS = 60
+
+# Requests from the API, created before the control process is forked
+_requests = None
+
+
+def init_snapshot_requests():
+    global _requests
+    _requests = multiprocessing.Queue()
+    return _requests
+
+
+def request_snapshot():
+    """Ask the control process for a raw snapshot, returns the time of the request."""
+    requested_at = utc.now()
+    if _requests is not None:
+        _requests.put(requested_at)
+    return requested_at
+
+
+def take_requests():
+    """Remove the pending requests, and return whether there were any."""
+    requested = False
+    if _requests is not None:
+        while True:
+            try:
+                _requests.get_nowait()
+            except queue.Empty:
+                return requested
+            requested = True
+    return requested
+
+
+def next_mark(now, seconds):
+    """The first whole UTC second after now whose second of the minute is in seconds."""
+    start = now.replace(microsecond=0)
+    for k in range(1, 61):
+        mark = start + timedelta(seconds=k)
+        if mark.second in seconds:
+            return mark
+    return None
+
+
+class SnapshotScheduler:
+    """Decides when the control loop asks the capture process for a snapshot."""
+
+    def __init__(self):
+        self.next_at = None
+        self.pending = False
+        self.recent = deque(maxlen=RECENT_SNAPSHOTS)
+
+    def due(self, settings, now):
+        """Whether to take a snapshot now: one was requested, or a mark has passed."""
+        requested = take_requests()
+        if settings.get("snapshot_schedule", 0) != 1:
+            self.next_at = None
+        elif self.next_at is None:
+            self.next_at = next_mark(now, settings["sync_acquire_at_seconds"])
+        elif now >= self.next_at:
+            self.next_at = next_mark(now, settings["sync_acquire_at_seconds"])
+            requested = True
+        return requested and not self.pending
+
+    def record(self, snapshot, filename=None):
+        """
+        Returns:
+            dict: the record of a snapshot from the capture process, also kept
+            with the latest ones
+        """
+        record = {
+            "timestamp": snapshot["timestamp"],
+            "gap_start": snapshot["gap_start"],
+            "gap_end": snapshot["gap_end"],
+            "downtime": (snapshot["gap_end"] - snapshot["gap_start"]).total_seconds(),
+            "num_samples": int(snapshot["ant_data"].shape[1]),
+            "filename": filename,
+        }
+        self.recent.append(record)
+        return record
@@ -0,0 +1,168 @@
+"""
+Retention service for the TART web api.
+
+A single process keeps the raw and visibility file caches within their
+configured limits. Writers call notify_insert() after cataloguing a file,
+which wakes the service immediately instead of it polling the database.
+Expired files are deleted on a background thread, and then the catalog
+entries of those removed in one transaction per product type. The entry of
+a file that could not be removed is kept, so the next pass retries it.
+
+Policies are set per product type in runtime_config["retention"]:
+
+    max_files:  keep at most this many of the newest files
+    max_bytes:  keep the newest files whose total size is within this quota
+    max_age:    remove files older than this many seconds
+
+Any limit may be None to disable it. A full sweep also runs every
+sweep_seconds so that age limits apply while nothing is being written.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from tart.util import utc
+
+from database import operations as db
+
+logger = logging.getLogger(__name__)
+
+PRODUCTS = tuple(db.FILE_TABLES)
+
+STATE_UPDATERS = {
+    "raw": db.update_observation_cache_process_state,
+    "vis": db.update_vis_cache_process_state,
+}
+
+# Insert events, created before the writer processes are forked
+_events = None
+
+
+def init_retention_events():
+    global _events
+    _events = multiprocessing.Queue()
+    return _events
+
+
+def notify_insert(product):
+    """Tell the retention service that a new file of this product type was catalogued."""
+    if _events is not None:
+        _events.put(product)
+
+
+def select_expired(catalog, policy, now):
+    """Return the catalog entries (newest first) that fall outside the policy."""
+    max_files = policy.get("max_files")
+    max_bytes = policy.get("max_bytes")
+    max_age = policy.get("max_age")
+    expired = []
+    total_bytes = 0
+    for n, entry in enumerate(catalog):
+        total_bytes += entry["size_bytes"]
+        if (
+            (max_files is not None and n >= max_files)
+            or (max_bytes is not None and total_bytes > max_bytes)
+            or (max_age is not None and (now - entry["timestamp"]).total_seconds() > max_age)
+        ):
+            expired.append(entry)
+    return expired
+
+
+def file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+class RetentionService:
+    """Applies the retention policies and reports the space reclaimed."""
+
+    def __init__(self, runtime_config, status=None):
+        self.runtime_config = runtime_config
+        self.status = status
+        self.reclaimed = {product: {"files": 0, "bytes": 0} for product in PRODUCTS}
+        self.remover = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retention")
+        # Ids of the entries whose files are being removed
+        self.removing = set()
+
+    def apply(self, product):
+        catalog = db.get_file_catalog(product)
+        for entry in catalog:
+            if entry["size_bytes"] is None:
+                # Catalogued before sizes were recorded
+                entry["size_bytes"] = file_size(entry["filename"])
+
+        policy = self.runtime_config["retention"][product]
+        expired = [
+            entry
+            for entry in select_expired(catalog, policy, utc.now())
+            if entry["Id"] not in self.removing
+        ]
+        if expired:
+            logger.info("Retention: expiring %d %s files", len(expired), product)
+            self.removing.update(entry["Id"] for entry in expired)
+            self.remover.submit(self._remove_files, product, expired)
+        STATE_UPDATERS[product]("OK")
+
+    def _remove_files(self, product, expired):
+        """Remove the files, then the catalog entries of those that are gone."""
+        removed = []
+        reclaimed = self.reclaimed[product]
+        for entry in expired:
+            try:
+                os.remove(entry["filename"])
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error("Could not remove file %s: %s", entry["filename"], e)
+                continue
+            else:
+                reclaimed["files"] += 1
+                reclaimed["bytes"] += entry["size_bytes"]
+                logger.debug("Removed %s file %s", product, entry["filename"])
+            removed.append(entry["Id"])
+        try:
+            if removed:
+                db.remove_file_handles(product, removed)
+        except Exception as e:
+            logger.error("Could not remove %d %s catalog entries: %s", len(removed), product, e)
+        finally:
+            self.removing.difference_update(entry["Id"] for entry in expired)
+        if removed:
+            reclaimed["reclaimed_at"] = utc.to_string(utc.now())
+            if self.status is not None:
+                self.status["retention_status"] = {p: dict(r) for p, r in self.reclaimed.items()}
+
+
+def retention_loop(events, runtime_config, status=None, logger=logger):
+    """
+    Apply the retention policies whenever a product type is written to.
+
+    runtime_config may be the shared config, in which case policy changes
+    take effect on the next pass. Reclaimed space is reported in
+    status["retention_status"].
+    """
+    service = RetentionService(runtime_config, status)
+    # Sweep everything once at startup
+    pending = set(PRODUCTS)
+    while True:
+        for product in pending:
+            try:
+                service.apply(product)
+            except Exception as e:
+                logger.error("Retention error (%s): %s", product, e)
+                logger.exception(e)
+        try:
+            pending = {events.get(timeout=runtime_config["retention"]["sweep_seconds"])}
+        except queue.Empty:
+            pending = set(PRODUCTS)
+        # Coalesce a burst of inserts into one pass per product type
+        while True:
+            try:
+                pending.add(events.get_nowait())
+            except queue.Empty:
+                break
@@ -0,0 +1,183 @@
+"""
+Direct Fourier all-sky maps for the TART web api.
+
+With a few hundred baselines the sky brightness in a fixed set of
+directions can be summed directly, with no gridding and so no aliasing or
+kernel artifacts. The directions are the centres of the HEALPix pixels of
+the upper hemisphere (RING ordering, with the zenith as the pole), which
+all have the same area.
+
+The map is the real part of the visibilities times a steering matrix that
+only depends on the layout, the baseline order and the frequency. It is
+stored as a real (pixels, 2 x baselines) float32 matrix [cos | -sin], so a
+map is a single real matrix product, and a batch of frames is a matrix
+product with one column per frame. The matrix is cached on disk by a hash
+of the layout and the frequency, and memory mapped, so a restart does not
+rebuild it. Both building it and mapping work through it in row chunks of
+bounded size, so large maps need no more memory than the result.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from .geometry import array_geometry, baseline_uvw, positions_key
+from .synthesis import SPEED_OF_LIGHT, calibrated_vis
+
+logger = logging.getLogger(__name__)
+
+# Upper limit on the part of the steering matrix worked on at once
+CHUNK_BYTES = 16 * 2**20
+
+
+def hemisphere_pixels(nside):
+    """Number of HEALPix pixels with centres above the horizon."""
+    return 6 * nside * nside - 2 * nside
+
+
+def hemisphere_directions(nside):
+    """
+    Args:
+        nside: HEALPix resolution parameter
+
+    Returns:
+        ndarray: (hemisphere_pixels(nside), 3) direction cosines (l, m, n) of the
+        pixel centres, east, north and up, in HEALPix RING order with the zenith as
+        the pole and the azimuth measured from north through east
+    """
+    num_cap = 2 * nside * (nside - 1)
+    p = np.arange(hemisphere_pixels(nside))
+    cap = p < num_cap
+
+    # Polar cap: rings 1 .. nside - 1, with 4 x ring pixels each
+    q = p[cap] + 1
+    ring = np.floor(0.5 * (1 + np.sqrt(2 * q - 1))).astype(np.int64)
+    ring[2 * ring * (ring + 1) < q] += 1
+    ring[2 * ring * (ring - 1) >= q] -= 1
+    cap_z = 1.0 - ring**2 / (3.0 * nside**2)
+    cap_phi = (q - 2 * ring * (ring - 1) - 0.5) * np.pi / (2 * ring)
+
+    # Equatorial belt down to the horizon: rings nside .. 2 nside - 1, of 4 nside pixels
+    q = p[~cap] - num_cap
+    ring = q // (4 * nside) + nside
+    shift = 0.5 * (1 + (ring + nside) % 2)
+    belt_z = (2 * nside - ring) * 2.0 / (3 * nside)
+    belt_phi = (q % (4 * nside) + 1 - shift) * np.pi / (2 * nside)
+
+    z = np.concatenate([cap_z, belt_z])
+    phi = np.concatenate([cap_phi, belt_phi])
+    r = np.sqrt(1.0 - z**2)
+    return np.column_stack([r * np.sin(phi), r * np.cos(phi), z])
+
+
+def _row_chunks(num_rows, row_bytes):
+    step = max(1, CHUNK_BYTES // row_bytes)
+    for start in range(0, num_rows, step):
+        yield slice(start, min(start + step, num_rows))
+
+
+def steering_key(antenna_positions, baselines, frequency, nside):
+    digest = hashlib.sha256()
+    digest.update(np.asarray(positions_key(antenna_positions), dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(baselines, dtype=np.uint8).tobytes())
+    return f"steering_{digest.hexdigest()[:16]}_{frequency:.0f}_{nside}"
+
+
+def build_steering(path, antenna_positions, baselines, frequency, nside):
+    """Write the steering matrix to path, chunk by chunk, and replace it atomically."""
+    uvw = baseline_uvw(positions_key(antenna_positions), SPEED_OF_LIGHT / frequency)
+    uvw = uvw[baselines[:, 0], baselines[:, 1]]
+    directions = hemisphere_directions(nside)
+    num_baselines = len(baselines)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    steering = np.lib.format.open_memmap(
+        tmp, mode="w+", dtype=np.float32, shape=(len(directions), 2 * num_baselines)
+    )
+    for rows in _row_chunks(len(directions), 2 * num_baselines * 8):
+        phase = (2 * np.pi) * (directions[rows] @ uvw.T)
+        steering[rows, :num_baselines] = np.cos(phase)
+        steering[rows, num_baselines:] = -np.sin(phase)
+    steering.flush()
+    del steering
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+class SkyMapper:
+    """Maps frames with a fixed layout, baseline order, frequency and nside."""
+
+    def __init__(self, antenna_positions, baselines, frequency, nside, cache_path):
+        self.nside = nside
+        self.num_baselines = len(baselines)
+        path = os.path.join(
+            cache_path, steering_key(antenna_positions, baselines, frequency, nside) + ".npy"
+        )
+        if not os.path.exists(path):
+            logger.info(f"Building the nside {nside} steering matrix in {path}")
+            build_steering(path, antenna_positions, baselines, frequency, nside)
+        self.steering = np.load(path, mmap_mode="r")
+
+    def map(self, vis, weights):
+        """
+        Args:
+            vis: (B,) complex visibilities, or (F, B) for a batch of F frames
+            weights: (B,) or (F, B) weight of each visibility, 0 to leave it out
+
+        Returns:
+            ndarray: (P,) float32 map, or (F, P) maps, normalised so that a point
+            source of unit flux has a peak of one
+        """
+        single = np.ndim(vis) == 1
+        vis = np.atleast_2d(vis)
+        weights = np.broadcast_to(weights, vis.shape)
+        total = weights.sum(axis=1)
+        weighted = vis * (weights / np.where(total, total, 1.0)[:, np.newaxis])
+        x = np.concatenate([weighted.real, weighted.imag], axis=1).T.astype(np.float32)
+
+        maps = np.empty((len(self.steering), len(vis)), dtype=np.float32)
+        for rows in _row_chunks(len(self.steering), self.steering.shape[1] * 4):
+            np.matmul(self.steering[rows], x, out=maps[rows])
+        return maps[:, 0] if single else maps.T
+
+
+class SkyMapperCache:
+    """
+    The mappers in use, rebuilt only when the layout or frequency changes.
+    They are keyed on the geometry version, so the positions are only hashed
+    to find the steering matrix on disk when the layout has changed.
+    """
+
+    def __init__(self, size=4):
+        self.size = size
+        self._mappers = {}
+
+    def get(self, geometry, baselines, frequency, nside, cache_path):
+        key = (geometry.version, baselines.tobytes(), frequency, nside)
+        mapper = self._mappers.get(key)
+        if mapper is None:
+            if len(self._mappers) >= self.size:
+                self._mappers.pop(next(iter(self._mappers)))
+            mapper = SkyMapper(geometry.positions, baselines, frequency, nside, cache_path)
+            self._mappers[key] = mapper
+        return mapper
+
+
+sky_mappers = SkyMapperCache()
+
+
+def frame_sky_map(frame, runtime_config, nside):
+    """The calibrated all-sky map of a frame from the shared config."""
+    mapper = sky_mappers.get(
+        array_geometry.get(runtime_config),
+        frame["baselines"],
+        runtime_config["telescope_config"]["frequency"],
+        nside,
+        runtime_config["sky_map"]["cache_path"],
+    )
+    return mapper.map(*calibrated_vis(frame))
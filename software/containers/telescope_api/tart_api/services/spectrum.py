@@ -0,0 +1,162 @@
+"""
+Spectral monitoring of the radio front ends.
+
+In the spectrum mode the control loop takes a short raw snapshot of all
+antennas every spectrum.seconds, and in the vis modes it asks the capture
+process for one between two visibility reads (services.raw_snapshots),
+unless spectrum.in_stream is 0. The raw snapshots of the vis modes give
+spectra too. The power spectrum of every antenna is computed at once (the
+vectorized PSD of the diag mode, binned to 128 bins). The spectra are kept
+in a waterfall, a preallocated (history, antennas, bins) float32 array in
+shared memory, created before the control process is forked like the ring
+of recent frames (services.vis_ring). The API reads it for
+/status/spectrum/waterfall. The spectra can also be archived, in float16,
+one file per UTC day.
+"""
+
+import glob
+import logging
+import multiprocessing
+import os
+from datetime import timedelta
+
+import h5py
+import numpy as np
+
+from database.migrations import to_ns
+
+logger = logging.getLogger(__name__)
+
+# Frequency bins of each spectrum
+NUM_BINS = 128
+
+# The waterfall, created before the control process is forked
+_waterfall = None
+
+
+class Waterfall:
+    """The latest capacity spectra of a num_ant antenna array."""
+
+    def __init__(self, capacity, num_ant, num_bins=NUM_BINS):
+        self.capacity = capacity
+        self.num_ant = num_ant
+        self.num_bins = num_bins
+        self._lock = multiprocessing.Lock()
+        self._power = multiprocessing.RawArray("f", capacity * num_ant * num_bins)
+        self._timestamps = multiprocessing.RawArray("q", capacity)
+        self._freq = multiprocessing.RawArray("d", num_bins)
+        # Spectra written since the frequency bins were last set. Guarded by the lock.
+        self._count = multiprocessing.RawValue("q", 0)
+        self._views = None
+
+    def views(self):
+        """(power_db, timestamps_ns, freq) NumPy views of the shared memory."""
+        if self._views is None:
+            self._views = (
+                np.frombuffer(self._power, dtype=np.float32).reshape(
+                    self.capacity, self.num_ant, self.num_bins
+                ),
+                np.frombuffer(self._timestamps, dtype=np.int64),
+                np.frombuffer(self._freq, dtype=np.float64),
+            )
+        return self._views
+
+    def append(self, timestamp_ns, power_db, freq):
+        power, timestamps, frequencies = self.views()
+        with self._lock:
+            if not np.array_equal(freq, frequencies):
+                # A new NFFT moves the bins, so older spectra no longer line up
+                frequencies[:] = freq
+                self._count.value = 0
+            row = self._count.value % self.capacity
+            power[row] = power_db[: self.num_ant]
+            timestamps[row] = timestamp_ns
+            self._count.value += 1
+
+    def recent(self, n, after_ns=None):
+        """
+        Returns:
+            tuple: (freq (F,) in Hz, timestamps_ns (N,), power_db (N, num_ant, F))
+            copies of the latest N <= n spectra, oldest first, only those after
+            after_ns if given. None if no spectrum has been recorded.
+        """
+        power, timestamps, frequencies = self.views()
+        with self._lock:
+            count = self._count.value
+            if count == 0:
+                return None
+            rows = np.arange(count - min(n, count, self.capacity), count) % self.capacity
+            recent = frequencies.copy(), timestamps[rows], power[rows]
+        if after_ns is not None:
+            newer = recent[1] > after_ns
+            recent = recent[0], recent[1][newer], recent[2][newer]
+        return recent
+
+
+def init_waterfall(capacity, num_ant):
+    global _waterfall
+    _waterfall = Waterfall(capacity, num_ant)
+    return _waterfall
+
+
+def record_spectra(timestamp, power_db, freq):
+    """Copy the spectra of a new snapshot into the waterfall."""
+    if _waterfall is not None:
+        _waterfall.append(to_ns(timestamp), power_db, freq)
+
+
+def recent_spectra(n, after_ns=None):
+    """See Waterfall.recent(), None before the waterfall has been created."""
+    if _waterfall is None:
+        return None
+    return _waterfall.recent(n, after_ns)
+
+
+class SpectrumArchive:
+    """
+    Appends spectra to one HDF5 file per UTC day, in base_path, and removes
+    the files of days older than keep_days.
+
+    Each file holds the freq (Hz) of the bins, and extendible timestamp_ns and
+    power_db (float16, within 0.03 dB at the -70 dB or so of these spectra)
+    datasets.
+    """
+
+    def __init__(self, base_path, keep_days):
+        self.base_path = base_path
+        self.keep_days = keep_days
+
+    def filename(self, day):
+        return os.path.join(self.base_path, f"spectrum_{day}.hdf")
+
+    def append(self, timestamp, power_db, freq):
+        filename = self.filename(timestamp.strftime("%Y-%m-%d"))
+        if not os.path.exists(filename):
+            os.makedirs(self.base_path, exist_ok=True)
+            self.prune(timestamp)
+        with h5py.File(filename, "a") as h5f:
+            if "power_db" not in h5f:
+                h5f.create_dataset("freq", data=freq)
+                h5f.create_dataset("timestamp_ns", shape=(0,), maxshape=(None,), dtype="<i8")
+                h5f.create_dataset(
+                    "power_db",
+                    shape=(0,) + power_db.shape,
+                    maxshape=(None,) + power_db.shape,
+                    dtype=np.float16,
+                )
+            elif h5f["power_db"].shape[1:] != power_db.shape or not np.array_equal(
+                h5f["freq"][:], freq
+            ):
+                logger.warning("Spectrum bins changed, not archiving the spectra")
+                return
+            n = len(h5f["timestamp_ns"])
+            for name, value in (("timestamp_ns", to_ns(timestamp)), ("power_db", power_db)):
+                h5f[name].resize(n + 1, axis=0)
+                h5f[name][n] = value
+
+    def prune(self, now):
+        oldest = (now - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        for filename in glob.glob(self.filename("*")):
+            if filename < self.filename(oldest):
+                os.remove(filename)
+                logger.info(f"Removed {filename}")
@@ -0,0 +1,259 @@
+"""
+Real-time synthesis imaging for the TART web api (the rt_syn_img mode).
+
+While the telescope is in rt_syn_img mode the control loop hands a frame to
+the imager at the configured cadence, and the imager writes an all-sky
+quick-look image as a PNG and as a raw float32 array, both replaced
+atomically so that the API never serves a partial file.
+
+The imager for an array layout and grid size is built once: the grid cells
+and Kaiser-Bessel kernel weights of every baseline and of its conjugate,
+the grid correction and the horizon mask only depend on the geometry. Each
+image is then a gather, two weighted bincounts onto the half plane, one
+real inverse FFT (numpy's pocketfft keeps the plan for the size) and a
+multiply. It runs in its own process so that imaging never stalls the
+control loop.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import struct
+import zlib
+
+import numpy as np
+
+from database import operations as db
+
+from .channel_cache import calibration
+from .flagger import frame_flags
+
+logger = logging.getLogger(__name__)
+
+SPEED_OF_LIGHT = 299792458.0
+
+# Grid cell in wavelengths. The image then spans the whole sky, -1 <= l, m < 1.
+CELL = 0.5
+
+# Kernel width in cells, and the Kaiser-Bessel shape for a grid oversampled 2x
+SUPPORT = 6
+KB_BETA = np.pi * np.sqrt((SUPPORT / 2 * 1.5) ** 2 - 0.8)
+
+# zlib level of the PNG, fast rather than small as the image is replaced often
+PNG_COMPRESSION = 1
+
+# Seconds to wait for a frame before checking for a stop command
+IDLE_TIMEOUT = 1.0
+
+
+def kaiser_bessel(x):
+    """Gridding kernel at offsets x from the visibility, in cells."""
+    r = np.clip(1.0 - (2.0 * x / SUPPORT) ** 2, 0.0, None)
+    return np.i0(KB_BETA * np.sqrt(r)) / np.i0(KB_BETA)
+
+
+def grid_correction(num_pixels):
+    """The Fourier transform of the kernel at the pixel offsets, 1 at the centre."""
+    x = np.linspace(-SUPPORT / 2, SUPPORT / 2, 64 * SUPPORT + 1)
+    p = np.arange(num_pixels) - num_pixels // 2
+    taper = kaiser_bessel(x) @ np.cos(2 * np.pi * np.outer(x, p) / num_pixels)
+    return taper / taper[num_pixels // 2]
+
+
+class SynthesisImager:
+    """
+    All-sky imager for one array layout and grid size.
+
+    Images are (num_pixels, num_pixels) float32 arrays with north up and
+    east on the left, as seen looking up, normalised so that a point source
+    of unit flux at the zenith has a peak of one. Pixels below the horizon
+    are NaN.
+    """
+
+    def __init__(self, uvw, baselines, num_pixels):
+        n = num_pixels
+        self.num_pixels = n
+        self.baselines = baselines
+        i, j = baselines[:, 0], baselines[:, 1]
+        uv = uvw[i, j, :2] / CELL
+
+        # Baselines that, with the kernel, do not fit on the grid are left out
+        self.fits = np.abs(uv).max(axis=1) < n / 2 - SUPPORT / 2
+        if not self.fits.all():
+            logger.warning(
+                f"{np.count_nonzero(~self.fits)} baselines are too long for a "
+                f"{n} pixel image and are left out"
+            )
+        points = np.concatenate([uv, -uv])
+
+        # The cells under the kernel along each axis, and the separable weights
+        first = np.floor(points).astype(np.int64) - (SUPPORT // 2 - 1)
+        cells = first[:, :, np.newaxis] + np.arange(SUPPORT)
+        weights = kaiser_bessel(cells - points[:, :, np.newaxis])
+        rows = cells[:, 1, :, np.newaxis] % n
+        cols = cells[:, 0, np.newaxis, :] % n
+        weights = weights[:, 1, :, np.newaxis] * weights[:, 0, np.newaxis, :]
+        point_weight = weights.sum(axis=(1, 2)).mean()
+        # A sign alternating between cells moves the zenith to the centre of the
+        # image, in place of an fftshift
+        weights = np.where((rows + cols) % 2, -weights, weights)
+
+        # The grid is Hermitian, so only the half plane that irfft2 reads is kept
+        half = n // 2 + 1
+        index = rows * half + cols
+        source = np.broadcast_to(np.arange(len(points))[:, np.newaxis, np.newaxis], index.shape)
+        keep = np.broadcast_to(cols < half, index.shape)
+        self._index = index[keep]
+        self._source = source[keep]
+        self._weights = weights[keep]
+        self._grid_size = n * half
+
+        # Undo the kernel and the FFT normalisation, and blank the pixels below
+        # the horizon, in one multiply
+        taper = grid_correction(n)
+        lm = (np.arange(n) - n // 2) * (2.0 / n)
+        self.horizon = np.add.outer(lm**2, lm**2) < 1.0
+        self._correction = np.where(
+            self.horizon, (n * n / point_weight) / np.outer(taper, taper), np.nan
+        ).astype(np.float32)
+
+    def image(self, vis, weights):
+        """
+        Args:
+            vis: (B,) complex visibilities in the order of self.baselines
+            weights: (B,) bool or float weight of each visibility, 0 to leave it out
+
+        Returns:
+            ndarray: the (num_pixels, num_pixels) float32 image
+        """
+        weights = np.where(self.fits, weights, 0.0)
+        total = 2 * weights.sum()
+        if total:
+            weights = weights / total
+        # Gridding the conjugates at (u, v) mirrors the image about the zenith,
+        # which puts north up and east on the left
+        points = np.concatenate([np.conj(vis) * weights, vis * weights])
+        values = points[self._source] * self._weights
+        n = self.num_pixels
+        grid = np.empty(self._grid_size, dtype=np.complex128)
+        grid.real = np.bincount(self._index, values.real, minlength=self._grid_size)
+        grid.imag = np.bincount(self._index, values.imag, minlength=self._grid_size)
+        image = np.fft.irfft2(grid.reshape(n, n // 2 + 1), s=(n, n))
+        return np.multiply(image, self._correction, dtype=np.float32)
+
+
+def encode_png(image):
+    """An 8 bit greyscale PNG of an image, scaled between its extremes."""
+    finite = np.isfinite(image)
+    lo, hi = (image[finite].min(), image[finite].max()) if finite.any() else (0.0, 0.0)
+    scaled = np.zeros(image.shape, dtype=np.uint8)
+    if hi > lo:
+        scaled[finite] = np.round((image[finite] - lo) * (255.0 / (hi - lo)))
+    # Each row is preceded by filter type 0 (none)
+    rows = np.zeros((image.shape[0], image.shape[1] + 1), dtype=np.uint8)
+    rows[:, 1:] = scaled
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    height, width = image.shape
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", header),
+            chunk(b"IDAT", zlib.compress(rows.tobytes(), PNG_COMPRESSION)),
+            chunk(b"IEND", b""),
+        ]
+    )
+
+
+def encode_raw(image):
+    """The image as a .npy file of float32, which records its shape."""
+    buf = io.BytesIO()
+    np.save(buf, image)
+    return buf.getvalue()
+
+
+def write_atomic(path, data, timestamp_ns):
+    """Replace the file at path, with the frame timestamp as its modification time."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.utime(tmp, ns=(timestamp_ns, timestamp_ns))
+    os.replace(tmp, path)
+
+
+def calibrated_vis(frame):
+    """
+    Returns:
+        tuple: (vis, weights) of the frame, with the current gains applied and
+        the flagged baselines and those of disabled channels given no weight
+    """
+    _, _, correction = calibration(frame["baselines"])
+    return frame["vis"] * correction, (correction != 0) & ~frame_flags(frame)
+
+
+class ImagerCache:
+    """The imager for the current layout, rebuilt only when the layout changes."""
+
+    def __init__(self, wavelength):
+        self.wavelength = wavelength
+        self.key = None
+        self.imager = None
+
+    def get(self, geometry, baselines, num_pixels):
+        key = (geometry.version, baselines.tobytes(), num_pixels)
+        if key != self.key:
+            self.imager = SynthesisImager(geometry.uvw(self.wavelength), baselines, num_pixels)
+            self.key = key
+        return self.imager
+
+
+def make_image(imagers, frame, geometry, num_pixels, runtime_config):
+    imager = imagers.get(geometry, frame["baselines"], num_pixels)
+    image = imager.image(*calibrated_vis(frame))
+    timestamp_ns = db.to_ns(frame["timestamp"])
+    write_atomic(runtime_config["realtime_image_raw_path"], encode_raw(image), timestamp_ns)
+    write_atomic(runtime_config["realtime_image_path"], encode_png(image), timestamp_ns)
+
+
+def imaging_loop(image_queue, runtime_config, logger=logger):
+    """
+    Image the frames from image_queue.
+
+    Queue items are (frame, ArrayGeometry, num_pixels) tuples, or the
+    command "stop".
+    """
+    logger.debug("imaging_loop start")
+    wavelength = SPEED_OF_LIGHT / runtime_config["telescope_config"]["frequency"]
+    imagers = ImagerCache(wavelength)
+    while True:
+        try:
+            item = image_queue.get(timeout=IDLE_TIMEOUT)
+        except queue.Empty:
+            continue
+        if item == "stop":
+            break
+        try:
+            make_image(imagers, *item, runtime_config)
+        except Exception as e:
+            logger.error("Imaging Error %s", e)
+            logger.exception(e)
+    logger.debug("imaging_loop finished")
+    return 1
+
+
+def start_imager(runtime_config):
+    # One frame in hand is enough, the control loop drops frames while the imager is busy
+    image_queue = multiprocessing.Queue(1)
+    image_process = multiprocessing.Process(
+        target=imaging_loop,
+        args=(image_queue, runtime_config, logger),
+    )
+    image_process.start()
+    return image_queue, image_process
@@ -9,89 +9,52 @@ Author. Max Scheel 2017
 
 import logging
 import os
+import queue
 import time
+from collections import deque
 
-from tart.imaging import visibility
+import numpy as np
+from tart.util import utc
 from tart_hardware_interface.highlevel_modes_api import (
+    acquire_snapshot,
     run_acquire_raw,
     run_diagnostic,
-    sha256_checksum,
+    save_raw,
+    spectra_db,
 )
 from tart_hardware_interface.stream_vis import stream_vis_to_queue
 from tart_hardware_interface.util import create_spi_object
 
 from database import operations as db
 
-logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
+from .cal_solver import Calibrator
+from .flagger import Flagger
+from .geometry import array_geometry
+from .integrator import Integrator
+from .quality import QualityMonitor
+from .raw_snapshots import SnapshotScheduler
+from .retention import notify_insert
+from .spectrum import SpectrumArchive, record_spectra
+from .synthesis import start_imager
+from .vis_archive import start_vis_archive
+from .vis_ring import record_frame
+from .vis_stream import publish_frame, publish_gap
 
-# prepare to replace with utility
-save_vis_list = visibility.list_save
+logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
 
 N_IT = 0
 
-
-def cleanup_observation_cache():
-    while True:
-        resp = db.get_raw_file_handle()
-        if len(resp) > 10:
-            for entry in resp[10:]:
-                try:
-                    db.remove_raw_file_handle_by_id(entry["Id"])
-                    logging.info(
-                        "Removed raw file handle %s: %s (checksum: %s)",
-                        entry["Id"],
-                        entry["filename"],
-                        entry["checksum"],
-                    )
-                except Exception as e:
-                    logging.error("Could not remove handle from database: %s", e)
-                    pass
-                try:
-                    os.remove(entry["filename"])
-                except Exception as e:
-                    logging.error("Could not remove file: %s", e)
-                    pass
-        else:
-            db.update_observation_cache_process_state("OK")
-        time.sleep(60)
-
-
-def cleanup_visibility_cache():
-    while True:
-        resp = db.get_vis_file_handle()
-        if len(resp) > 10:
-            for entry in resp[10:]:
-                try:
-                    db.remove_vis_file_handle_by_id(entry["Id"])
-                    logging.info(
-                        "Removed vis file handle %s: %s (checksum: %s)",
-                        entry["Id"],
-                        entry["filename"],
-                        entry["checksum"],
-                    )
-                except Exception as e:
-                    logging.error("Could not remove handle from database: %s", e)
-                    pass
-                try:
-                    os.remove(entry["filename"])
-                except Exception as e:
-                    logging.error("Could not remove file: %s", e)
-                    pass
-
-        else:
-            db.update_vis_cache_process_state("OK")
-        time.sleep(60)
+# Modes that run the visibility stream
+STREAM_STATES = ("vis", "rt_syn_img", "cal")
 
 
-def create_direct_vis_dict(vis):
-    vis_dict = {}
-    vis_list = []
-    for b, v in zip(vis.baselines, vis.v, strict=False):
-        i, j = b
-        vis_el = {"i": i, "j": j, "re": v.real, "im": v.imag}
-        vis_list.append(vis_el)
-    vis_dict = {"data": vis_list, "timestamp": vis.timestamp}
-    return vis_dict
+def create_vis_frame(vis):
+    """The latest visibilities as arrays, cheap to pass through the shared config."""
+    return {
+        "timestamp": vis.timestamp,
+        "baselines": np.asarray(vis.baselines, dtype=np.uint8).reshape(-1, 2),
+        "vis": np.asarray(vis.v, dtype=np.complex128),
+    }
 
 
 class TartControl:
@@ -107,7 +70,22 @@ class TartControl:
         self.cmd_queue_vis_calc = None
         self.process_capture = None
         self.cmd_queue_capture = None
-        self.vislist = []
+        self.queue_snapshot = None
+        self.snapshots = SnapshotScheduler()
+        # "raw" or "spectrum", for each snapshot asked of the capture process
+        self.snapshot_kinds = deque()
+        self.queue_archive = None
+        self.process_archive = None
+        self.archiving = False
+        self.queue_image = None
+        self.process_image = None
+        self.next_image_at = 0.0
+        self.calibrator = None
+        # Kept across stream restarts, so the rings of averages are too
+        self.integrator = None
+        self.flagger = None
+        self.quality = None
+        self.next_spectrum_at = 0.0
         os.makedirs(self.config["vis"]["base_path"], exist_ok=True)
         os.makedirs(self.config["raw"]["base_path"], exist_ok=True)
 
@@ -122,18 +100,27 @@ class TartControl:
             elif self.state == "raw":
                 ret = run_acquire_raw(self.TartSPI, self.config)
                 if "filename" in ret:
-                    db.insert_raw_file_handle(ret["filename"], ret["sha256"])
+                    db.insert_raw_file_handle(
+                        ret["filename"],
+                        ret["checksum"],
+                        ret["checksum_algorithm"],
+                        os.path.getsize(ret["filename"]),
+                    )
+                    notify_insert("raw")
 
-            elif self.state == "vis":
+            elif self.state in STREAM_STATES:
                 if self.queue_vis is None:
                     logging.info("vis_stream_setup")
                     self.vis_stream_setup()
                 else:
-                    ret = self.vis_stream_acquire()
-                    if "filename" in ret:
-                        logging.debug(f"vis_stream_acquire = {ret}")
-                        db.insert_vis_file_handle(ret["filename"], ret["sha256"])
+                    self.vis_stream_acquire()
                     time.sleep(0.02)  # Reduced from 5ms to 20ms to lower CPU usage
+            elif self.state == "spectrum":
+                if time.monotonic() < self.next_spectrum_at:
+                    time.sleep(0.1)
+                else:
+                    self.next_spectrum_at = time.monotonic() + self.config["spectrum"]["seconds"]
+                    self.spectrum_snapshot()
             elif self.state == "off":
                 time.sleep(0.5)
             else:
@@ -147,11 +134,32 @@ class TartControl:
             return
         else:
             """ State Transition """
-            if self.state == "vis":
+            if self.state in STREAM_STATES:
                 """Cleanup vis acquisition queues and processes"""
                 self.vis_stream_finish()
             self.state = new_state
 
+    def spectrum_snapshot(self):
+        """Take a raw snapshot, and add the spectra of all antennas to the waterfall."""
+        timestamp, ant_data = acquire_snapshot(
+            self.TartSPI, self.config, 2 ** self.config["spectrum"]["N_samples_exp"]
+        )
+        self.add_spectra(timestamp, ant_data)
+
+    def add_spectra(self, timestamp, ant_data):
+        """Add the spectra of all antennas of a raw snapshot to the waterfall."""
+        settings = self.config["spectrum"]
+        num_ant = self.config["telescope_config"]["num_antenna"]
+        # Longer raw snapshots are cut to the spectrum's length, which bounds the time
+        # the control loop spends on them
+        num_samples = 2 ** settings["N_samples_exp"]
+        power_db, freq = spectra_db(ant_data[:num_ant, :num_samples], settings["NFFT"])
+        record_spectra(timestamp, power_db, freq)
+        if settings["save"] == 1:
+            SpectrumArchive(settings["base_path"], settings["keep_days"]).append(
+                timestamp, power_db, freq
+            )
+
     def vis_stream_setup(self):
         (
             self.queue_vis,
@@ -159,53 +167,151 @@ class TartControl:
             self.process_capture,
             self.cmd_queue_vis_calc,
             self.cmd_queue_capture,
+            self.queue_snapshot,
         ) = stream_vis_to_queue(self.TartSPI, self.config)
+        self.queue_archive, self.process_archive = start_vis_archive(self.config)
+        settings = self.config["integration"]
+        if self.integrator is None or self.integrator.settings != settings:
+            self.integrator = Integrator(settings)
+        settings = self.config["flagging"]
+        if self.flagger is None or self.flagger.settings != settings:
+            self.flagger = Flagger(settings)
+        settings = self.config["quality"]
+        if self.quality is None or self.quality.settings != settings:
+            self.quality = QualityMonitor(settings, self.config["telescope_config"]["num_antenna"])
+        if self.state == "rt_syn_img":
+            self.queue_image, self.process_image = start_imager(self.config)
+            self.next_image_at = 0.0
+        if self.state == "cal":
+            self.calibrator = Calibrator(self.config)
 
     def vis_stream_acquire(self):
-        """Get all available visibities"""
-        ret = {}
+        """Get all available visibities and hand them to the archive writer"""
+        saving = self.config["vis"]["save"] == 1
+        if self.archiving and not saving:
+            # Close the open file promptly when saving is switched off
+            self.queue_archive.put("flush")
+        self.archiving = saving
+
+        if self.snapshots.due(self.config["raw"], utc.now()):
+            self.request_snapshot("raw", self.config["raw"]["N_samples_exp"])
+            self.snapshots.pending = True
+        elif self.spectrum_due():
+            self.request_snapshot("spectrum", self.config["spectrum"]["N_samples_exp"])
+        self.receive_snapshots()
 
         while self.queue_vis.qsize() > 0:
             vis, means = self.queue_vis.get()
             if vis is not None:
-                vis_dict = create_direct_vis_dict(vis)
-                self.config["vis_current"] = vis_dict
-                # Extract timestamp from the vis_current data to ensure consistency
-                if "timestamp" in vis_dict:
-                    self.config["vis_timestamp"] = vis_dict["timestamp"]
-                self.vislist.append(vis)
-                logging.debug(f"Updated vis list N={len(self.vislist)}")
-
-                chunksize = self.config["vis"]["chunksize"]
-                if len(self.vislist) >= chunksize:
-                    logging.info(f"reached chunksize of {chunksize}")
-                    if self.config["vis"]["save"] == 1:
-                        fname = "{}/vis_{}.hdf".format(
-                            self.config["vis"]["base_path"],
-                            vis.timestamp.strftime("%Y-%m-%d_%H_%M_%S.%f"),
-                        )
-
-                        # Get the gains and phases and save them with the visibilities
-                        rows_dict = db.get_gain()
-                        gain = [rows_dict[i][2] for i in range(24)]
-                        phases = [rows_dict[i][3] for i in range(24)]
-
-                        ant_pos = self.config["antenna_positions"]
-                        save_vis_list(self.vislist, ant_pos, gain, phases, fname)
-
-                        logging.info(f"saved to {vis}")
-                        ret["filename"] = fname
-                        ret["sha256"] = sha256_checksum(fname)
-                    self.vislist = []
-        return ret
+                frame = create_vis_frame(vis)
+                frame["flags"] = self.flagger.add(frame)
+                self.config["vis_current"] = frame
+                # Taken from the frame itself to ensure consistency
+                self.config["vis_timestamp"] = frame["timestamp"]
+                publish_frame(frame)
+                record_frame(frame)
+                self.integrate(self.integrator.add(frame))
+                self.quality.add(frame, means)
+                if self.queue_image is not None:
+                    self.offer_image_frame(frame)
+                if self.calibrator is not None:
+                    report = self.calibrator.add(frame)
+                    if report is not None:
+                        self.config["calibration_status"] = report
+                if saving:
+                    self.queue_archive.put((vis, self.config["antenna_positions"], frame["flags"]))
+
+    def request_snapshot(self, kind, n_samples_exp):
+        self.cmd_queue_capture.put(("raw", 2**n_samples_exp))
+        self.snapshot_kinds.append(kind)
+
+    def spectrum_due(self):
+        """Whether to take a spectrum snapshot, spectrum.seconds after the last one."""
+        return (
+            self.config["spectrum"]["in_stream"] == 1
+            and not self.snapshot_kinds
+            and time.monotonic() >= self.next_spectrum_at
+        )
+
+    def receive_snapshots(self):
+        """Save, record and announce the raw snapshots the capture process has taken."""
+        while self.queue_snapshot.qsize() > 0:
+            snapshot = self.queue_snapshot.get()
+            kind = self.snapshot_kinds.popleft()
+            # Every snapshot gives spectra, a raw one stands in for the next spectrum one
+            self.add_spectra(snapshot["timestamp"], snapshot["ant_data"])
+            self.next_spectrum_at = time.monotonic() + self.config["spectrum"]["seconds"]
+            filename = None
+            if kind == "raw":
+                self.snapshots.pending = False
+                if self.config["raw"]["save"]:
+                    ret = save_raw(self.config, snapshot["timestamp"], snapshot["ant_data"])
+                    filename = ret["filename"]
+                    db.insert_raw_file_handle(
+                        filename,
+                        ret["checksum"],
+                        ret["checksum_algorithm"],
+                        os.path.getsize(filename),
+                    )
+                    notify_insert("raw")
+            record = self.snapshots.record(snapshot, filename)
+            logging.info(
+                f"{kind.capitalize()} snapshot, vis stopped for {record['downtime']:.3f} s"
+            )
+            # A new list, so the control loop knows to copy it to the shared config
+            self.config["raw_snapshots"] = list(self.snapshots.recent)
+            publish_gap(record)
+
+    def integrate(self, averages):
+        """Publish and archive the averages the integrator has finished."""
+        if not averages:
+            return
+        # New objects, so the control loop knows to copy them to the shared config
+        self.config["vis_integrated"] = self.integrator.latest()
+        self.config["vis_integrated_recent"] = self.integrator.recent()
+        if self.config["integration"]["save"] == 1:
+            for average in averages:
+                self.queue_archive.put(average)
+
+    def offer_image_frame(self, frame):
+        """Hand a frame to the imager when the next image is due, unless it is busy."""
+        now = time.monotonic()
+        if now < self.next_image_at:
+            return
+        settings = self.config["rt_syn_img"]
+        try:
+            self.queue_image.put_nowait(
+                (frame, array_geometry.get(self.config), settings["num_pixels"])
+            )
+        except queue.Full:
+            return
+        self.next_image_at = now + settings["seconds"]
 
     def vis_stream_finish(self):
         self.cmd_queue_capture.put("stop")
         self.cmd_queue_vis_calc.put("stop")
+        # A snapshot on its way out holds the capture process until it is read
+        while self.process_capture.is_alive():
+            self.receive_snapshots()
+            self.process_capture.join(0.1)
+        self.receive_snapshots()
         self.process_capture.join()
         self.process_vis_calc.join()
+        self.integrate(self.integrator.flush())
+        # Queued frames are written out before the archive process exits
+        self.queue_archive.put("stop")
+        self.process_archive.join()
+        if self.queue_image is not None:
+            self.queue_image.put("stop")
+            self.process_image.join()
+            self.queue_image = None
+        self.calibrator = None
         self.queue_vis = None
-        self.vislist = []
+        self.queue_snapshot = None
+        self.snapshot_kinds.clear()
+        self.snapshots.pending = False
+        self.queue_archive = None
+        self.archiving = False
         logging.info("Stopped visibility acquisition processes")
 
     def vis_stream_reconfigure(self):
@@ -11,11 +11,13 @@ import multiprocessing
 import time
 from typing import Any
 
-from .tart_control import (
-    TartControl,
-    cleanup_observation_cache,
-    cleanup_visibility_cache,
-)
+from .quality import init_quality_reports
+from .raw_snapshots import init_snapshot_requests
+from .retention import init_retention_events, retention_loop
+from .spectrum import init_waterfall
+from .tart_control import TartControl
+from .vis_ring import init_vis_ring
+from .vis_stream import init_vis_stream
 
 logger = logging.getLogger(__name__)
 
@@ -49,9 +51,21 @@ class TelescopeControlService:
     def __init__(self, runtime_config: dict[str, Any]):
         # Initialize shared config
         self.shared_config = init_shared_config(runtime_config)
+        # Created before the writers are forked so they inherit it
+        self.retention_events = init_retention_events()
+        self.vis_frames = init_vis_stream()
+        self.snapshot_requests = init_snapshot_requests()
+        self.quality_reports = init_quality_reports(_config_manager)
+        self.vis_ring = init_vis_ring(
+            runtime_config["vis"]["recent_frames"],
+            runtime_config["telescope_config"]["num_antenna"],
+        )
+        self.waterfall = init_waterfall(
+            runtime_config["spectrum"]["history"],
+            runtime_config["telescope_config"]["num_antenna"],
+        )
         self.tart_process: multiprocessing.Process | None = None
-        self.observation_cache_process: multiprocessing.Process | None = None
-        self.visibility_cache_process: multiprocessing.Process | None = None
+        self.retention_process: multiprocessing.Process | None = None
         self.running = False
 
     async def start(self) -> None:
@@ -63,18 +77,13 @@ class TelescopeControlService:
         logger.info("Starting telescope control service...")
 
         try:
-            # Start cache cleanup processes
-            self.observation_cache_process = multiprocessing.Process(
-                target=cleanup_observation_cache, args=()
+            # Start the retention process for the raw and vis file caches
+            self.retention_process = multiprocessing.Process(
+                target=retention_loop,
+                args=(self.retention_events, self.shared_config, self.shared_config),
             )
-            self.observation_cache_process.start()
-            logger.info("Started observation cache cleanup process")
-
-            self.visibility_cache_process = multiprocessing.Process(
-                target=cleanup_visibility_cache, args=()
-            )
-            self.visibility_cache_process.start()
-            logger.info("Started visibility cache cleanup process")
+            self.retention_process.start()
+            logger.info("Started retention process")
 
             # Start main telescope control process
             # Pass no arguments - the process will access shared config via global
@@ -108,22 +117,14 @@ class TelescopeControlService:
                     self.tart_process.join()
                 logger.info("Stopped telescope control process")
 
-            # Stop cache cleanup processes
-            if self.observation_cache_process and self.observation_cache_process.is_alive():
-                self.observation_cache_process.terminate()
-                self.observation_cache_process.join(timeout=5)
-                if self.observation_cache_process.is_alive():
-                    self.observation_cache_process.kill()
-                    self.observation_cache_process.join()
-                logger.info("Stopped observation cache process")
-
-            if self.visibility_cache_process and self.visibility_cache_process.is_alive():
-                self.visibility_cache_process.terminate()
-                self.visibility_cache_process.join(timeout=5)
-                if self.visibility_cache_process.is_alive():
-                    self.visibility_cache_process.kill()
-                    self.visibility_cache_process.join()
-                logger.info("Stopped visibility cache process")
+            # Stop retention process
+            if self.retention_process and self.retention_process.is_alive():
+                self.retention_process.terminate()
+                self.retention_process.join(timeout=5)
+                if self.retention_process.is_alive():
+                    self.retention_process.kill()
+                    self.retention_process.join()
+                logger.info("Stopped retention process")
 
             self.running = False
             logger.info("Telescope control service stopped")
@@ -148,6 +149,7 @@ class TelescopeControlService:
             config_dict = dict(shared_config)
             tart_control = TartControl(config_dict)
             logger.info("TartControl initialized, starting control loop")
+            synced = {}
 
             while True:
                 # Read current mode from shared config
@@ -158,10 +160,19 @@ class TelescopeControlService:
                 api_updatable_fields = [
                     "raw",
                     "vis",
+                    # Before the positions, so a new version never comes with old positions
+                    "antenna_positions_version",
                     "antenna_positions",
                     "mode",
                     "loop_mode",
                     "loop_n",
+                    "checksum",
+                    "rt_syn_img",
+                    "cal",
+                    "integration",
+                    "flagging",
+                    "quality",
+                    "spectrum",
                 ]
                 for field in api_updatable_fields:
                     if field in shared_config:
@@ -183,12 +194,20 @@ class TelescopeControlService:
                     "channels_timestamp",
                     "sample_delay",
                     "acquire",
+                    "calibration_status",
                 ]
 
                 for field in hardware_updatable_fields:
                     if field in tart_control.config:
                         shared_config[field] = tart_control.config[field]
 
+                # The averages and snapshot records are large and replaced once a
+                # frame at most, so they are only copied when they have been replaced
+                for field in ("vis_integrated", "vis_integrated_recent", "raw_snapshots"):
+                    value = tart_control.config.get(field)
+                    if value is not None and value is not synced.get(field):
+                        shared_config[field] = synced[field] = value
+
                 # Add sleep to prevent excessive CPU usage in main control loop
                 # The individual state handlers (tart_control.run()) have their own sleep,
                 # but we need additional sleep here to prevent the loop from spinning
@@ -209,14 +228,10 @@ class TelescopeControlService:
         return {
             "service_running": self.running,
             "tart_process_alive": (self.tart_process.is_alive() if self.tart_process else False),
-            "observation_cache_alive": (
-                self.observation_cache_process.is_alive()
-                if self.observation_cache_process
-                else False
-            ),
-            "visibility_cache_alive": (
-                self.visibility_cache_process.is_alive() if self.visibility_cache_process else False
+            "retention_alive": (
+                self.retention_process.is_alive() if self.retention_process else False
             ),
+            "retention": self.shared_config.get("retention_status", {}),
             "current_mode": self.shared_config.get("mode", "unknown"),
         }
 
@@ -0,0 +1,293 @@
+"""
+Visibility archive writer for the TART web api.
+
+Frames are appended to an open, chunked, extendible HDF5 file as they arrive,
+and the file is rolled over on size or age boundaries. The writer runs in its
+own process so that gain lookups, file writes and checksums never stall the
+control loop that drains the visibility queue.
+
+The file layout matches tart.imaging.visibility.to_hdf5(), so archived files
+can still be read with visibility.list_load(). Extra timestamp_ns and flags
+(the packed flag bits of services.flagger) datasets are chunked like vis,
+and the byte offsets of every chunk (frame block) are recorded in the
+vis_blocks table so that time ranges can be read back without opening the
+HDF5 file.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+import h5py
+import numpy as np
+from tart_hardware_interface.highlevel_modes_api import (
+    PARTIAL_SUFFIX,
+    checksum_settings,
+    rename_hashed,
+)
+
+from database import operations as db
+from services.channel_cache import current_gains
+from services.integrator import IntegratedArchive
+from services.retention import notify_insert
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a frame before checking the time based rollover
+IDLE_TIMEOUT = 1.0
+
+# Seconds between attempts to close a file that failed to close
+CLOSE_RETRY_SECONDS = 10.0
+
+
+class VisArchiveFile:
+    """
+    A visibility file that is open for appending.
+
+    The file is written to filename + PARTIAL_SUFFIX and flushed after every
+    frame block, so a crash loses at most the block being filled. Closing it
+    hashes the file in blocks and renames it to filename; a close that fails
+    can be retried.
+    """
+
+    def __init__(self, filename, vis, ant_pos, gain, phases, chunk_frames):
+        self.filename = filename
+        self.ant_pos = ant_pos
+        self.n_frames = 0
+        self.chunk_frames = chunk_frames
+        self.timestamps_ns = []
+        self.opened_at = time.monotonic()
+        self.partial_filename = filename + PARTIAL_SUFFIX
+        self.checksum = None
+        self._h5f = h5py.File(self.partial_filename, "w")
+
+        num_baselines = len(vis.baselines)
+        conf_dset = self._h5f.create_dataset("config", (1,), dtype=h5py.special_dtype(vlen=bytes))
+        conf_dset[0] = vis.config.to_json()
+        self._h5f.create_dataset(
+            "phase_elaz", data=[vis.phase_el.to_degrees(), vis.phase_az.to_degrees()]
+        )
+        self._h5f.create_dataset("baselines", data=vis.baselines)
+        self._h5f.create_dataset("gains", data=np.array(gain, dtype=np.float32))
+        self._h5f.create_dataset("phases", data=np.array(phases, dtype=np.float32))
+        self._h5f.create_dataset("antenna_positions", data=np.array(ant_pos, dtype=np.float32))
+        self._vis = self._h5f.create_dataset(
+            "vis",
+            shape=(0, num_baselines),
+            maxshape=(None, num_baselines),
+            chunks=(chunk_frames, num_baselines),
+            dtype=np.complex64,
+        )
+        self._timestamp = self._h5f.create_dataset(
+            "timestamp",
+            shape=(0,),
+            maxshape=(None,),
+            chunks=(chunk_frames,),
+            dtype=h5py.special_dtype(vlen=str),
+        )
+        self._timestamp_ns = self._h5f.create_dataset(
+            "timestamp_ns",
+            shape=(0,),
+            maxshape=(None,),
+            chunks=(chunk_frames,),
+            dtype="<i8",
+        )
+        flag_bytes = (num_baselines + 7) // 8
+        self._flags = self._h5f.create_dataset(
+            "flags",
+            shape=(0, flag_bytes),
+            maxshape=(None, flag_bytes),
+            chunks=(chunk_frames, flag_bytes),
+            dtype=np.uint8,
+        )
+
+    def append(self, vis, flags):
+        n = self.n_frames
+        timestamp_ns = db.to_ns(vis.timestamp)
+        for dset in (self._vis, self._timestamp, self._timestamp_ns, self._flags):
+            dset.resize(n + 1, axis=0)
+        self._vis[n] = np.asarray(vis.v, dtype=np.complex64)
+        self._timestamp[n] = vis.timestamp.isoformat()
+        self._timestamp_ns[n] = timestamp_ns
+        self._flags[n] = flags
+        self.timestamps_ns.append(timestamp_ns)
+        self.n_frames = n + 1
+        if self.n_frames % self.chunk_frames == 0:
+            self._h5f.flush()
+
+    @property
+    def nbytes(self):
+        # HDF5 holds recent chunks in its cache, so estimate from the frame count
+        return self.n_frames * self._vis.dtype.itemsize * self._vis.shape[1]
+
+    @property
+    def age(self):
+        return time.monotonic() - self.opened_at
+
+    @property
+    def closed(self):
+        return self._h5f is None
+
+    def close(self, algorithm="sha256"):
+        """
+        Finish the HDF5 file, rename it into place and return its checksum.
+
+        The file is written incrementally so a crash loses at most a chunk, and
+        HDF5 rewrites its metadata in place until it is closed, so it is hashed
+        by reading it once after close rather than as it is written.
+        """
+        if self._h5f is not None:
+            self._h5f.close()
+            self._h5f = None
+        if self.checksum is None:
+            self.blocks = self._block_index()
+            self.size_bytes = os.path.getsize(self.partial_filename)
+            self.checksum = rename_hashed(self.partial_filename, self.filename, algorithm)
+        return self.checksum
+
+    def _block_index(self):
+        """Locate each frame block (HDF5 chunk) in the finished file."""
+        blocks = []
+        with h5py.File(self.partial_filename, "r") as h5f:
+            vis_id = h5f["vis"].id
+            ts_id = h5f["timestamp_ns"].id
+            flags_id = h5f["flags"].id
+            for block, frame_offset in enumerate(range(0, self.n_frames, self.chunk_frames)):
+                vis_chunk = vis_id.get_chunk_info_by_coord((frame_offset, 0))
+                ts_chunk = ts_id.get_chunk_info_by_coord((frame_offset,))
+                flags_chunk = flags_id.get_chunk_info_by_coord((frame_offset, 0))
+                n_frames = min(self.chunk_frames, self.n_frames - frame_offset)
+                blocks.append(
+                    {
+                        "block": block,
+                        "start_ns": self.timestamps_ns[frame_offset],
+                        "end_ns": self.timestamps_ns[frame_offset + n_frames - 1],
+                        "frame_offset": frame_offset,
+                        "n_frames": n_frames,
+                        "vis_offset": vis_chunk.byte_offset,
+                        "vis_nbytes": vis_chunk.size,
+                        "ts_offset": ts_chunk.byte_offset,
+                        "ts_nbytes": ts_chunk.size,
+                        "flags_offset": flags_chunk.byte_offset,
+                        "flags_nbytes": flags_chunk.size,
+                    }
+                )
+        return blocks
+
+
+def open_archive_file(vis, ant_pos, runtime_config):
+    vis_config = runtime_config["vis"]
+    filename = os.path.join(
+        vis_config["base_path"],
+        "vis_{}.hdf".format(vis.timestamp.strftime("%Y-%m-%d_%H_%M_%S.%f")),
+    )
+    # Save the gains and phases that were current when the file was opened
+    gain, phases = current_gains()
+    return VisArchiveFile(filename, vis, ant_pos, gain, phases, vis_config["chunksize"])
+
+
+def close_archive_file(archive, runtime_config):
+    algorithm, _ = checksum_settings(runtime_config)
+    checksum = archive.close(algorithm)
+    db.insert_vis_file_handle(
+        archive.filename, checksum, algorithm, archive.blocks, archive.size_bytes
+    )
+    notify_insert("vis")
+    logger.info(
+        "Archived %d visibilities to %s (%s)", archive.n_frames, archive.filename, algorithm
+    )
+
+
+def needs_rollover(archive, vis_config):
+    return (
+        archive.age >= vis_config["file_seconds"] or archive.nbytes >= vis_config["file_max_bytes"]
+    )
+
+
+def retry_closes(unclosed, runtime_config, logger=logger):
+    """Close the files that failed to close, returns those that still fail."""
+    failed = []
+    for archive in unclosed:
+        try:
+            close_archive_file(archive, runtime_config)
+        except Exception as e:
+            logger.error("Could not close %s: %s", archive.filename, e)
+            failed.append(archive)
+    return failed
+
+
+def archive_loop(archive_queue, runtime_config, logger=logger):
+    """
+    Append visibilities from archive_queue to rolling HDF5 files.
+
+    Queue items are (vis, antenna_positions, flags) tuples, averaged frames
+    from the integrator (dicts), which go to their own files, or one of the
+    commands "flush" (close the current file) and "stop" (close the file and
+    exit).
+    Commands travel on the same queue as the frames, so every frame queued
+    before a command is written before it is acted on.
+    A file that fails to close is kept, and the close retried, until it
+    succeeds. Files still unclosed at "stop" are left on disk as partial files.
+    """
+    logger.debug("archive_loop start")
+    integration = runtime_config["integration"]
+    integrated = IntegratedArchive(integration["base_path"], integration["keep_days"])
+    archive = None
+    unclosed = []
+    retry_at = 0.0
+    active = 1
+    while active:
+        try:
+            try:
+                item = archive_queue.get(timeout=IDLE_TIMEOUT)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, dict):
+                integrated.append(item)
+                continue
+            if isinstance(item, str):
+                if item == "stop":
+                    active = 0
+                rollover = archive is not None
+            elif archive is not None:
+                # Antenna positions are stored once per file
+                rollover = needs_rollover(archive, runtime_config["vis"]) or (
+                    item is not None and item[1] != archive.ant_pos
+                )
+            else:
+                rollover = False
+
+            if rollover:
+                unclosed.append(archive)
+                archive = None
+            if unclosed and (rollover or not active or time.monotonic() >= retry_at):
+                unclosed = retry_closes(unclosed, runtime_config, logger)
+                retry_at = time.monotonic() + CLOSE_RETRY_SECONDS
+
+            if item is None or isinstance(item, str):
+                continue
+
+            vis, ant_pos, flags = item
+            if archive is None:
+                archive = open_archive_file(vis, ant_pos, runtime_config)
+            archive.append(vis, flags)
+        except Exception as e:
+            logger.error("Archive Error %s", e)
+            logger.exception(e)
+    for current in unclosed:
+        logger.error("Leaving %s unclosed", current.partial_filename)
+    logger.debug("archive_loop finished")
+    return 1
+
+
+def start_vis_archive(runtime_config):
+    archive_queue = multiprocessing.Queue()
+    archive_process = multiprocessing.Process(
+        target=archive_loop,
+        args=(archive_queue, runtime_config, logger),
+    )
+    archive_process.start()
+    return archive_queue, archive_process
@@ -0,0 +1,267 @@
+"""
+Serialize-once cache of the latest visibilities response.
+
+Many clients poll /imaging/vis for the same frame. The body for a (frame,
+channel configuration, media type, query) is built once, with the disabled
+channels, the baselines flagged in the frame (see services.flagger) and the
+baselines outside the query dropped through NumPy masks,
+and then served as bytes until either the frame or the channel mask
+changes. Calibrated responses multiply the frame by the correction vector of
+channel_cache.calibration(), and are also rebuilt when the gains change.
+Queries with an integration serve the latest average of that cadence from
+services.integrator instead of the latest frame. Bodies are JSON, or the compact binary format of app.vis_codec
+for clients that ask for it. Requests that miss while the body is being
+built wait for that build instead of starting their own.
+"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.vis_codec import VIS_MEDIA_TYPE, encode_header, encode_records
+from database.migrations import to_ns
+
+from . import channel_cache
+from .flagger import frame_flags
+from .geometry import array_geometry
+
+logger = logging.getLogger(__name__)
+
+# Enough for the representations and subsets that dashboards poll for
+CACHE_SIZE = 32
+
+
+@dataclass(frozen=True)
+class EncodedResponse:
+    key: tuple
+    etag: str
+    body: bytes
+
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+@dataclass(frozen=True)
+class VisQuery:
+    """
+    Which baselines of a frame to return, and how.
+
+    antennas:        only baselines between these antennas
+    baselines:       only these (i, j) baselines, with i < j
+    min_length:      only baselines at least this long, in metres
+    max_length:      only baselines at most this long, in metres
+    representation:  "reim" for re and im, "ampphase" for amp and phase (radians)
+    precision:       "float64", or "float32" to round values to 7 significant digits
+    calibrated:      apply the current gains and phase offsets
+    integration:     the latest average over this many seconds, not the latest frame
+    """
+
+    antennas: tuple[int, ...] | None = None
+    baselines: tuple[tuple[int, int], ...] | None = None
+    min_length: float | None = None
+    max_length: float | None = None
+    representation: str = "reim"
+    precision: str = "float64"
+    calibrated: bool = False
+    integration: int | None = None
+
+    @property
+    def uses_geometry(self):
+        return self.min_length is not None or self.max_length is not None
+
+    def select(self, i, j, num_ant, lengths=None):
+        """Mask of the baselines (i, j) that the query keeps."""
+        keep = np.ones(len(i), dtype=bool)
+        if self.antennas is not None:
+            ant = np.zeros(num_ant, dtype=bool)
+            ant[list(self.antennas)] = True
+            keep &= ant[i] & ant[j]
+        if self.baselines is not None:
+            pairs = np.zeros((num_ant, num_ant), dtype=bool)
+            pairs[tuple(np.array(self.baselines).T)] = True
+            keep &= pairs[i, j]
+        if self.min_length is not None:
+            keep &= lengths[i, j] >= self.min_length
+        if self.max_length is not None:
+            keep &= lengths[i, j] <= self.max_length
+        return keep
+
+
+ALL_BASELINES = VisQuery()
+
+
+def make_etag(timestamp, channel_version, media_type=JSON_MEDIA_TYPE, query=None):
+    # Each representation of a frame needs its own strong ETag. The query is
+    # part of the URL, so it need not be part of the ETag. For calibrated
+    # responses the version includes the gains version, and for queries by
+    # baseline length the antenna_positions_version.
+    suffix = "-b" if media_type == VIS_MEDIA_TYPE else ""
+    return f'"{to_ns(timestamp)}-{channel_version}{suffix}"'
+
+
+def source_frame(config, integration=None):
+    """The latest frame, or the latest average at the integration cadence."""
+    if integration is None:
+        return config.get("vis_current")
+    return (config.get("vis_integrated") or {}).get(integration)
+
+
+def latest_timestamp(config, integration=None):
+    """Timestamp of source_frame(), without fetching the frame itself if possible."""
+    if integration is None:
+        return config.get("vis_timestamp")
+    frame = source_frame(config, integration)
+    return None if frame is None else frame["timestamp"]
+
+
+def calibrate_frame(frame):
+    """
+    Returns:
+        tuple: (version, mask, frame) with the frame calibrated by the current
+        gains, and the "channels.gains" version and channel mask it used
+    """
+    (channels, gains), mask, correction = channel_cache.calibration(frame["baselines"])
+    return f"{channels}.{gains}", mask, {**frame, "vis": frame["vis"] * correction}
+
+
+def select_baselines(frame, mask, query=ALL_BASELINES, lengths=None):
+    """
+    Returns:
+        tuple: (baselines (B', 2), vis (B',)) of the unflagged baselines between
+        channels in the mask that the query keeps
+    """
+    baselines = frame["baselines"]
+    i, j = baselines[:, 0], baselines[:, 1]
+    keep = mask[i] & mask[j] & ~frame_flags(frame)
+    if query != ALL_BASELINES:
+        keep &= query.select(i, j, len(mask), lengths)
+    return baselines[keep], frame["vis"][keep]
+
+
+def _values(x, precision):
+    if precision == "float32":
+        # The shortest decimals that round trip through float32
+        return [float(f"{v:.7g}") for v in x.tolist()]
+    return x.tolist()
+
+
+def frame_payload(frame, mask, query=ALL_BASELINES, lengths=None):
+    """The /imaging/vis response for a frame from the shared config, as a dict."""
+    baselines, vis = select_baselines(frame, mask, query, lengths)
+    if query.representation == "ampphase":
+        names = ("amp", "phase")
+        columns = (np.abs(vis), np.angle(vis))
+    else:
+        names = ("re", "im")
+        columns = (vis.real, vis.imag)
+    a, b = (_values(c, query.precision) for c in columns)
+    data = [
+        {"i": i, "j": j, names[0]: x, names[1]: y}
+        for (i, j), x, y in zip(baselines.tolist(), a, b, strict=True)
+    ]
+    payload = {"data": data, "timestamp": frame["timestamp"].isoformat().replace("+00:00", "Z")}
+    if "integration" in frame:
+        payload["integration"] = frame["integration"]
+        payload["samples"] = frame["samples"]
+    return payload
+
+
+def encode_frame(frame, mask, query=ALL_BASELINES, lengths=None):
+    """JSON body of a frame, keeping the baselines between enabled channels."""
+    return json.dumps(frame_payload(frame, mask, query, lengths), separators=(",", ":")).encode()
+
+
+def encode_frame_binary(frame, mask, query=ALL_BASELINES, lengths=None):
+    """A frame in the binary format of app.vis_codec: header and a single record."""
+    baselines, vis = select_baselines(frame, mask, query, lengths)
+    return encode_header(baselines) + encode_records([to_ns(frame["timestamp"])], vis[None])
+
+
+ENCODERS = {
+    JSON_MEDIA_TYPE: encode_frame,
+    VIS_MEDIA_TYPE: encode_frame_binary,
+}
+
+
+class VisFeedCache:
+    """
+    Encoded /imaging/vis responses, keyed by (frame timestamp, channel
+    version, media type, query). For calibrated queries the version is
+    "channels.gains", and queries by baseline length add the version of
+    the antenna positions, so the subset changes when the array is moved.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._pending = {}
+
+    def current_key(self, config, media_type=JSON_MEDIA_TYPE, query=ALL_BASELINES):
+        """Key of the response for the latest frame, without fetching the frame itself."""
+        timestamp = latest_timestamp(config, query.integration)
+        if timestamp is None:
+            return None
+        version = channel_cache.channel_version()
+        if query.calibrated:
+            version = f"{version}.{channel_cache.gains_version()}"
+        if query.uses_geometry:
+            version = f"{version}.{array_geometry.get(config).version}"
+        return (timestamp, version, media_type, query)
+
+    def build(self, config, media_type, query):
+        frame = source_frame(config, query.integration)
+        if frame is None:
+            return None
+        if query.calibrated:
+            version, mask, frame = calibrate_frame(frame)
+        else:
+            version, mask = channel_cache.versioned_channel_mask()
+        lengths = None
+        if query.uses_geometry:
+            geometry = array_geometry.get(config)
+            version = f"{version}.{geometry.version}"
+            lengths = geometry.lengths
+        key = (frame["timestamp"], version, media_type, query)
+        body = ENCODERS[media_type](frame, mask, query, lengths)
+        return EncodedResponse(key, make_etag(*key), body)
+
+    async def get(self, config, media_type=JSON_MEDIA_TYPE, query=ALL_BASELINES):
+        """
+        Returns:
+            EncodedResponse | None: the latest frame, None if there is none yet
+        """
+        key = self.current_key(config, media_type, query)
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(
+                asyncio.to_thread(self.build, config, media_type, query)
+            )
+            self._pending[key] = pending
+            pending.add_done_callback(lambda f: self._built(key, f))
+        # A cancelled request must not cancel the build shared with the others
+        return await asyncio.shield(pending)
+
+    def _built(self, key, future):
+        del self._pending[key]
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+        # Stored under the frame actually read, which may be newer than the key asked for
+        entry = future.result()
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+vis_feed = VisFeedCache()
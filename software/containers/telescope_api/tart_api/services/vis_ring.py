@@ -0,0 +1,132 @@
+"""
+Ring buffer of the most recent visibility frames, in shared memory.
+
+The buffer is a preallocated (capacity, baselines) complex64 array with a
+matching array of timestamps, created before the control process is
+forked. The control process copies each new frame into the next row, with
+the flagged visibilities as NaN, so recording a frame allocates nothing.
+The API reads the latest rows straight from the same memory for
+/imaging/vis/recent, without disk I/O or a round trip through the shared
+config.
+"""
+
+import multiprocessing
+
+import numpy as np
+
+from app.vis_codec import encode_header, encode_records
+from database.migrations import to_ns
+
+from . import channel_cache
+from .flagger import flagged_nan, frame_flags
+
+# The ring, created before the control process is forked
+_ring = None
+
+
+class VisRing:
+    """The latest capacity frames of a num_ant antenna array."""
+
+    def __init__(self, capacity, num_ant):
+        num_baselines = num_ant * (num_ant - 1) // 2
+        self.capacity = capacity
+        self._lock = multiprocessing.Lock()
+        # complex64 as pairs of float32
+        self._vis = multiprocessing.RawArray("f", 2 * capacity * num_baselines)
+        self._timestamps = multiprocessing.RawArray("q", capacity)
+        self._baselines = multiprocessing.RawArray("B", 2 * num_baselines)
+        # Frames written since the baseline order was last set. Guarded by the lock.
+        self._count = multiprocessing.RawValue("q", 0)
+        self._views = None
+
+    def views(self):
+        """(vis, timestamps_ns, baselines) NumPy views of the shared memory."""
+        if self._views is None:
+            self._views = (
+                np.frombuffer(self._vis, dtype=np.complex64).reshape(self.capacity, -1),
+                np.frombuffer(self._timestamps, dtype=np.int64),
+                np.frombuffer(self._baselines, dtype=np.uint8).reshape(-1, 2),
+            )
+        return self._views
+
+    def append(self, frame):
+        vis, timestamps, baselines = self.views()
+        with self._lock:
+            if not np.array_equal(frame["baselines"], baselines):
+                # A new baseline order makes the frames in the ring incomparable
+                baselines[:] = frame["baselines"]
+                self._count.value = 0
+            row = self._count.value % self.capacity
+            np.copyto(vis[row], frame["vis"], casting="same_kind")
+            vis[row, frame_flags(frame)] = np.nan
+            timestamps[row] = to_ns(frame["timestamp"])
+            self._count.value += 1
+
+    def recent(self, n, after_ns=None):
+        """
+        Returns:
+            tuple: (baselines (B, 2), timestamps_ns (N,), vis (N, B)) copies of the
+            latest N <= n frames, oldest first, only those after after_ns if given.
+            None if no frame has been recorded.
+        """
+        vis, timestamps, baselines = self.views()
+        with self._lock:
+            count = self._count.value
+            if count == 0:
+                return None
+            rows = np.arange(count - min(n, count, self.capacity), count) % self.capacity
+            recent = baselines.copy(), timestamps[rows], vis[rows]
+        if after_ns is not None:
+            newer = recent[1] > after_ns
+            recent = recent[0], recent[1][newer], recent[2][newer]
+        return recent
+
+
+def init_vis_ring(capacity, num_ant):
+    global _ring
+    _ring = VisRing(capacity, num_ant)
+    return _ring
+
+
+def record_frame(frame):
+    """Copy a new frame into the ring."""
+    if _ring is not None:
+        _ring.append(frame)
+
+
+def recent_frames(n, after_ns=None):
+    """See VisRing.recent(), None before the ring has been created."""
+    if _ring is None:
+        return None
+    return _ring.recent(n, after_ns)
+
+
+def recent_averages(config, integration, n, after_ns=None):
+    """The latest n averages at a cadence from services.integrator, as recent_frames()."""
+    averages = (config.get("vis_integrated_recent") or {}).get(integration, [])[-n:]
+    if not averages:
+        return None
+    baselines = averages[-1]["baselines"]
+    averages = [a for a in averages if np.array_equal(a["baselines"], baselines)]
+    timestamps_ns = np.array([to_ns(a["timestamp"]) for a in averages], dtype=np.int64)
+    vis = np.array([flagged_nan(a["vis"], frame_flags(a)) for a in averages])
+    if after_ns is not None:
+        newer = timestamps_ns > after_ns
+        timestamps_ns, vis = timestamps_ns[newer], vis[newer]
+    return baselines, timestamps_ns, vis
+
+
+def encode_recent(baselines, timestamps_ns, vis, query):
+    """
+    Binary encoding (see app.vis_codec) of frames, keeping the baselines
+    between enabled channels that the query (a vis_feed.VisQuery) selects.
+    Flagged visibilities are NaN.
+    """
+    if query.calibrated:
+        _, mask, correction = channel_cache.calibration(baselines)
+        vis = vis * correction
+    else:
+        mask = channel_cache.channel_mask()
+    i, j = baselines[:, 0], baselines[:, 1]
+    keep = mask[i] & mask[j] & query.select(i, j, len(mask))
+    return encode_header(baselines[keep]) + encode_records(timestamps_ns, vis[:, keep])
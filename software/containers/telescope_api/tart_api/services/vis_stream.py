@@ -0,0 +1,234 @@
+"""
+Live stream of visibility frames and FPGA status to subscribers.
+
+The control process publishes every new frame on a queue created before it
+is forked, without blocking: if the API falls behind, frames are dropped at
+the source. In the API process a reader thread hands the frames to the
+event loop, where each frame is encoded once per (format, antenna subset,
+calibration) and offered to every subscriber. Subscribers have a bounded queue that
+drops the oldest message when the client cannot keep up, so a slow client
+never holds back the others. The FPGA status is checked at a lower rate
+and sent when it changes. Raw snapshots taken during the stream (see
+services.raw_snapshots) are announced to every subscriber as gap messages,
+published on the same queue as the frames so they arrive in order.
+
+Long-polling clients wait on a future that the hub resolves with the
+timestamp of each new frame, and those waiting for an average check the
+latest one of their cadence whenever a frame arrives.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+
+from . import channel_cache
+from .vis_feed import (
+    calibrate_frame,
+    encode_frame_binary,
+    frame_payload,
+    latest_timestamp,
+)
+
+logger = logging.getLogger(__name__)
+
+# Frames waiting for the API process; beyond this the control process drops them
+FRAME_QUEUE_SIZE = 8
+
+# New frames, created before the control process is forked
+_frames = None
+
+
+def init_vis_stream():
+    global _frames
+    _frames = multiprocessing.Queue(FRAME_QUEUE_SIZE)
+    return _frames
+
+
+def publish_frame(frame):
+    """Offer a new frame to the stream subscribers, never blocking the caller."""
+    if _frames is None:
+        return
+    try:
+        _frames.put_nowait(frame)
+    except queue.Full:
+        pass
+
+
+def publish_gap(snapshot):
+    """Announce the gap a raw snapshot left in the stream, never blocking the caller."""
+    publish_frame({"gap": snapshot})
+
+
+def encode_vis(frame, mask, fmt):
+    if fmt == "binary":
+        return encode_frame_binary(frame, mask)
+    return json.dumps({"type": "vis", **frame_payload(frame, mask)}, separators=(",", ":"))
+
+
+def encode_status(status):
+    return json.dumps({"type": "status", "status": jsonable_encoder(status)}, separators=(",", ":"))
+
+
+def encode_gap(snapshot):
+    return json.dumps({"type": "gap", **jsonable_encoder(snapshot)}, separators=(",", ":"))
+
+
+class Subscriber:
+    """
+    One client of the stream, with a drop-oldest queue of encoded messages
+    and their types (vis, status or gap).
+    """
+
+    def __init__(self, fmt, antennas, status, queue_size, num_ant, calibrated=False):
+        self.fmt = fmt
+        self.calibrated = calibrated
+        self.antennas = None if antennas is None else tuple(sorted(set(antennas.tolist())))
+        self.status = status
+        self.mask = np.ones(num_ant, dtype=bool)
+        if self.antennas is not None:
+            self.mask[:] = False
+            self.mask[list(self.antennas)] = True
+        self.dropped = 0
+        self._messages = deque(maxlen=queue_size)
+        self._ready = asyncio.Event()
+
+    def put(self, kind, message):
+        if len(self._messages) == self._messages.maxlen:
+            self.dropped += 1
+        self._messages.append((kind, message))
+        self._ready.set()
+
+    async def get(self):
+        """
+        Returns:
+            tuple: (type, message) of the next message, text (str) or binary (bytes)
+        """
+        while not self._messages:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._messages.popleft()
+
+
+class StreamHub:
+    """Fans the published frames and status out to the subscribers of this process."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.status = None
+        self._loop = None
+        self._reader = None
+        self._stopping = threading.Event()
+        self._status_task = None
+        self._next_frame = None
+
+    def start(self, config, frames, queue_size, status_seconds):
+        self.queue_size = queue_size
+        self.num_ant = config["telescope_config"]["num_antenna"]
+        self._loop = asyncio.get_running_loop()
+        self._next_frame = self._loop.create_future()
+        self._stopping.clear()
+        self._reader = threading.Thread(
+            target=self._read_frames, args=(frames,), name="vis-stream", daemon=True
+        )
+        self._reader.start()
+        self._status_task = asyncio.create_task(self._watch_status(config, status_seconds))
+
+    async def stop(self):
+        self._stopping.set()
+        if self._status_task is not None:
+            self._status_task.cancel()
+        if self._reader is not None:
+            await asyncio.to_thread(self._reader.join)
+
+    def _read_frames(self, frames):
+        while not self._stopping.is_set():
+            try:
+                frame = frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._loop.call_soon_threadsafe(self.dispatch, frame)
+
+    async def frame_after(self, config, after, timeout, integration=None):
+        """
+        Wait until a frame, or with an integration an average, newer than after
+        has been published.
+
+        Returns:
+            datetime | None: the timestamp of that frame, None on timeout
+        """
+        deadline = self._loop.time() + timeout
+        # Taken before reading the latest timestamp, so no frame is missed in between
+        next_frame = self._next_frame
+        timestamp = latest_timestamp(config, integration)
+        while timestamp is None or timestamp <= after:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                # Shielded, the future is shared by all waiting requests
+                timestamp = await asyncio.wait_for(asyncio.shield(next_frame), remaining)
+            except TimeoutError:
+                return None
+            if integration is not None:
+                timestamp = latest_timestamp(config, integration)
+            next_frame = self._next_frame
+        return timestamp
+
+    def dispatch(self, frame):
+        if "gap" in frame:
+            message = encode_gap(frame["gap"])
+            for sub in self.subscribers:
+                sub.put("gap", message)
+            return
+        self._next_frame.set_result(frame["timestamp"])
+        self._next_frame = self._loop.create_future()
+        if not self.subscribers:
+            return
+        frames = {False: (channel_cache.channel_mask(), frame)}
+        encoded = {}
+        for sub in self.subscribers:
+            key = (sub.fmt, sub.antennas, sub.calibrated)
+            if key not in encoded:
+                if sub.calibrated and True not in frames:
+                    frames[True] = calibrate_frame(frame)[1:]
+                channels, source = frames[sub.calibrated]
+                encoded[key] = encode_vis(source, channels & sub.mask, sub.fmt)
+            sub.put("vis", encoded[key])
+
+    async def _watch_status(self, config, interval):
+        while True:
+            try:
+                status = await asyncio.to_thread(config.get, "status")
+                if status is not None and status != self.status:
+                    self.status = status
+                    message = encode_status(status)
+                    for sub in self.subscribers:
+                        if sub.status:
+                            sub.put("status", message)
+            except Exception as e:
+                logger.warning(f"Could not read the FPGA status for the stream: {e}")
+            await asyncio.sleep(interval)
+
+    @contextmanager
+    def subscribe(self, fmt="json", antennas=None, status=True, calibrated=False):
+        sub = Subscriber(fmt, antennas, status, self.queue_size, self.num_ant, calibrated)
+        if status and self.status is not None:
+            sub.put("status", encode_status(self.status))
+        self.subscribers.add(sub)
+        try:
+            yield sub
+        finally:
+            self.subscribers.discard(sub)
+            if sub.dropped:
+                logger.info(f"Stream subscriber left, {sub.dropped} messages dropped")
+
+
+stream_hub = StreamHub()
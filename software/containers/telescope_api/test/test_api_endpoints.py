@@ -5,8 +5,12 @@ This test suite validates all API endpoints to ensure they work correctly
 after the FastAPI migration from Flask.
 """
 
+import ast
+import json
 import os
+import struct
 import time
+from datetime import UTC, datetime, timedelta
 
 import pytest
 import requests
@@ -176,6 +180,24 @@ class TARTAPITestClient:
         self.token = token_data["access_token"]
         self.headers = {"Authorization": f"Bearer {self.token}"}
 
+    def set_mode(self, mode):
+        """Switch the telescope mode, and return the previous one."""
+        previous = requests.get(f"{self.base_url}/mode/current").json()["mode"]
+        self.authenticate()
+        response = requests.post(f"{self.base_url}/mode/{mode}", headers=self.headers)
+        assert response.status_code == 200
+        assert response.json()["mode"] == mode
+        return previous
+
+    def wait_for(self, url, seconds, until, params=None):
+        """Poll url until until(response) holds, and return that response."""
+        for _ in range(int(seconds / 0.5)):
+            response = requests.get(url, params=params)
+            if until(response):
+                return response
+            time.sleep(0.5)
+        pytest.fail(f"No response from {url} within {seconds} seconds")
+
     def test_health_check(self):
         """Test health check endpoint."""
         response = requests.get(f"{self.base_url}/health")
@@ -493,6 +515,54 @@ class TARTAPITestClient:
         assert isinstance(data, list)
         assert len(data) > 0
 
+    def test_gain_history_endpoint(self):
+        """Test the calibration history and time-travel gain lookup."""
+        self.authenticate()
+        original = requests.get(f"{self.base_url}/calibration/gain").json()
+        num_ant = len(original["gain"])
+        first = {"gain": [0.5] * num_ant, "phase_offset": [0.1] * num_ant}
+        second = {"gain": [0.75] * num_ant, "phase_offset": [0.2] * num_ant}
+        try:
+            for gains in (first, second, second):
+                response = requests.post(
+                    f"{self.base_url}/calibration/gain", json=gains, headers=self.headers
+                )
+                assert response.status_code == 200
+
+            # Newest first, and the repeated set was not stored again
+            response = requests.get(f"{self.base_url}/calibration/gain/history", params={"limit": 1})
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page["items"]) == 1
+            assert page["items"][0]["gain"] == second["gain"]
+            assert page["next_before"] is not None
+
+            response = requests.get(
+                f"{self.base_url}/calibration/gain/history",
+                params={"limit": 1, "before": page["next_before"]},
+            )
+            older = response.json()["items"][0]
+            assert older["gain"] == first["gain"]
+            assert older["phase_offset"] == first["phase_offset"]
+
+            # The gains in use at the time of the older set
+            response = requests.get(
+                f"{self.base_url}/calibration/gain", params={"at": older["timestamp"]}
+            )
+            assert response.status_code == 200
+            assert response.json()["gain"] == first["gain"]
+
+            # Before any calibration was recorded
+            response = requests.get(
+                f"{self.base_url}/calibration/gain", params={"at": "2000-01-01T00:00:00Z"}
+            )
+            assert response.status_code == 404
+
+            response = requests.get(f"{self.base_url}/calibration/gain/history", params={"limit": 0})
+            assert response.status_code == 422
+        finally:
+            requests.post(f"{self.base_url}/calibration/gain", json=original, headers=self.headers)
+
     def test_imaging_endpoints(self):
         """Test imaging endpoints."""
         # Test get latest visibilities
@@ -502,6 +572,32 @@ class TARTAPITestClient:
         # Response might be empty if no data available, but should not error
         data = response.json()
         # The response structure depends on whether vis_current is available
+        etag = response.headers.get("ETag")
+        if etag is not None:
+            assert "timestamp" in data
+
+            # Up to date clients get a 304, unless a new frame arrived meanwhile
+            response = requests.get(
+                f"{self.base_url}/imaging/vis", headers={"If-None-Match": etag}
+            )
+            assert response.status_code in [200, 304]
+            if response.status_code == 304:
+                assert response.headers["ETag"] == etag
+                assert response.content == b""
+            else:
+                assert response.headers["ETag"] != etag
+
+            # Binary representation on request, with its own ETag
+            response = requests.get(
+                f"{self.base_url}/imaging/vis", headers={"Accept": "application/vnd.tart.vis"}
+            )
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("application/vnd.tart.vis")
+            assert response.headers["ETag"] != etag
+            magic, num_baselines, _ = struct.unpack_from("<4sHH", response.content)
+            assert magic == b"TVF1"
+            assert num_baselines == len(data["data"])
+            assert len(response.content) == 8 + 2 * num_baselines + 8 + 8 * num_baselines
 
         # Test antenna positions
         response = requests.get(f"{self.base_url}/imaging/antenna_positions")
@@ -526,6 +622,453 @@ class TARTAPITestClient:
             error_data = response.json()
             assert "detail" in error_data
 
+    def test_vis_subsetting(self):
+        """Test baseline selection and representation parameters of /imaging/vis."""
+        url = f"{self.base_url}/imaging/vis"
+        response = requests.get(url, params={"antennas": "0,1,2"})
+        assert response.status_code == 200
+        data = response.json()
+        if "timestamp" in data:
+            assert all(v["i"] in (0, 1, 2) and v["j"] in (0, 1, 2) for v in data["data"])
+
+            response = requests.get(url, params={"baselines": "0-1,3-2"})
+            assert {(v["i"], v["j"]) for v in response.json()["data"]} <= {(0, 1), (2, 3)}
+
+            response = requests.get(
+                url, params={"representation": "ampphase", "precision": "float32"}
+            )
+            for v in response.json()["data"]:
+                assert set(v) == {"i", "j", "amp", "phase"}
+                assert v["amp"] >= 0 and -3.1416 <= v["phase"] <= 3.1416
+
+            all_baselines = len(requests.get(url).json()["data"])
+            short = len(requests.get(url, params={"max_length": 1.0}).json()["data"])
+            long = len(requests.get(url, params={"min_length": 1.0}).json()["data"])
+            assert short + long >= all_baselines
+
+            # Moving the antennas changes the baselines a length query keeps
+            etag = requests.get(url, params={"max_length": 1.0}).headers["etag"]
+            positions_url = f"{self.base_url}/calibration/antenna_positions"
+            positions = requests.get(f"{self.base_url}/imaging/antenna_positions").json()
+            self.authenticate()
+            scaled = [[2 * x for x in p] for p in positions]
+            try:
+                response = requests.post(positions_url, json=scaled, headers=self.headers)
+                assert response.status_code == 200
+                response = requests.get(
+                    url, params={"max_length": 1.0}, headers={"If-None-Match": etag}
+                )
+                assert response.status_code == 200
+                assert response.headers["etag"] != etag
+                assert len(response.json()["data"]) <= short
+            finally:
+                requests.post(positions_url, json=positions, headers=self.headers)
+
+        # Invalid subsets and representations
+        for params in (
+            {"antennas": "0,99"},
+            {"baselines": "0-0"},
+            {"baselines": "a-b"},
+            {"min_length": -1},
+            {"representation": "polar"},
+        ):
+            assert requests.get(url, params=params).status_code == 422
+        response = requests.get(
+            url,
+            params={"representation": "ampphase"},
+            headers={"Accept": "application/vnd.tart.vis"},
+        )
+        assert response.status_code == 422
+
+    def test_vis_long_poll(self):
+        """Test waiting for the next frame with /imaging/vis?after=."""
+        url = f"{self.base_url}/imaging/vis"
+        response = requests.get(url, params={"after": "2000-01-01T00:00:00Z", "timeout": 5})
+        if response.status_code == 200 and "timestamp" in response.json():
+            latest = response.json()["timestamp"]
+            response = requests.get(url, params={"after": latest, "timeout": 5})
+            assert response.status_code in (200, 204)
+            if response.status_code == 200:
+                assert response.json()["timestamp"] > latest
+
+        # Nothing newer than a frame in the future, so the wait times out
+        response = requests.get(url, params={"after": "2099-01-01T00:00:00Z", "timeout": 0.2})
+        assert response.status_code == 204
+        assert not response.content
+
+        for params in ({"after": "now"}, {"after": "2000-01-01T00:00:00Z", "timeout": 0}):
+            assert requests.get(url, params=params).status_code == 422
+
+    def test_calibrated_vis(self):
+        """Test the visibilities with the current gains applied."""
+        url = f"{self.base_url}/imaging/vis"
+        raw = requests.get(url)
+        calibrated = requests.get(url, params={"calibrated": "true"})
+        assert raw.status_code == calibrated.status_code == 200
+        raw_data, data = raw.json()["data"], calibrated.json()["data"]
+        if data:
+            assert [(v["i"], v["j"]) for v in data] == [(v["i"], v["j"]) for v in raw_data]
+            etag = calibrated.headers["etag"]
+            if raw.json()["timestamp"] == calibrated.json()["timestamp"]:
+                assert etag != raw.headers["etag"]
+            response = requests.get(
+                url, params={"calibrated": "true"}, headers={"If-None-Match": etag}
+            )
+            assert response.status_code in (200, 304)
+
+    def test_integrated_vis(self):
+        """Test the time averaged visibilities at /imaging/vis?integration=."""
+        url = f"{self.base_url}/imaging/vis"
+        response = requests.get(url, params={"integration": 10})
+        assert response.status_code == 200
+        body = response.json()
+        # Empty until the first 10 s interval of the stream has finished
+        if body["data"]:
+            assert body["integration"] == 10
+            assert body["samples"] >= 1
+            assert body["timestamp"].endswith("0Z")
+            response = requests.get(
+                url, params={"integration": 10, "after": body["timestamp"], "timeout": 0.2}
+            )
+            assert response.status_code in (200, 204)
+
+        for bad in (7, 0):
+            assert requests.get(url, params={"integration": bad}).status_code == 422
+
+    def test_uvw_endpoint(self):
+        """Test the baseline coordinates from the cached array geometry."""
+        url = f"{self.base_url}/imaging/uvw"
+        positions = requests.get(f"{self.base_url}/imaging/antenna_positions").json()
+        num_baselines = len(positions) * (len(positions) - 1) // 2
+
+        response = requests.get(url, params={"units": "metres"})
+        assert response.status_code == 200
+        zenith = response.json()
+        assert len(zenith["baselines"]) == num_baselines
+        assert len(zenith["timestamps"]) == 1
+        # At the zenith (u, v, w) is the east, north, up baseline
+        i, j = zenith["baselines"][0]
+        expected = [a - b for a, b in zip(positions[i], positions[j], strict=True)]
+        assert zenith["uvw"][0][0] == pytest.approx(expected, abs=1e-9)
+
+        params = {"ra": 83.6, "dec": 22.0, "start": "2025-01-01T00:00:00Z", "seconds": 3600}
+        response = requests.get(url, params={**params, "step": 600})
+        assert response.status_code == 200
+        tracked = response.json()
+        assert tracked["units"] == "wavelengths"
+        assert len(tracked["timestamps"]) == len(tracked["uvw"]) == 7
+        assert tracked["timestamps"][1] == "2025-01-01T00:10:00Z"
+
+        for bad in ({"ra": 10.0}, {**params, "step": 1}, {"ra": 360.0, "dec": 0.0}):
+            assert requests.get(url, params=bad).status_code == 422
+
+        # Setting the positions moves the geometry on to a new version
+        self.authenticate()
+        response = requests.post(
+            f"{self.base_url}/calibration/antenna_positions", json=positions, headers=self.headers
+        )
+        assert response.status_code == 200
+        assert requests.get(url).json()["version"] > zenith["version"]
+
+    def test_realtime_image_endpoint(self):
+        """Test the quick-look image of the rt_syn_img mode."""
+        url = f"{self.base_url}/imaging/image"
+        # The ETag changes with every image, which is kept when leaving the mode
+        previous = requests.get(url, params={"format": "raw"}).headers.get("etag")
+        previous_mode = self.set_mode("rt_syn_img")
+        try:
+            # The first image is made within a few frames
+            raw = self.wait_for(
+                url,
+                30,
+                lambda r: r.status_code == 200 and r.headers["etag"] != previous,
+                params={"format": "raw"},
+            )
+            png = requests.get(url, params={"format": "png"})
+        finally:
+            self.set_mode(previous_mode)
+        for fmt, response, media_type in (
+            ("raw", raw, "application/octet-stream"),
+            ("png", png, "image/png"),
+        ):
+            assert response.status_code == 200
+            assert response.headers["content-type"] == media_type
+            etag = response.headers["etag"]
+            response = requests.get(url, params={"format": fmt}, headers={"If-None-Match": etag})
+            # 200 if a new image was made in between
+            assert response.status_code in (200, 304)
+
+        # .npy: magic, version, header length and a header dict, then float32 pixels
+        assert raw.content.startswith(b"\x93NUMPY")
+        (header_len,) = struct.unpack_from("<H", raw.content, 8)
+        header = ast.literal_eval(raw.content[10 : 10 + header_len].decode("latin1"))
+        assert header["descr"] == "<f4" and not header["fortran_order"]
+        height, width = header["shape"]
+        assert height == width
+        pixels = raw.content[10 + header_len :]
+        assert len(pixels) == 4 * height * width
+        # The corners are below the horizon (NaN), the zenith at the centre is not
+        corner, zenith = (
+            struct.unpack_from("<f", pixels, 4 * k)[0]
+            for k in (0, (height // 2) * width + width // 2)
+        )
+        assert corner != corner and zenith == zenith
+
+        # 8 bit greyscale PNG of the same size
+        assert png.content.startswith(b"\x89PNG\r\n\x1a\n")
+        assert png.content[12:16] == b"IHDR"
+        assert struct.unpack_from(">IIBB", png.content, 16) == (width, height, 8, 0)
+
+        assert requests.get(url, params={"format": "jpeg"}).status_code == 422
+
+    def test_sky_map_endpoint(self):
+        """Test the direct Fourier all-sky map of the latest visibilities."""
+        url = f"{self.base_url}/imaging/sky_map"
+        response = requests.get(url, params={"nside": 4})
+        assert response.status_code in (200, 404)
+        if response.status_code == 200:
+            data = response.json()
+            assert data["nside"] == 4
+            # HEALPix pixels above the horizon: 6 nside^2 - 2 nside
+            assert len(data["map"]) == 88
+
+            response = requests.get(url, params={"nside": 4, "format": "raw"})
+            assert response.status_code == 200
+            assert response.content.startswith(b"\x93NUMPY")
+
+        for params in ({"nside": 3}, {"nside": 0}, {"nside": 256}, {"format": "fits"}):
+            assert requests.get(url, params=params).status_code == 422
+
+    def test_calibration_status_endpoint(self):
+        """Test the report of the last gain solution of the cal mode."""
+        url = f"{self.base_url}/calibration/status"
+        previous = requests.get(url).text
+        gains = requests.get(f"{self.base_url}/calibration/gain").json()
+        previous_mode = self.set_mode("cal")
+        try:
+            # A solution is made once cal.frames (30) frames have been collected
+            response = self.wait_for(url, 90, lambda r: r.status_code == 200 and r.text != previous)
+        finally:
+            self.set_mode(previous_mode)
+            # The solution is stored like a posted calibration, put the old gains back
+            requests.post(f"{self.base_url}/calibration/gain", json=gains, headers=self.headers)
+
+        data = response.json()
+        assert data["sky_model"] in ("sources", "brightest")
+        assert data["frames"] >= 1 and data["iterations"] >= 1
+        assert data["solve_ms"] >= 0
+        assert data["residual"] >= 0
+
+    def test_stream_events_endpoint(self):
+        """Test the Server-Sent Events stream of visibilities."""
+        response = requests.get(
+            f"{self.base_url}/stream/events",
+            params={"antennas": "0,1,2", "status": "false"},
+            stream=True,
+            timeout=5,
+        )
+        try:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            # Frames only arrive while the telescope is acquiring visibilities
+            try:
+                lines = response.iter_lines(decode_unicode=True)
+                event = next(line for line in lines if line.startswith("event:"))
+                data = json.loads(next(lines)[len("data: ") :])
+                assert event == "event: vis"
+                assert data["type"] == "vis"
+                assert all(v["i"] in (0, 1, 2) and v["j"] in (0, 1, 2) for v in data["data"])
+            except requests.exceptions.ConnectionError:
+                pass
+        finally:
+            response.close()
+
+        response = requests.get(f"{self.base_url}/stream/events", params={"antennas": "0,99"})
+        assert response.status_code == 422
+
+    def test_vis_history_endpoint(self):
+        """Test the archived visibility range query."""
+        end = datetime.now(UTC)
+        start = end - timedelta(hours=1)
+        params = {"start": start.isoformat(), "end": end.isoformat(), "antennas": "0,1,2"}
+
+        response = requests.get(f"{self.base_url}/imaging/vis/history", params=params)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/vnd.tart.vis")
+
+        # Header: magic, number of baselines, reserved, then (i, j) pairs
+        magic, num_baselines, _ = struct.unpack_from("<4sHH", response.content)
+        assert magic == b"TVF1"
+        assert num_baselines in [0, 3]  # 0 until the first vis file is archived
+        body = response.content[8 + 2 * num_baselines :]
+        if num_baselines:
+            assert len(body) % (8 + 8 * num_baselines) == 0
+
+        # Reversed time range
+        params = {"start": end.isoformat(), "end": start.isoformat()}
+        response = requests.get(f"{self.base_url}/imaging/vis/history", params=params)
+        assert response.status_code == 422
+
+        # Invalid antenna list
+        params = {"start": start.isoformat(), "end": end.isoformat(), "antennas": "0,99"}
+        response = requests.get(f"{self.base_url}/imaging/vis/history", params=params)
+        assert response.status_code == 422
+
+    def test_recent_vis_endpoint(self):
+        """Test the latest frames from the in-memory ring buffer."""
+        url = f"{self.base_url}/imaging/vis/recent"
+        response = requests.get(url, params={"n": 5, "antennas": "0,1,2"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/vnd.tart.vis")
+        magic, num_baselines, _ = struct.unpack_from("<4sHH", response.content)
+        assert magic == b"TVF1"
+        assert num_baselines == 3
+        body = response.content[8 + 2 * num_baselines :]
+        record = 8 + 8 * num_baselines
+        assert len(body) % record == 0 and 1 <= len(body) // record <= 5
+        timestamps = [
+            struct.unpack_from("<q", body, k * record)[0] for k in range(len(body) // record)
+        ]
+        assert timestamps == sorted(timestamps)
+
+        # Nothing newer than the latest frame returned, unless one arrived meanwhile
+        latest = datetime.fromtimestamp(timestamps[-1] / 1e9, UTC)
+        params = {"n": 5, "antennas": "0,1,2", "after": latest.isoformat()}
+        response = requests.get(url, params=params)
+        assert response.status_code == 200
+        assert len(response.content) - (8 + 2 * num_baselines) in (0, record)
+
+        response = requests.get(url, params={"integration": 10})
+        assert response.status_code in (200, 404)
+        for bad in ({"n": 0}, {"integration": 7}, {"antennas": "0,99"}):
+            assert requests.get(url, params=bad).status_code == 422
+
+    def test_flagged_vis(self):
+        """Test that flagged baselines are NaN in the ring and left out of /imaging/vis."""
+        for _ in range(5):
+            recent = requests.get(f"{self.base_url}/imaging/vis/recent", params={"n": 1})
+            latest = requests.get(f"{self.base_url}/imaging/vis").json()
+            assert recent.status_code == 200
+            _, num_baselines, _ = struct.unpack_from("<4sHH", recent.content)
+            pairs = struct.unpack_from(f"<{2 * num_baselines}B", recent.content, 8)
+            timestamp_ns, *values = struct.unpack_from(
+                f"<q{2 * num_baselines}f", recent.content, 8 + 2 * num_baselines
+            )
+            timestamp = datetime.fromtimestamp(timestamp_ns / 1e9, UTC)
+            if latest["timestamp"] != timestamp.isoformat().replace("+00:00", "Z"):
+                # A new frame arrived in between
+                continue
+            unflagged = {
+                (pairs[2 * k], pairs[2 * k + 1])
+                for k in range(num_baselines)
+                if values[2 * k] == values[2 * k]
+            }
+            assert {(d["i"], d["j"]) for d in latest["data"]} == unflagged
+            break
+        else:
+            pytest.fail("The latest frame changed during every attempt")
+
+    def test_quality_endpoint(self):
+        """Test the per-frame data quality reports at /status/quality."""
+        url = f"{self.base_url}/status/quality"
+        response = requests.get(url, params={"n": 5})
+        assert response.status_code == 200
+        body = response.json()
+        assert len(body["reports"]) <= 5
+        for report in body["reports"]:
+            assert len(report["zscore"]) == len(body["baselines"])
+            assert len(report["amplitude"]) == len(report["antenna_closure_phase_rms"])
+            assert report["closure_phase_rms"] >= 0
+            for flag in report["flags"]:
+                assert flag["metric"] in (
+                    "amplitude_ratio",
+                    "radio_mean",
+                    "closure_phase_excess",
+                    "zscore",
+                )
+        assert requests.get(url, params={"n": 0}).status_code == 422
+
+    def test_spectrum_waterfall(self):
+        """Test the spectra of the spectrum and vis modes at /status/spectrum/waterfall."""
+        url = f"{self.base_url}/status/spectrum/waterfall"
+        params = {"n": 5, "antennas": "0,1"}
+        # The waterfall keeps its spectra when leaving the mode
+        response = requests.get(url, params=params)
+        previous = response.json()["timestamps"][-1] if response.status_code == 200 else None
+        previous_mode = self.set_mode("spectrum")
+        try:
+            # The first snapshot is taken on entering the mode
+            response = self.wait_for(
+                url,
+                30,
+                lambda r: r.status_code == 200 and r.json()["timestamps"][-1] != previous,
+                params=params,
+            )
+            # The vis modes take spectrum snapshots without stopping the stream
+            self.set_mode("vis")
+            previous = response.json()["timestamps"][-1]
+            response = self.wait_for(
+                url, 30, lambda r: r.json()["timestamps"][-1] != previous, params=params
+            )
+        finally:
+            self.set_mode(previous_mode)
+
+        data = response.json()
+        assert data["antennas"] == [0, 1]
+        assert 0 < len(data["timestamps"]) <= 5
+        assert len(data["power"]) == len(data["timestamps"])
+        # 128 bins in MHz, up to half the 16 MHz sampling rate
+        assert len(data["freq"]) == 128
+        assert data["freq"] == sorted(data["freq"])
+        assert 0 <= data["freq"][0] and data["freq"][-1] <= 8
+        for spectra in data["power"]:
+            assert len(spectra) == 2
+            assert all(len(power) == len(data["freq"]) for power in spectra)
+        response = requests.get(url, params={"format": "raw"})
+        assert response.status_code == 200
+        assert response.content.startswith(b"PK")  # .npz
+
+        assert requests.get(url, params={"n": 0}).status_code == 422
+        assert requests.get(url, params={"antennas": "0,x"}).status_code == 422
+
+    def test_raw_snapshots(self):
+        """Test raw snapshots taken without leaving the vis modes."""
+        url = f"{self.base_url}/acquire/raw/snapshot_schedule"
+        original = requests.get(url).json()["snapshot_schedule"]
+        self.authenticate()
+        response = requests.put(f"{url}/1", headers=self.headers)
+        assert response.status_code == 200
+        assert response.json()["snapshot_schedule"] == 1
+        response = requests.put(f"{url}/{original}", headers=self.headers)
+        assert response.json()["snapshot_schedule"] == original
+
+        url = f"{self.base_url}/acquire/raw/snapshots"
+        response = requests.post(f"{self.base_url}/acquire/raw/snapshot", headers=self.headers)
+        # 409 unless the telescope is streaming visibilities
+        assert response.status_code in (202, 409)
+        if response.status_code == 202:
+            requested_at = datetime.fromisoformat(response.json()["requested_at"])
+            for _ in range(20):
+                snapshots = requests.get(url, params={"n": 1}).json()["snapshots"]
+                if snapshots and datetime.fromisoformat(snapshots[-1]["timestamp"]) > requested_at:
+                    break
+                time.sleep(0.5)
+            else:
+                pytest.fail("No raw snapshot was taken")
+            snapshot = snapshots[-1]
+            gap_start, timestamp, gap_end = (
+                datetime.fromisoformat(snapshot[key])
+                for key in ("gap_start", "timestamp", "gap_end")
+            )
+            assert gap_start <= timestamp <= gap_end
+            assert snapshot["downtime"] >= 0
+            assert snapshot["num_samples"] > 0
+
+        response = requests.get(url)
+        assert response.status_code == 200
+        assert isinstance(response.json()["snapshots"], list)
+        assert requests.get(url, params={"n": 0}).status_code == 422
+
     def test_channel_endpoints(self):
         """Test channel management endpoints."""
         # Test get all channels
@@ -551,6 +1094,45 @@ class TARTAPITestClient:
             response = requests.put(f"{self.base_url}/channel/0/1", headers=self.headers)
             assert response.status_code == 200
 
+    def test_channel_bulk_update(self):
+        """Test enabling/disabling several channels in one request."""
+        response = requests.get(f"{self.base_url}/channel")
+        assert response.status_code == 200
+        num_ant = len(response.json())
+
+        self.authenticate()
+        changes = [{"channel_id": i, "enabled": 0} for i in (4, 5, 6)]
+        response = requests.put(
+            f"{self.base_url}/channel", json={"changes": changes}, headers=self.headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        version = data["version"]
+        enabled = {ch["channel_id"]: ch["enabled"] for ch in data["channels"]}
+        assert [enabled[i] for i in (4, 5, 6)] == [0, 0, 0]
+
+        # The cached mask seen by other endpoints changes with it
+        response = requests.get(f"{self.base_url}/channel")
+        disabled = {ch["channel_id"] for ch in response.json() if ch["enabled"] == 0}
+        assert {4, 5, 6} <= disabled
+
+        # A full mask re-enables them all and bumps the version again
+        response = requests.put(
+            f"{self.base_url}/channel", json={"mask": [1] * num_ant}, headers=self.headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["version"] > version
+        assert all(ch["enabled"] == 1 for ch in data["channels"])
+
+        # Malformed requests
+        for body in ({"mask": [1] * (num_ant - 1)}, {"changes": []}, {}):
+            response = requests.put(f"{self.base_url}/channel", json=body, headers=self.headers)
+            assert response.status_code == 422
+
+        response = requests.put(f"{self.base_url}/channel", json={"mask": [1] * num_ant})
+        assert response.status_code in [401, 403]
+
     def test_data_endpoints(self):
         """Test data retrieval endpoints."""
         # Test raw data files
@@ -569,12 +1151,18 @@ class TARTAPITestClient:
         # Data might be empty in development, but should be a list
         assert isinstance(data, list)
 
+        # Every file handle records the algorithm used for its checksum
+        for entry in data:
+            assert entry["checksum_algorithm"] in ["sha256", "blake2b"]
+
     def test_unauthorized_access(self):
         """Test that protected endpoints require authentication."""
         protected_endpoints = [
             ("POST", "/mode/off"),
             ("POST", "/loop/loop"),
             ("PUT", "/acquire/raw/save/1"),
+            ("POST", "/acquire/raw/snapshot"),
+            ("PUT", "/acquire/raw/snapshot_schedule/1"),
             ("PUT", "/channel/0/1"),
             ("POST", "/calibration/gain"),
         ]
@@ -848,14 +1436,83 @@ def test_calibration_endpoints(api_client):
     api_client.test_calibration_endpoints()
 
 
+def test_gain_history_endpoint(api_client):
+    api_client.test_gain_history_endpoint()
+
+
 def test_imaging_endpoints(api_client):
     api_client.test_imaging_endpoints()
 
 
+def test_vis_subsetting(api_client):
+    api_client.test_vis_subsetting()
+
+
+def test_vis_long_poll(api_client):
+    api_client.test_vis_long_poll()
+
+
+def test_realtime_image_endpoint(api_client):
+    api_client.test_realtime_image_endpoint()
+
+
+def test_sky_map_endpoint(api_client):
+    api_client.test_sky_map_endpoint()
+
+
+@pytest.mark.slow
+def test_calibration_status_endpoint(api_client):
+    api_client.test_calibration_status_endpoint()
+
+
+def test_calibrated_vis(api_client):
+    api_client.test_calibrated_vis()
+
+
+def test_integrated_vis(api_client):
+    api_client.test_integrated_vis()
+
+
+def test_uvw_endpoint(api_client):
+    api_client.test_uvw_endpoint()
+
+
+def test_recent_vis_endpoint(api_client):
+    api_client.test_recent_vis_endpoint()
+
+
+def test_flagged_vis(api_client):
+    api_client.test_flagged_vis()
+
+
+def test_quality_endpoint(api_client):
+    api_client.test_quality_endpoint()
+
+
+def test_spectrum_waterfall(api_client):
+    api_client.test_spectrum_waterfall()
+
+
+def test_raw_snapshots(api_client):
+    api_client.test_raw_snapshots()
+
+
+def test_stream_events_endpoint(api_client):
+    api_client.test_stream_events_endpoint()
+
+
+def test_vis_history_endpoint(api_client):
+    api_client.test_vis_history_endpoint()
+
+
 def test_channel_endpoints(api_client):
     api_client.test_channel_endpoints()
 
 
+def test_channel_bulk_update(api_client):
+    api_client.test_channel_bulk_update()
+
+
 def test_data_endpoints(api_client):
     api_client.test_data_endpoints()
 
@@ -0,0 +1,192 @@
+"""
+Unit tests of the signal processing behind the API, on synthetic data.
+
+These import the API's modules, so they need its dependencies (numpy,
+h5py, tart, tart_hardware_interface) and are skipped without them. Run
+them in the API's test image with `make test-unit`.
+"""
+
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("tart_hardware_interface", reason="needs the API's dependencies")
+
+import app.main  # noqa: E402, F401 (import order of the database package)
+from services.cal_solver import (  # noqa: E402
+    baseline_matrix,
+    gain_phase,
+    point_source_model,
+    solve_gains,
+    source_directions,
+)
+from services.channel_cache import correction_vector  # noqa: E402
+from services.flagger import (  # noqa: E402
+    Flagger,
+    flagged_nan,
+    frame_flags,
+    pack_flags,
+    unpack_flags,
+)
+from services.geometry import baseline_uvw, positions_key  # noqa: E402
+from services.synthesis import SynthesisImager, encode_png, encode_raw  # noqa: E402
+from tart_hardware_interface.highlevel_modes_api import SAMPLING_RATE, spectra_db  # noqa: E402
+
+pytestmark = pytest.mark.unit
+
+NUM_ANT = 24
+
+
+@pytest.fixture
+def layout():
+    """(uvw, baselines) of a random 24 antenna array a few wavelengths across."""
+    rng = np.random.default_rng(1)
+    positions = rng.uniform(-2.0, 2.0, size=(NUM_ANT, 3))
+    positions[:, 2] = 0.0
+    uvw = baseline_uvw(positions_key(positions), 1.0)
+    baselines = np.array([(i, j) for i in range(NUM_ANT) for j in range(i + 1, NUM_ANT)])
+    return uvw, baselines
+
+
+def point_source_vis(uvw, baselines, el, az):
+    model = point_source_model(uvw, source_directions([{"el": el, "az": az}]), [1.0])
+    return model[baselines[:, 0], baselines[:, 1]]
+
+
+@pytest.mark.parametrize(
+    "el, az, pixel",
+    [
+        (90.0, 0.0, (32, 32)),  # zenith at the centre
+        (60.0, 0.0, (16, 32)),  # north up, m = cos(el)
+        (60.0, 90.0, (32, 16)),  # east on the left, l = cos(el)
+        (60.0, 270.0, (32, 48)),
+    ],
+)
+def test_imager_point_source(layout, el, az, pixel):
+    uvw, baselines = layout
+    imager = SynthesisImager(uvw, baselines, 64)
+    image = imager.image(point_source_vis(uvw, baselines, el, az), np.ones(len(baselines)))
+
+    assert image.shape == (64, 64) and image.dtype == np.float32
+    assert np.unravel_index(np.nanargmax(image), image.shape) == pixel
+    # Normalised to a peak of one at the zenith, the kernel tapers it off slightly
+    assert image[pixel] == pytest.approx(1.0, abs=0.05)
+    assert np.isnan(image[0, 0]) and np.array_equal(np.isfinite(image), imager.horizon)
+
+
+def test_imager_weights(layout):
+    uvw, baselines = layout
+    imager = SynthesisImager(uvw, baselines, 64)
+    vis = point_source_vis(uvw, baselines, 90.0, 0.0)
+    weights = np.ones(len(baselines))
+    # Baselines given no weight do not contribute, whatever their visibilities
+    weights[::2] = 0.0
+    corrupted = np.where(weights > 0, vis, 100.0)
+    image = imager.image(corrupted, weights)
+    assert np.unravel_index(np.nanargmax(image), image.shape) == (32, 32)
+    assert image[32, 32] == pytest.approx(1.0, abs=1e-3)
+
+
+def test_image_encodings():
+    image = np.full((16, 16), np.nan, dtype=np.float32)
+    image[4:12, 4:12] = np.arange(64, dtype=np.float32).reshape(8, 8)
+
+    assert np.array_equal(np.load(io.BytesIO(encode_raw(image))), image, equal_nan=True)
+
+    png = encode_png(image)
+    assert png.startswith(b"\x89PNG\r\n\x1a\n") and png[12:16] == b"IHDR"
+    assert png[16:26] == b"\x00\x00\x00\x10\x00\x00\x00\x10\x08\x00"
+
+
+def test_solve_gains(layout):
+    uvw, baselines = layout
+    rng = np.random.default_rng(2)
+    gains = rng.uniform(0.5, 2.0, NUM_ANT) * np.exp(1j * rng.uniform(-np.pi, np.pi, NUM_ANT))
+    directions = source_directions([{"el": 70.0, "az": 30.0}, {"el": 40.0, "az": 200.0}])
+    model = point_source_model(uvw, directions, [1.0, 0.5])
+    data = gains[:, np.newaxis] * model * np.conj(gains)[np.newaxis, :]
+    # Antenna 5 is disabled, so its baselines carry no weight
+    mask = np.ones(NUM_ANT, dtype=bool)
+    mask[5] = False
+    weights = np.outer(mask, mask).astype(np.float64)
+
+    solution, iterations, converged, residual = solve_gains(data, model, weights, 200, 1e-10)
+
+    assert converged and iterations < 200
+    assert residual < 1e-8
+    # The gains are only defined up to a common phase, antenna 0 is the reference
+    expected = gains * (np.abs(gains[0]) / gains[0])
+    assert np.allclose(solution[mask], expected[mask], rtol=1e-6)
+    assert solution[5] == 1.0
+
+    # Applied as TART gains and phase offsets, the solution undoes the corruption
+    gain, phase = gain_phase(solution, mask, (np.ones(NUM_ANT), np.zeros(NUM_ANT)))
+    vis = data[baselines[:, 0], baselines[:, 1]]
+    corrected = vis * correction_vector(baselines, mask, gain, phase)
+    unaffected = mask[baselines[:, 0]] & mask[baselines[:, 1]]
+    assert np.allclose(corrected[unaffected], model[baselines[:, 0], baselines[:, 1]][unaffected])
+    assert np.all(corrected[~unaffected] == 0)
+    assert np.allclose(baseline_matrix(baselines, vis, NUM_ANT) * weights, data * weights)
+
+
+def test_pack_flags():
+    flags = np.zeros(13, dtype=bool)
+    flags[[0, 7, 8, 12]] = True
+    packed = pack_flags(flags)
+    # Little bit order, so flag k is bit k % 8 of byte k // 8
+    assert packed.tolist() == [0b10000001, 0b00010001]
+    assert np.array_equal(unpack_flags(packed, 13), flags)
+
+    baselines = np.zeros((13, 2), dtype=int)
+    assert np.array_equal(frame_flags({"baselines": baselines, "flags": packed}), flags)
+    assert not frame_flags({"baselines": baselines}).any()
+
+
+def test_flagger_outlier():
+    settings = {"enabled": 1, "window": 16, "min_frames": 8, "threshold": 5.0}
+    flagger = Flagger(settings)
+    baselines = np.array([(i, j) for i in range(4) for j in range(i + 1, 4)])
+    rng = np.random.default_rng(3)
+
+    def frame(amplitude):
+        phase = np.exp(1j * rng.uniform(-np.pi, np.pi, len(baselines)))
+        return {"baselines": baselines, "vis": amplitude * phase}
+
+    for _ in range(settings["min_frames"]):
+        packed = flagger.add(frame(rng.normal(1.0, 0.01, len(baselines))))
+        # Nothing is flagged until the window holds min_frames frames
+        assert not unpack_flags(packed, len(baselines)).any()
+
+    amplitude = rng.normal(1.0, 0.01, len(baselines))
+    amplitude[2] = 3.0
+    outlier = frame(amplitude)
+    outlier["flags"] = flagger.add(outlier)
+    flags = frame_flags(outlier)
+    assert flags.tolist() == [k == 2 for k in range(len(baselines))]
+
+    vis = flagged_nan(outlier["vis"], flags)
+    assert np.isnan(vis[2]) and np.array_equal(vis[~flags], outlier["vis"][~flags])
+
+    settings["enabled"] = 0
+    assert not unpack_flags(flagger.add(outlier), len(baselines)).any()
+
+
+def test_spectra_tone():
+    nfft = 1024
+    t = np.arange(2**14) / SAMPLING_RATE
+    # Tones at the centres of FFT bins 200 and 352 (3.125 and 5.5 MHz), sampled at one bit
+    tones = np.array([200, 352]) * SAMPLING_RATE / nfft
+    ant_data = (np.sin(2 * np.pi * tones[:, np.newaxis] * t) > 0).astype(np.uint8)
+
+    power_db, freq = spectra_db(ant_data, nfft)
+
+    assert power_db.shape == (2, 128) and freq.shape == (128,)
+    # Each of the 128 bins covers 4 of the 513 FFT bins
+    assert np.allclose(np.diff(freq), 4 * SAMPLING_RATE / nfft)
+    for power, tone in zip(power_db, tones, strict=True):
+        peak = np.argmax(power)
+        assert peak == int(tone * nfft / SAMPLING_RATE) // 4
+        assert abs(freq[peak] - tone) < 2 * SAMPLING_RATE / nfft
+        # Well above the floor, the square wave's harmonics included
+        assert power[peak] - np.median(power) > 30